@@ -1,4 +1,4 @@
-from .main import run_cosmosis
+import sys
 from .runtime import MPIPool, LikelihoodPipeline, FunctionModule, \
                      stdout_redirected, Inifile, CosmosisConfigurationError, \
                      MPIPool, Module, FunctionModule, ClassModule
@@ -6,6 +6,25 @@ from .samplers import Sampler
 from . import samplers
 from .version import __version__
 from .datablock import option_section, DataBlock
-from .gaussian_likelihood import GaussianLikelihood, \
-                                 SingleValueGaussianLikelihood, \
-                                 WindowedGaussianLikelihood
+
+# These are imported when first used rather than with the package,
+# since every process of a run (and every postprocess run) imports
+# cosmosis, and most of them never need them.
+_lazy_attributes = {
+    "run_cosmosis": "main",
+    "GaussianLikelihood": "gaussian_likelihood",
+    "SingleValueGaussianLikelihood": "gaussian_likelihood",
+    "WindowedGaussianLikelihood": "gaussian_likelihood",
+}
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        import importlib
+        module = importlib.import_module("." + _lazy_attributes[name], __name__)
+        return getattr(module, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+# Module __getattr__ needs python 3.7, so import them all up front before that
+if sys.version_info < (3, 7):
+    for _name in _lazy_attributes:
+        globals()[_name] = __getattr__(_name)
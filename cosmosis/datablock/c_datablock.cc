@@ -27,6 +27,55 @@ using std::endl;
 
 namespace
 {
+  // Common implementation of the c_datablock_view_TYPE_array functions.
+  template <class T, datablock_type_t TYPE_1D, datablock_type_t TYPE_ND>
+  DATABLOCK_STATUS view_array(c_datablock* s,
+                              const char* section,
+                              const char* name,
+                              T const** val,
+                              int* ndims,
+                              int* extents,
+                              int max_ndims,
+                              c_datablock_view_owner** owner)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (section == nullptr) return DBS_SECTION_NULL;
+    if (name == nullptr) return DBS_NAME_NULL;
+    if (val == nullptr) return DBS_VALUE_NULL;
+    if (ndims == nullptr) return DBS_SIZE_NULL;
+    if (extents == nullptr) return DBS_EXTENTS_NULL;
+    if (owner == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock *>(s);
+    datablock_type_t dtype;
+    DATABLOCK_STATUS status = p->get_type(section, name, dtype);
+    if (status != DBS_SUCCESS) return status;
+    try {
+      auto entry = p->entry(section, name);
+      if (dtype == TYPE_1D) {
+        vector<T> const& r = entry->view<vector<T>>();
+        *ndims = 1;
+        if (max_ndims < 1) return DBS_SIZE_INSUFFICIENT;
+        extents[0] = clamp(r.size());
+        *val = r.data();
+      }
+      else if (dtype == TYPE_ND) {
+        ndarray<T> const& r = entry->view<ndarray<T>>();
+        *ndims = clamp(r.ndims());
+        if (*ndims > max_ndims) return DBS_SIZE_INSUFFICIENT;
+        for (int i = 0; i != *ndims; ++i) extents[i] = clamp(r.extents()[i]);
+        *val = r.size() ? &*r.begin() : nullptr;
+      }
+      else return DBS_WRONG_VALUE_TYPE;
+      // The caller shares ownership of the entry until it releases it
+      *owner = reinterpret_cast<c_datablock_view_owner*>(new std::shared_ptr<Entry const>(entry));
+    }
+    catch (DataBlock::BadDataBlockAccess const&) { return DBS_SECTION_NOT_FOUND; }
+    catch (Section::BadSectionAccess const&) { return DBS_NAME_NOT_FOUND; }
+    catch (Entry::BadEntry const&) { return DBS_WRONG_VALUE_TYPE; }
+    catch (...) { return DBS_LOGIC_ERROR; }
+    return DBS_SUCCESS;
+  }
+
   // clang seems to have different support for C-language _Complex
   // than does gcc, so we have the following conversion functions
   // that work under both compilers. They rely on the fact that both
@@ -73,6 +122,15 @@ extern "C"
     return new cosmosis::DataBlock(*p);
   }
 
+  DATABLOCK_STATUS
+  c_datablock_reset(c_datablock* s)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    p->reset();
+    return DBS_SUCCESS;
+  }
+
 
   bool c_datablock_has_section(c_datablock const* s, const char* name)
   {
@@ -99,6 +157,85 @@ extern "C"
   }
 
 
+  int c_datablock_hash_values(c_datablock const* s, int n,
+                              const char** sections, const char** names,
+                              uint64_t seed, uint64_t* hash)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (hash == nullptr) return DBS_VALUE_NULL;
+    if (n < 0) return DBS_SIZE_NONPOSITIVE;
+    if (n > 0 && sections == nullptr) return DBS_SECTION_NULL;
+    if (n > 0 && names == nullptr) return DBS_NAME_NULL;
+    std::vector<std::string> secs, nms;
+    secs.reserve(n); nms.reserve(n);
+    for (int i = 0; i < n; ++i) {
+      if (sections[i] == nullptr) return DBS_SECTION_NULL;
+      if (names[i] == nullptr) return DBS_NAME_NULL;
+      secs.emplace_back(sections[i]);
+      nms.emplace_back(names[i]);
+    }
+    auto p = static_cast<DataBlock const*>(s);
+    std::uint64_t h;
+    DATABLOCK_STATUS status = p->hash_values(secs, nms, seed, h);
+    if (status == DBS_SUCCESS) *hash = h;
+    return status;
+  }
+
+  int c_datablock_get_log_bytes(c_datablock const* s, int start,
+                                uint64_t* read, uint64_t* written)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (read == nullptr || written == nullptr) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock const*>(s);
+    std::size_t r, w;
+    p->get_log_bytes(start, r, w);
+    *read = r;
+    *written = w;
+    return DBS_SUCCESS;
+  }
+
+  int c_datablock_get_double_many(c_datablock* s, int n,
+                                  const char** sections, const char** names,
+                                  double* vals, int* failed)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (failed == nullptr) return DBS_VALUE_NULL;
+    if (n < 0) return DBS_SIZE_NONPOSITIVE;
+    if (n > 0 && (sections == nullptr || names == nullptr || vals == nullptr)) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    for (int i = 0; i < n; ++i) {
+      *failed = i;
+      if (sections[i] == nullptr) return DBS_SECTION_NULL;
+      if (names[i] == nullptr) return DBS_NAME_NULL;
+      DATABLOCK_STATUS status = p->get_val(sections[i], names[i], vals[i]);
+      if (status != DBS_SUCCESS) return status;
+    }
+    *failed = -1;
+    return DBS_SUCCESS;
+  }
+
+  int c_datablock_put_double_many(c_datablock* s, int n,
+                                  const char** sections, const char** names,
+                                  double const* vals, int* failed)
+  {
+    if (s == nullptr) return DBS_DATABLOCK_NULL;
+    if (failed == nullptr) return DBS_VALUE_NULL;
+    if (n < 0) return DBS_SIZE_NONPOSITIVE;
+    if (n > 0 && (sections == nullptr || names == nullptr || vals == nullptr)) return DBS_VALUE_NULL;
+    auto p = static_cast<DataBlock*>(s);
+    for (int i = 0; i < n; ++i) {
+      *failed = i;
+      if (sections[i] == nullptr) return DBS_SECTION_NULL;
+      if (names[i] == nullptr) return DBS_NAME_NULL;
+      DATABLOCK_STATUS status = p->has_val(sections[i], names[i])
+        ? p->replace_val(sections[i], names[i], vals[i])
+        : p->put_val(sections[i], names[i], vals[i]);
+      if (status != DBS_SUCCESS) return status;
+    }
+    *failed = -1;
+    return DBS_SUCCESS;
+  }
+
   int c_datablock_num_sections(c_datablock const* s)
   {
     if (s == nullptr) return -1;
@@ -238,6 +375,38 @@ extern "C"
     return DBS_SUCCESS;
   }
 
+  DATABLOCK_STATUS
+  c_datablock_view_int_array(c_datablock* s,
+			     const char* section,
+			     const char* name,
+			     int const** val,
+			     int* ndims,
+			     int* extents,
+			     int max_ndims,
+			     c_datablock_view_owner** owner)
+  {
+    return view_array<int, DBT_INT1D, DBT_INTND>(s, section, name, val, ndims, extents, max_ndims, owner);
+  }
+
+  DATABLOCK_STATUS
+  c_datablock_view_double_array(c_datablock* s,
+				const char* section,
+				const char* name,
+				double const** val,
+				int* ndims,
+				int* extents,
+				int max_ndims,
+				c_datablock_view_owner** owner)
+  {
+    return view_array<double, DBT_DOUBLE1D, DBT_DOUBLEND>(s, section, name, val, ndims, extents, max_ndims, owner);
+  }
+
+  void
+  c_datablock_release_view(c_datablock_view_owner* owner)
+  {
+    delete reinterpret_cast<std::shared_ptr<Entry const>*>(owner);
+  }
+
   DATABLOCK_STATUS c_datablock_get_type(c_datablock const * s,
                                         const char* section,
                                         const char* name,
@@ -1458,6 +1627,21 @@ c_datablock_log_access(c_datablock* s,
   return DBS_SUCCESS;
 }
 
+DATABLOCK_STATUS
+c_datablock_set_log_level(c_datablock* s, int level)
+{
+  if (s == nullptr) return DBS_DATABLOCK_NULL;
+  auto p = static_cast<DataBlock*>(s);
+  return p->set_log_level(level);
+}
+
+int c_datablock_get_log_level(c_datablock const* s)
+{
+  if (s == nullptr) return -1;
+  auto p = static_cast<DataBlock const*>(s);
+  return p->get_log_level();
+}
+
 int c_datablock_get_log_count(c_datablock *s)
 {
     if (s == nullptr) return -1;
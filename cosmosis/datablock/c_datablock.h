@@ -4,13 +4,16 @@
 #include "datablock_status.h"
 #include "datablock_types.h"
 #include "section_names.h"
+#include "datablock_logging.h"
 
 #ifdef __cplusplus
 #include <complex> 
 #include <cstdbool>
+#include <cstdint>
 #else
 #include <complex.h> 
 #include <stdbool.h>
+#include <stdint.h>
 #endif
 
 #define OPTION_SECTION "module_options"
@@ -53,9 +56,22 @@ extern "C" {
   destroy_c_datablock(c_datablock* s);
 
 
+  /*
+    Return a pointer to a newly-allocated copy of the given datablock,
+    which must be released with destroy_c_datablock. The copy shares
+    the stored values with the original until either of them changes
+    them, so this is cheap even for large datablocks.
+  */
   c_datablock * 
   clone_c_datablock(c_datablock* s);
 
+  /*
+    Remove all the values from the datablock and empty its access log,
+    so that it can be used again instead of making a new one.
+  */
+  DATABLOCK_STATUS
+  c_datablock_reset(c_datablock* s);
+
   /*
     Return true (1) if the datablock has a section with the given name, and
     false (0) otherwise. If either 's' or 'name' is null, return false.
@@ -83,6 +99,48 @@ extern "C" {
   */
   int c_datablock_copy_section(c_datablock * s, const char * source, const char * dest);
 
+  /*
+    Compute a 64-bit hash of the contents of the n values named by the
+    parallel arrays sections and names, starting from seed, and store it
+    in *hash. Values of any supported type may be hashed. The access log
+    is not updated. Returns an error status, leaving *hash unchanged, if
+    any of the values is missing.
+  */
+  int c_datablock_hash_values(c_datablock const* s, int n,
+                              const char** sections, const char** names,
+                              uint64_t seed, uint64_t* hash);
+
+  /*
+    Add up the sizes in bytes of the values read and written (including
+    replaced) in the access log entries from number start onwards, and
+    store them in *read and *written. The current sizes of the values
+    are used; any since deleted are not counted.
+  */
+  int c_datablock_get_log_bytes(c_datablock const* s, int start,
+                                uint64_t* read, uint64_t* written);
+
+  /*
+    Get n double values, named by the parallel arrays sections and
+    names, into vals, in a single call. On failure the error status
+    of the first value that could not be read is returned and its
+    index is stored in *failed; the values before it have been read.
+  */
+  int c_datablock_get_double_many(c_datablock* s, int n,
+                                  const char** sections, const char** names,
+                                  double* vals, int* failed);
+
+  /*
+    Store n double values, named by the parallel arrays sections and
+    names, in a single call. Each value is put if it is not already
+    in the c_datablock, and replaced if it is. On failure the error
+    status of the first value that could not be stored is returned and
+    its index is stored in *failed; the values before it have been
+    stored.
+  */
+  int c_datablock_put_double_many(c_datablock* s, int n,
+                                  const char** sections, const char** names,
+                                  double const* vals, int* failed);
+
 
 
 
@@ -186,6 +244,21 @@ extern "C" {
 			 const char* section,
 			 const char* name);
 
+  /*
+    Set how much of the access to the datablock is recorded in its log
+    from now on, to one of the datablock_log_level_t values. New
+    datablocks log everything (BLOCK_LOG_LEVEL_FULL). Returns
+    DBS_LOGIC_ERROR for an unknown level.
+  */
+  DATABLOCK_STATUS
+  c_datablock_set_log_level(c_datablock* s, int level);
+
+  /*
+    Return the current log level of the datablock, or -1 if 's' is NULL.
+  */
+  int
+  c_datablock_get_log_level(c_datablock const* s);
+
   /*
     Write an enumerator value into 't', corresponding to the type of
     the value stored in the given section, for the given name. Return
@@ -564,6 +637,47 @@ extern "C" {
 				int ndims,
 				int const* extents);
 
+  /*
+    The c_datablock_view_TYPE_array functions give read-only access to
+    an int or double array stored in the c_datablock without copying
+    it. They work for both 1-dimensional and n-dimensional arrays. On
+    success, *val is set to point to the first element of the (C-ordered)
+    array data, *ndims to its number of dimensions, and the first *ndims
+    elements of 'extents' to its shape. If the array has more than
+    'max_ndims' dimensions then DBS_SIZE_INSUFFICIENT is returned, with
+    *ndims set, so that the call can be repeated with enough space.
+
+    *owner is set to a handle which keeps the array alive, even if the
+    value is later replaced, its section deleted, or the c_datablock
+    destroyed. The pointer remains valid until the handle is passed to
+    c_datablock_release_view, which must be done exactly once. The data
+    must not be modified through it.
+  */
+  typedef struct c_datablock_view_owner c_datablock_view_owner;
+
+  DATABLOCK_STATUS
+  c_datablock_view_int_array(c_datablock* s,
+			     const char* section,
+			     const char* name,
+			     int const** val,
+			     int* ndims,
+			     int* extents,
+			     int max_ndims,
+			     c_datablock_view_owner** owner);
+
+  DATABLOCK_STATUS
+  c_datablock_view_double_array(c_datablock* s,
+				const char* section,
+				const char* name,
+				double const** val,
+				int* ndims,
+				int* extents,
+				int max_ndims,
+				c_datablock_view_owner** owner);
+
+  void
+  c_datablock_release_view(c_datablock_view_owner* owner);
+
 
   /*
     The c_datablock_put_TYPE_array functions return DBS_SUCCESS if the given
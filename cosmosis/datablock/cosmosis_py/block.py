@@ -11,6 +11,7 @@ from .errors import BlockError
 import numpy as np
 import os
 import collections
+import functools
 import tarfile
 import io
 from io import StringIO, BytesIO
@@ -21,6 +22,20 @@ import sys
 option_section = "module_options"
 metadata_prefix = "cosmosis_metadata:"
 
+# A list of (section, name) pairs already converted for the C library
+EncodedKeys = collections.namedtuple("EncodedKeys", ["n", "sections", "names"])
+
+class _ViewOwner(object):
+	# Shares ownership of a value in the C++ block, so that the memory a
+	# view points at is kept until the view itself is deleted.
+	def __init__(self, handle):
+		self.handle = handle
+
+	def __del__(self):
+		# The library may already be gone at interpreter shutdown
+		if lib is not None:
+			lib.c_datablock_release_view(self.handle)
+
 class DataBlock(object):
 	u"""A map of (section,name)->value of parameters.
 
@@ -51,6 +66,11 @@ class DataBlock(object):
 	GET=0
 	PUT=1
 	REPLACE=2
+
+	# Log levels, from datablock_logging.h
+	LOG_OFF=0
+	LOG_FIRST_USE=1
+	LOG_FULL=2
 	def __init__(self, ptr=None, own=None):
 		u"""Construct an empty parameter map, or possibly shadow an existing one.
 
@@ -95,17 +115,29 @@ class DataBlock(object):
 
 				
 	def clone(self):
-		u"""Make a brand-new, completely independent object, a deep copy of the existing one.
+		u"""Make a brand-new, completely independent object, a copy of the existing one.
 
 		A new object will be returned from this method which has its own
-		underlying implementation, a deep copy of the parameter map we
-		are holding.  This WILL entail the attempted requisition of
-		enough new memory to hold the complete parameter structure.
+		underlying implementation, a copy of the parameter map we are
+		holding.  The copy is made lazily: the two blocks share the
+		stored values, and a section or value is only copied when one
+		of them changes it, so cloning is cheap even for blocks holding
+		large arrays.
 
 		"""
 		ptr = lib.clone_c_datablock(self._ptr)
 		return DataBlock(ptr,own=True)
 
+	def reset(self):
+		u"""Remove all the values and the access log, so that the block can be used again.
+
+		The log level is kept.  This is cheaper than making a new block.
+
+		"""
+		status = lib.c_datablock_reset(self._ptr)
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+
 
 	@staticmethod
 	def python_to_c_complex(value):
@@ -137,9 +169,11 @@ class DataBlock(object):
 		The object will be a contiguous list—this may entail that a value
 		array with strides be copied to a compressed version—of C type
 		most appropriate to the representation of the Python `numpy_type`.
+		A contiguous NumPy array that is already of that type is used
+		directly, without a copy.
 
 		"""
-		value = np.array(value, dtype=numpy_type)
+		value = np.asarray(value, dtype=numpy_type)
 		#This function is for 1D arrays only
 		assert value.ndim==1
 		#check strides same as itemsize.
@@ -151,8 +185,9 @@ class DataBlock(object):
 			#a new object with sensible strides
 			value = value.copy()
 		assert value.itemsize==value.strides[0]
-		#Now return pointer to start of the data
-		array = np.ctypeslib.as_ctypes(value)
+		#Now return pointer to start of the data.
+		#This also works for read-only arrays, unlike as_ctypes.
+		array = value.ctypes.data_as(ct.POINTER(np.ctypeslib.as_ctypes_type(value.dtype)))
 		array_size = value.size
 		#OK, here's the difficult part.
 		# We have to return the value, as well as the
@@ -383,7 +418,9 @@ class DataBlock(object):
 		ndim = len(shape)
 		extent = (ct.c_int * ndim)()
 		for i in range(ndim): extent[i] = shape[i]
-		value = value.flatten()
+		# This only copies if value is not already contiguous and of
+		# the right type
+		value = np.ascontiguousarray(value, dtype=dtype).reshape(-1)
 		p, arr, arr_size = self.python_to_1d_c_array(value, dtype)
 		put_function={
 			(np.intc, self.PUT):lib.c_datablock_put_int_array,
@@ -448,6 +485,58 @@ class DataBlock(object):
 		"""
 		self._put_replace_array_nd(section, name, value, np.intc, self.REPLACE)
 
+	def _view_array(self, section, name, dtype):
+		ctype, view_function = {
+			int: (ct.c_int, lib.c_datablock_view_int_array),
+			float: (ct.c_double, lib.c_datablock_view_double_array),
+		}[dtype]
+		section_b = section.encode('ascii')
+		name_b = name.encode('ascii')
+		ptr = ct.POINTER(ctype)()
+		ndim = lib.c_int()
+		max_ndim = 8
+		extent = (ct.c_int * max_ndim)()
+		handle = ct.c_void_p()
+		status = view_function(self._ptr, section_b, name_b, ct.byref(ptr), ct.byref(ndim), extent, max_ndim, ct.byref(handle))
+		if status == errors.DBS_SIZE_INSUFFICIENT:
+			max_ndim = ndim.value
+			extent = (ct.c_int * max_ndim)()
+			status = view_function(self._ptr, section_b, name_b, ct.byref(ptr), ct.byref(ndim), extent, max_ndim, ct.byref(handle))
+		if status!=0:
+			raise BlockError.exception_for_status(status, section, name)
+		owner = _ViewOwner(handle)
+		shape = tuple(extent[i] for i in range(ndim.value))
+		size = int(np.prod(shape))
+		if size == 0:
+			r = np.zeros(shape, dtype=ctype)
+		else:
+			# Wrap the memory in a ctypes array which holds the owner,
+			# so the data outlives the view whatever happens to the block.
+			buf = (ctype * size).from_address(ct.addressof(ptr.contents))
+			buf._owner = owner
+			r = np.frombuffer(buf, dtype=ctype).reshape(shape)
+		r.flags.writeable = False
+		return r
+
+	def view_double_array(self, section, name):
+		u"""Get a read-only view of a floating-point array without copying it.
+
+		Works for both 1D and n-dimensional arrays.  The returned NumPy
+		array shares memory with the block while the value is unchanged.
+		If the value is later replaced or deleted, or the block destroyed,
+		the view keeps the old values.
+
+		"""
+		return self._view_array(section, name, float)
+
+	def view_int_array(self, section, name):
+		u"""Get a read-only view of an integer array without copying it.
+
+		See :func:`view_double_array` for details.
+
+		"""
+		return self._view_array(section, name, int)
+
 	def get_double_array_nd(self, section, name):
 		u"""Get a floating-point array of *a priori* unspecified shape.
 
@@ -586,37 +675,44 @@ class DataBlock(object):
 
 
 
+	# Names of the (get, put, replace) methods for each python type
+	# and each datablock type code.  These are looked up on every
+	# generic access so are built once here rather than on each call.
+	_METHODS_FOR_TYPE = {
+		int:    ("get_int",     "put_int",     "replace_int"),
+		float:  ("get_double",  "put_double",  "replace_double"),
+		bool:   ("get_bool",    "put_bool",    "replace_bool"),
+		complex:("get_complex", "put_complex", "replace_complex"),
+		str:    ("get_string",  "put_string",  "replace_string"),
+	}
+
+	_METHODS_FOR_DATATYPE_CODE = {
+		types.DBT_INT:     ("get_int",     "put_int",     "replace_int"),
+		types.DBT_BOOL:    ("get_bool",    "put_bool",    "replace_bool"),
+		types.DBT_DOUBLE:  ("get_double",  "put_double",  "replace_double"),
+		types.DBT_COMPLEX: ("get_complex", "put_complex", "replace_complex"),
+		types.DBT_STRING:  ("get_string",  "put_string",  "replace_string"),
+		types.DBT_INT1D:   ("get_int_array_1d",    "put_int_array_1d",    "replace_int_array_1d"),
+		types.DBT_DOUBLE1D:("get_double_array_1d", "put_double_array_1d", "replace_double_array_1d"),
+		# types.COMPLEX1D:   ("get_complex_array_1d", "put_complex_array_1d", "replace_complex_array_1d"),
+		types.DBT_STRING1D:("get_string_array_1d", "put_string_array_1d", "replace_string_array_1d"),
+		# types.DBT_INT2D:   ("get_int_array_2d",    "put_int_array_2d",    "replace_int_array_2d"),
+		types.DBT_DOUBLEND:("get_double_array_nd", "put_double_array_nd", "replace_double_array_nd"),
+		types.DBT_INTND:   ("get_int_array_nd",    "put_int_array_nd",    "replace_int_array_nd"),
+		# types.COMPLEX2D:   ("get_complex_array_2d", "put_complex_array_2d", "replace_complex_array_2d")
+		# types.STRING2D:    ("get_string_array_2d",  "put_string_array_2d",  "replace_string_array_2d")
+	}
+
 	def _method_for_type(self, T, method_type):
-		method={ int:    (self.get_int,     self.put_int,     self.replace_int),
-				 float:  (self.get_double,  self.put_double,  self.replace_double),
-				 bool:   (self.get_bool,    self.put_bool,    self.replace_bool),
-				 complex:(self.get_complex, self.put_complex, self.replace_complex),
-				 str:    (self.get_string,  self.put_string,  self.replace_string)
-				 }.get(T)
-		if method:
-			return method[method_type]
+		names = self._METHODS_FOR_TYPE.get(T)
+		if names:
+			return getattr(self, names[method_type])
 		return None
 
 	def _method_for_datatype_code(self, code, method_type):
-
-		T={ 
-			types.DBT_INT:     (self.get_int,     self.put_int,     self.replace_int),
-			types.DBT_BOOL:    (self.get_bool,     self.put_bool,     self.replace_bool),
-			types.DBT_DOUBLE:         (self.get_double,  self.put_double,  self.replace_double),
-			types.DBT_COMPLEX: (self.get_complex, self.put_complex, self.replace_complex),
-			types.DBT_STRING:  (self.get_string,  self.put_string,  self.replace_string),
-			types.DBT_INT1D:   (self.get_int_array_1d,     self.put_int_array_1d,     self.replace_int_array_1d),
-			types.DBT_DOUBLE1D:(self.get_double_array_1d,  self.put_double_array_1d,  self.replace_double_array_1d),
-			# types.COMPLEX1D:   (self.get_complex_array_1d, self.put_complex_array_1d, self.replace_complex_array_1d),
-			types.DBT_STRING1D:    (self.get_string_array_1d,  self.put_string_array_1d,  self.replace_string_array_1d),
-			# types.DBT_INT2D:   (self.get_int_array_2d,     self.put_int_array_2d,     self.replace_int_array_2d)
-			types.DBT_DOUBLEND:(self.get_double_array_nd,  self.put_double_array_nd, None),
-			types.DBT_INTND:(self.get_int_array_nd,  self.put_int_array_nd, None),
-			# types.COMPLEX2D:   (self.get_complex_array_2d, self.put_complex_array_2d, self.replace_complex_array_2d)
-			# types.STRING2D:    (self.get_string_array_2d,  self.put_string_array_2d,  self.replace_string_array_2d)
-				 }.get(code)
-		if T is not None:
-			return T[method_type]
+		names = self._METHODS_FOR_DATATYPE_CODE.get(code)
+		if names is not None:
+			return getattr(self, names[method_type])
 		return None
 
 
@@ -658,6 +754,13 @@ class DataBlock(object):
 				return method[method_type]
 		raise ValueError("I do not know how to handle this type %r %r"%(value,type(value)))
 	
+	def _get_type_code(self, section, name):
+		type_code_c = lib.c_datatype()
+		status = lib.c_datablock_get_type(self._ptr, section.encode('ascii'), name.encode('ascii'), ct.byref(type_code_c))
+		if status:
+			raise BlockError.exception_for_status(status, section, name)
+		return type_code_c.value
+
 	def get(self, section, name):
 		u"""Get the value of parameter with `name` in `section`.
 
@@ -668,11 +771,7 @@ class DataBlock(object):
 		or :class:`ValueError` will be raised.
 
 		"""
-		type_code_c = lib.c_datatype()
-		status = lib.c_datablock_get_type(self._ptr, section.encode('ascii'), name.encode('ascii'), ct.byref(type_code_c))
-		if status:
-			raise BlockError.exception_for_status(status, section, name)
-		type_code = type_code_c.value
+		type_code = self._get_type_code(section, name)
 		method = self._method_for_datatype_code(type_code,self.GET)
 		if method:
 			return method(section,name)
@@ -918,6 +1017,102 @@ class DataBlock(object):
 				keys.append((section,name))
 		return keys
 
+	@staticmethod
+	def encode_keys(keys):
+		u"""Pre-encode a list of (section, name) pairs for :func:`hash_values`, :func:`get_many` and :func:`put_many`.
+
+		Useful when the same set of keys is used many times.
+
+		"""
+		n = len(keys)
+		sections = (lib.c_str * n)(*[section.encode('ascii') for (section, _) in keys])
+		names = (lib.c_str * n)(*[name.encode('ascii') for (_, name) in keys])
+		return EncodedKeys(n, sections, names)
+
+	@staticmethod
+	def _encoded_keys(keys):
+		if isinstance(keys, EncodedKeys):
+			return keys
+		try:
+			return _cached_encode_keys(tuple(keys))
+		except TypeError:
+			# unhashable, e.g. a list of lists
+			return DataBlock.encode_keys(keys)
+
+	def hash_values(self, keys, seed=0):
+		u"""Return a 64-bit integer hash of the contents of the given values.
+
+		`keys` is a list of (section, name) pairs, or the result of
+		:func:`encode_keys` on one.  Values of any type, including
+		strings and n-dimensional arrays, are hashed exactly and in the
+		given order, starting from the integer `seed`.  Blocks with the
+		same contents for these values give the same hash.  Accesses are
+		not recorded in the log.
+
+		"""
+		keys = self._encoded_keys(keys)
+		n, sections, names = keys
+		h = ct.c_uint64()
+		status = lib.c_datablock_hash_values(self._ptr, n, sections, names,
+			seed & 0xFFFFFFFFFFFFFFFF, ct.byref(h))
+		if status!=0:
+			section = name = "<hash>"
+			for i in range(n):
+				section = sections[i].decode('ascii')
+				name = names[i].decode('ascii')
+				if not self.has_value(section, name):
+					break
+			raise BlockError.exception_for_status(status, section, name)
+		return h.value
+
+	def get_many(self, keys):
+		u"""Get a list of values, one for each (section, name) pair in `keys`.
+
+		The result is the same as ``[block[key] for key in keys]``, but
+		floating-point scalars are read in a single native call, which is
+		much faster when there are many of them.  `keys` may also be the
+		result of :func:`encode_keys`, to avoid re-encoding them on each
+		call.
+
+		"""
+		keys = self._encoded_keys(keys)
+		n, sections, names = keys
+		values = (ct.c_double * n)()
+		failed = lib.c_int()
+		status = lib.c_datablock_get_double_many(self._ptr, n, sections, names, values, ct.byref(failed))
+		if status == 0:
+			return list(values)
+		# Fall back to the generic methods for any values from the first
+		# one that was not a double.  These raise any real errors.
+		i = failed.value
+		output = list(values[:i])
+		for j in range(i, n):
+			output.append(self.get(sections[j].decode('ascii'), names[j].decode('ascii')))
+		return output
+
+	def put_many(self, keys, values):
+		u"""Set a value for each (section, name) pair in `keys`.
+
+		The result is the same as setting ``block[key] = value`` for each
+		pair, putting new values and replacing existing ones, but if all
+		the values are floating-point scalars they are stored in a single
+		native call.  `keys` may also be the result of :func:`encode_keys`.
+
+		"""
+		keys = self._encoded_keys(keys)
+		n, sections, names = keys
+		if len(values) != n:
+			raise ValueError("put_many needs the same number of keys and values")
+		if not all(isinstance(value, (float, np.floating)) for value in values):
+			for j in range(n):
+				self[sections[j].decode('ascii'), names[j].decode('ascii')] = values[j]
+			return
+		failed = lib.c_int()
+		status = lib.c_datablock_put_double_many(self._ptr, n, sections, names, (ct.c_double * n)(*values), ct.byref(failed))
+		if status!=0:
+			i = failed.value
+			raise BlockError.exception_for_status(status, sections[i].decode('ascii'), names[i].decode('ascii'))
+
 
 	def _delete_section(self, section):
 		"Internal use only!"
@@ -942,6 +1137,62 @@ class DataBlock(object):
 		meta = key[s+1:]
 		return name, meta
 
+	def save_to_npz(self, file):
+		u"""Save every value in the block to a single uncompressed binary NumPy .npz file.
+
+		`file` may be a file name or an open binary file object.  The
+		exact type of each value is recorded so that :func:`update_from_npz`
+		can restore it.  Metadata is saved along with the values.  Reading
+		the values is not recorded in the log.  A :class:`ValueError` is
+		raised if the block holds a type that cannot be read from Python.
+
+		"""
+		keys = self.keys()
+		arrays = {}
+		codes = []
+		log_level = self.get_log_level()
+		self.set_log_level(self.LOG_OFF)
+		try:
+			for i, (section, name) in enumerate(keys):
+				code = self._get_type_code(section, name)
+				method = self._method_for_datatype_code(code, self.GET)
+				if method is None:
+					raise ValueError("Cannot save value %s/%s with type code %d" % (section, name, code))
+				codes.append(code)
+				arrays["v{}".format(i)] = np.asarray(method(section, name))
+		finally:
+			self.set_log_level(log_level)
+		np.savez(file,
+			_sections=np.array([section for (section, _) in keys], dtype=str),
+			_names=np.array([name for (_, name) in keys], dtype=str),
+			_types=np.array(codes, dtype=int),
+			**arrays)
+
+	def update_from_npz(self, file, replace=True):
+		u"""Put every value saved by :func:`save_to_npz` in `file` into this block.
+
+		Values already in the block are replaced if `replace` is True
+		and otherwise left alone.
+
+		"""
+		with np.load(file, allow_pickle=False) as data:
+			sections = data["_sections"]
+			names = data["_names"]
+			codes = data["_types"]
+			for i, (section, name, code) in enumerate(zip(sections, names, codes)):
+				section = str(section)
+				name = str(name)
+				value = data["v{}".format(i)]
+				if value.ndim == 0:
+					value = value.item()
+				if not self.has_value(section, name):
+					mode = self.PUT
+				elif replace:
+					mode = self.REPLACE
+				else:
+					continue
+				self._method_for_datatype_code(int(code), mode)(section, name, value)
+
 	def save_to_file(self, dirname, clobber=False):
 		u"""Effectively :func:`save_to_directory` with the result tarʼd and compressed to a single file.
 
@@ -1108,10 +1359,44 @@ class DataBlock(object):
 		if status!=0:
 			raise BlockError.exception_for_status(status, "", "")
 
+	def set_log_level(self, level):
+		u"""Set how much access to this :class:`DataBlock` is recorded in its log from now on.
+
+		The `level` is one of `LOG_OFF`, which records nothing,
+		`LOG_FIRST_USE`, which keeps only the first entry of each kind for
+		each section and name (and all the "MODULE-START" entries), or
+		`LOG_FULL`, which records everything and is the default.
+
+		"""
+		if level not in (self.LOG_OFF, self.LOG_FIRST_USE, self.LOG_FULL):
+			raise ValueError("Unknown datablock log level {}".format(level))
+		status = lib.c_datablock_set_log_level(self._ptr, level)
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+
+	def get_log_level(self):
+		u"""Return the current log level, one of `LOG_OFF`, `LOG_FIRST_USE`, or `LOG_FULL`."""
+		return lib.c_datablock_get_log_level(self._ptr)
+
 	def get_log_count(self):
 		u"""Return the number of entries in the log."""
 		return lib.c_datablock_get_log_count(self._ptr)
 
+	def get_log_bytes(self, start=0):
+		u"""Return the total bytes read and written, as logged from entry `start` onwards.
+
+		The sizes are those of the values as they are now, so a value
+		that was later replaced with a bigger one is over-counted, and
+		one that was later deleted is not counted at all.
+
+		"""
+		read = ct.c_uint64()
+		written = ct.c_uint64()
+		status = lib.c_datablock_get_log_bytes(self._ptr, start, read, written)
+		if status!=0:
+			raise BlockError.exception_for_status(status, "", "")
+		return read.value, written.value
+
 	def get_log_entry(self, i):
 		u"""Get the iʼth log entry.
 
@@ -1395,6 +1680,13 @@ def datablock_from_string(s):
 	return DataBlock.from_string(s)
 
 
+# Modules tend to use the same few lists of keys over and over, so we
+# keep their encoded forms.
+@functools.lru_cache(maxsize=256)
+def _cached_encode_keys(keys):
+	return DataBlock.encode_keys(keys)
+
+
 
 
 
@@ -54,6 +54,7 @@ def load_array_function_types(namespace, c_type, c_name):
 	load_library_function(namespace, "c_datablock_put_%s_array"%c_name, [c_block, c_str, c_str, ct.POINTER(c_type), c_int, c_int_p], c_status)
 	load_library_function(namespace, "c_datablock_replace_%s_array"%c_name, [c_block, c_str, c_str, ct.POINTER(c_type), c_int, c_int_p], c_status)
 	load_library_function(namespace, "c_datablock_get_%s_array_1d_preallocated"%c_name, [c_block, c_str, c_str, ct.POINTER(c_type), c_int_p, c_int], c_status)
+	load_library_function(namespace, "c_datablock_view_%s_array"%c_name, [c_block, c_str, c_str, ct.POINTER(ct.POINTER(c_type)), c_int_p, c_int_p, c_int, ct.POINTER(ct.c_void_p)], c_status)
 
 load_function_types(locals(), ct.c_int, 'int')
 load_function_types(locals(), ct.c_bool, 'bool')
@@ -86,6 +87,13 @@ load_library_function(
 	c_block
 )
 
+load_library_function(
+	locals(),
+	"c_datablock_reset",
+	[c_block],
+	c_status
+)
+
 
 
 load_library_function(
@@ -166,6 +174,39 @@ load_library_function(
 	ct.c_int
 	)
 
+load_library_function(
+	locals(),
+	"c_datablock_get_double_many",
+	[c_block, c_int, ct.POINTER(c_str), ct.POINTER(c_str), ct.POINTER(ct.c_double), c_int_p],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_put_double_many",
+	[c_block, c_int, ct.POINTER(c_str), ct.POINTER(c_str), ct.POINTER(ct.c_double), c_int_p],
+	c_status
+	)
+
+load_library_function(locals(),
+	"c_datablock_release_view",
+	[ct.c_void_p],
+	None
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_hash_values",
+	[c_block, c_int, ct.POINTER(c_str), ct.POINTER(c_str), ct.c_uint64, ct.POINTER(ct.c_uint64)],
+	c_status
+	)
+
+load_library_function(locals(),
+	"c_datablock_get_log_bytes",
+	[c_block, c_int, ct.POINTER(ct.c_uint64), ct.POINTER(ct.c_uint64)],
+	c_status
+	)
+
 
 load_library_function(
 	locals(),
@@ -190,6 +231,20 @@ load_library_function(
 	ct.c_int
 	)
 
+load_library_function(
+	locals(),
+	"c_datablock_set_log_level",
+	[c_block, ct.c_int],
+	c_status
+	)
+
+load_library_function(
+	locals(),
+	"c_datablock_get_log_level",
+	[c_block],
+	ct.c_int
+	)
+
 load_library_function(
 	locals(),
 	"c_datablock_get_log_count",
@@ -80,10 +80,9 @@ std::string const& cosmosis::DataBlock::value_name(std::string section, int j) c
 void cosmosis::DataBlock::print_log()
 {
   for (auto L=access_log_.begin(); L!=access_log_.end(); ++L){
-    auto l = *L;
-    auto access_type = std::get<0>(l);
-    auto section = std::get<1>(l);
-    auto name = std::get<2>(l);
+    auto const& access_type = log_strings_[L->log_type];
+    auto const& section = log_strings_[L->section];
+    auto const& name = log_strings_[L->name];
     bool new_module = access_type == std::string(BLOCK_LOG_START_MODULE);
     if (new_module) std::cout << std::endl << std::endl;
       std::cout << access_type << "    " << section << "    " << name << std::endl;
@@ -106,6 +105,41 @@ cosmosis::DataBlock::copy_section(std::string source, std::string dest)
 }
 
 
+DATABLOCK_STATUS
+cosmosis::DataBlock::hash_values(std::vector<std::string> const& sections,
+                                 std::vector<std::string> const& names,
+                                 std::uint64_t seed,
+                                 std::uint64_t& hash) const
+{
+  if (sections.size() != names.size()) return DBS_SIZE_INSUFFICIENT;
+  std::uint64_t h = HASH_OFFSET_BASIS;
+  hash_bytes(h, &seed, sizeof(seed));
+  for (std::size_t i = 0; i != sections.size(); ++i)
+    {
+      std::string section = sections[i];
+      std::string name = names[i];
+      downcase(section); downcase(name);
+      auto isec = sections_.find(section);
+      if (isec == sections_.end()) return DBS_SECTION_NOT_FOUND;
+      hash_bytes(h, section.data(), section.size() + 1);
+      hash_bytes(h, name.data(), name.size() + 1);
+      DATABLOCK_STATUS status = isec->second.hash_value(name, h);
+      if (status != DBS_SUCCESS) return status;
+    }
+  hash = h;
+  return DBS_SUCCESS;
+}
+
+std::shared_ptr<cosmosis::Entry const>
+cosmosis::DataBlock::entry(std::string section, std::string name)
+{
+  downcase(section); downcase(name);
+  auto isec = sections_.find(section);
+  if (isec == sections_.end()) {log_access(BLOCK_LOG_READ_FAIL, section, name, typeid(void*)); throw BadDataBlockAccess(); }
+  log_access(BLOCK_LOG_READ, section, name, typeid(void*));
+  return isec->second.entry(name);
+}
+
 void cosmosis::DataBlock::clear()
 {
   std::string t = std::string("");
@@ -113,6 +147,13 @@ void cosmosis::DataBlock::clear()
   sections_.clear();
 }
 
+void cosmosis::DataBlock::reset()
+{
+  sections_.clear();
+  access_log_.clear();
+  logged_.clear();
+}
+
 DATABLOCK_STATUS 
 cosmosis::DataBlock::delete_section(std::string section)
 {
@@ -126,19 +167,65 @@ cosmosis::DataBlock::delete_section(std::string section)
   return DBS_SUCCESS;
 }
 
-void cosmosis::DataBlock::log_access(const std::string& log_type, 
+std::uint32_t cosmosis::DataBlock::intern_log_string(const std::string& s)
+{
+  auto it = log_string_index_.find(s);
+  if (it != log_string_index_.end()) return it->second;
+  std::uint32_t index = log_strings_.size();
+  log_strings_.push_back(s);
+  log_string_index_.emplace(s, index);
+  return index;
+}
+
+void cosmosis::DataBlock::record_access(const std::string& log_type, 
   const std::string& section, const std::string &name, const std::type_info& type)
 {
-  auto entry = log_entry(log_type, section, name, type);
+  log_entry entry {intern_log_string(log_type), intern_log_string(section),
+                   intern_log_string(name), std::type_index(type)};
+  if (log_level_ == BLOCK_LOG_LEVEL_FIRST_USE && log_type != BLOCK_LOG_START_MODULE)
+    {
+      auto key = std::make_tuple(entry.log_type, entry.section, entry.name);
+      if (!logged_.insert(key).second) return;
+    }
   access_log_.push_back(entry);
 }
 
+DATABLOCK_STATUS cosmosis::DataBlock::set_log_level(int level)
+{
+  if (level < BLOCK_LOG_LEVEL_OFF || level > BLOCK_LOG_LEVEL_FULL) return DBS_LOGIC_ERROR;
+  log_level_ = level;
+  return DBS_SUCCESS;
+}
+
 int cosmosis::DataBlock::get_log_count()
 {
   return access_log_.size();
 }
 
 
+void cosmosis::DataBlock::get_log_bytes(int start,
+  std::size_t& read, std::size_t& written) const
+{
+  read = 0;
+  written = 0;
+  if (start < 0) start = 0;
+  for (std::size_t j = start; j < access_log_.size(); ++j)
+    {
+      auto const& entry = access_log_[j];
+      auto const& log_type = log_strings_[entry.log_type];
+      bool is_read = (log_type == BLOCK_LOG_READ || log_type == BLOCK_LOG_READ_DEFAULT);
+      bool is_write = (log_type == BLOCK_LOG_WRITE || log_type == BLOCK_LOG_REPLACE);
+      if (!(is_read || is_write)) continue;
+      // Sections and names in the log have already been downcased
+      auto isec = sections_.find(log_strings_[entry.section]);
+      if (isec == sections_.end()) continue;
+      std::size_t n = 0;
+      if (isec->second.value_nbytes(log_strings_[entry.name], n) != DBS_SUCCESS) continue;
+      if (is_read) read += n;
+      else written += n;
+    }
+}
+
 DATABLOCK_STATUS
 cosmosis::DataBlock::get_log_entry(int i, 
   std::string& log_type, 
@@ -149,11 +236,11 @@ cosmosis::DataBlock::get_log_entry(int i,
   if (i<0) return DBS_SIZE_INSUFFICIENT;
   unsigned int j = (unsigned int) i;
   if (j>=access_log_.size()) return DBS_SIZE_INSUFFICIENT;
-  const log_entry entry = access_log_[j];
-  log_type = std::get<0>(entry);
-  section = std::get<1>(entry);
-  name = std::get<2>(entry);
-  std::type_index info(std::get<3>(entry));
+  const log_entry& entry = access_log_[j];
+  log_type = log_strings_[entry.log_type];
+  section = log_strings_[entry.section];
+  name = log_strings_[entry.name];
+  std::type_index info(entry.type);
   char type_name[128];
   int status;
   size_t len = 128;
@@ -171,10 +258,9 @@ cosmosis::DataBlock::get_log_entry(int i,
 void cosmosis::DataBlock::report_failures(std::ostream &output)
 {
    for (auto L=access_log_.begin(); L!=access_log_.end(); ++L){
-      auto l = *L;
-      auto access_type = std::get<0>(l);
-      auto section = std::get<1>(l);
-      auto name = std::get<2>(l);
+      auto const& access_type = log_strings_[L->log_type];
+      auto const& section = log_strings_[L->section];
+      auto const& name = log_strings_[L->name];
       if(access_type==BLOCK_LOG_READ_FAIL){
         output << "Failed to read " << name << " from " << section << std::endl;
       }
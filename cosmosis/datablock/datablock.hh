@@ -38,6 +38,9 @@
 
 #include <string>
 #include <map>
+#include <set>
+#include <tuple>
+#include <unordered_map>
 #include <cctype>
 #include <ostream>
 
@@ -144,6 +147,21 @@ namespace cosmosis
     // Remove all the sections.
     void clear();
 
+    // Remove all the sections and empty the log, ready for the block to
+    // be used again. Unlike clear this is not itself logged, and the log
+    // level and the memory already used for the log are kept.
+    void reset();
+
+    // Compute a stable 64-bit hash of the exact contents of the listed
+    // values, in the order given, starting from the given seed. This
+    // does not record anything in the access log. Returns an error
+    // status if any of the values is missing, in which case hash is
+    // not modified.
+    DATABLOCK_STATUS hash_values(std::vector<std::string> const& sections,
+                                 std::vector<std::string> const& names,
+                                 std::uint64_t seed,
+                                 std::uint64_t& hash) const;
+
 
 
     DATABLOCK_STATUS
@@ -173,15 +191,41 @@ namespace cosmosis
     template <class T>
     T const& view(std::string section, std::string name);
 
+    // Get shared ownership of a value, which unlike a view stays valid
+    // if the value is replaced, its section deleted, or the DataBlock
+    // destroyed. Throws as view does if the value can't be found.
+    std::shared_ptr<Entry const> entry(std::string section, std::string name);
+
     void print_log();
     void report_failures(std::ostream& output);
-    void log_access(const std::string& log_type, const std::string& section, const std::string& name, const std::type_info& type);
+    // Record an access in the log, if the log level says to.
+    void log_access(const std::string& log_type, const std::string& section, const std::string& name, const std::type_info& type)
+    {
+      if (log_level_ != BLOCK_LOG_LEVEL_OFF) record_access(log_type, section, name, type);
+    }
+    // Set how much is recorded in the log from now on. Entries already
+    // in the log are kept. Returns DBS_LOGIC_ERROR for an unknown level.
+    DATABLOCK_STATUS set_log_level(int level);
+    int get_log_level() const { return log_level_; }
     int get_log_count();
+    // Add up the current sizes of the values read and written (or
+    // replaced) in the log entries from number start onwards. Values
+    // that have since been deleted are not counted.
+    void get_log_bytes(int start, std::size_t& read, std::size_t& written) const;
     DATABLOCK_STATUS
     get_log_entry(int i, std::string& log_type, std::string& section, std::string &name, std::string & type);
   private:
+    void record_access(const std::string& log_type, const std::string& section, const std::string& name, const std::type_info& type);
+    std::uint32_t intern_log_string(const std::string& s);
+
     std::map<std::string, Section> sections_;
     std::vector<log_entry> access_log_;
+    int log_level_ = BLOCK_LOG_LEVEL_FULL;
+    std::vector<std::string> log_strings_;
+    std::unordered_map<std::string, std::uint32_t> log_string_index_;
+    // The (log type, section, name) of the entries already made, used to
+    // keep just the first of each at BLOCK_LOG_LEVEL_FIRST_USE
+    std::set<std::tuple<std::uint32_t, std::uint32_t, std::uint32_t>> logged_;
   };
 }
 
@@ -1,3 +1,6 @@
+#ifndef COSMOSIS_DATABLOCK_LOGGING_H
+#define COSMOSIS_DATABLOCK_LOGGING_H
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -13,6 +16,18 @@ extern const char* BLOCK_LOG_DELETE;
 extern const char* BLOCK_LOG_START_MODULE;
 extern const char* BLOCK_LOG_COPY;
 
+/*
+  How much of the access to a datablock is recorded in its log.
+  With BLOCK_LOG_LEVEL_FIRST_USE only the first entry of each kind for
+  each section and name is kept (and every MODULE-START marker), which
+  is enough to find which module first reads or writes each value.
+*/
+typedef enum {
+  BLOCK_LOG_LEVEL_OFF = 0,
+  BLOCK_LOG_LEVEL_FIRST_USE = 1,
+  BLOCK_LOG_LEVEL_FULL = 2
+} datablock_log_level_t;
+
 #ifdef __cplusplus
 }
 #endif
@@ -20,14 +35,22 @@ extern const char* BLOCK_LOG_COPY;
 
 
 #ifdef __cplusplus
+#include <cstdint>
 #include <string>
 #include <typeindex>
 #include <typeinfo>
 namespace cosmosis
 {
-  typedef std::tuple<std::string, std::string, std::string, std::type_index> log_entry;
+  // The strings in a log entry are stored once each in a table in the
+  // DataBlock, and the entries refer to them by their index in it.
+  struct log_entry
+  {
+    std::uint32_t log_type;
+    std::uint32_t section;
+    std::uint32_t name;
+    std::type_index type;
+  };
 }
 #endif
 
-
-
+#endif
@@ -123,3 +123,87 @@ void cosmosis::Entry::set_val(vector<complex_t> const& v) { _vset(v, vz); }
 void cosmosis::Entry::set_val(nd_int_t const& v) { _vset(v, ndi); }
 void cosmosis::Entry::set_val(nd_double_t const& v) { _vset(v, ndd); }
 void cosmosis::Entry::set_val(nd_complex_t const& v) { _vset(v, ndz); }
+
+void cosmosis::hash_bytes(std::uint64_t& h, void const* data, std::size_t n)
+{
+  constexpr std::uint64_t FNV_PRIME = 1099511628211ULL;
+  auto p = static_cast<unsigned char const*>(data);
+  for (std::size_t i = 0; i != n; ++i) {
+    h ^= p[i];
+    h *= FNV_PRIME;
+  }
+}
+
+namespace
+{
+  void hash_size(std::uint64_t& h, std::size_t n)
+  {
+    std::uint64_t n64 = n;
+    cosmosis::hash_bytes(h, &n64, sizeof(n64));
+  }
+
+  void hash_string(std::uint64_t& h, string const& s)
+  {
+    hash_size(h, s.size());
+    cosmosis::hash_bytes(h, s.data(), s.size());
+  }
+
+  template <class V>
+  void hash_vector(std::uint64_t& h, V const& v)
+  {
+    hash_size(h, v.size());
+    if (!v.empty()) cosmosis::hash_bytes(h, &v[0], v.size() * sizeof(v[0]));
+  }
+
+  template <class T>
+  void hash_ndarray(std::uint64_t& h, cosmosis::ndarray<T> const& a)
+  {
+    hash_vector(h, a.extents());
+    if (a.size()) cosmosis::hash_bytes(h, &*a.begin(), a.size() * sizeof(T));
+  }
+}
+
+std::size_t cosmosis::Entry::nbytes() const
+{
+  if      (type_ == enum_for_type<int>()) return sizeof(i);
+  else if (type_ == enum_for_type<bool>()) return sizeof(b);
+  else if (type_ == enum_for_type<double>()) return sizeof(d);
+  else if (type_ == enum_for_type<string>()) return s.size();
+  else if (type_ == enum_for_type<complex_t>()) return sizeof(z);
+  else if (type_ == enum_for_type<vint_t>()) return vi.size() * sizeof(int);
+  else if (type_ == enum_for_type<vdouble_t>()) return vd.size() * sizeof(double);
+  else if (type_ == enum_for_type<vstring_t>())
+    {
+      std::size_t n = 0;
+      for (auto const& x : vs) n += x.size();
+      return n;
+    }
+  else if (type_ == enum_for_type<vcomplex_t>()) return vz.size() * sizeof(complex_t);
+  else if (type_ == enum_for_type<nd_int_t>()) return ndi.size() * sizeof(int);
+  else if (type_ == enum_for_type<nd_double_t>()) return ndd.size() * sizeof(double);
+  else if (type_ == enum_for_type<nd_complex_t>()) return ndz.size() * sizeof(complex_t);
+  else throw BadEntry();
+}
+
+void cosmosis::Entry::hash(std::uint64_t& h) const
+{
+  std::int32_t t = type_;
+  hash_bytes(h, &t, sizeof(t));
+  if      (type_ == enum_for_type<int>()) hash_bytes(h, &i, sizeof(i));
+  else if (type_ == enum_for_type<bool>()) { unsigned char c = b; hash_bytes(h, &c, 1); }
+  else if (type_ == enum_for_type<double>()) hash_bytes(h, &d, sizeof(d));
+  else if (type_ == enum_for_type<string>()) hash_string(h, s);
+  else if (type_ == enum_for_type<complex_t>()) hash_bytes(h, &z, sizeof(z));
+  else if (type_ == enum_for_type<vint_t>()) hash_vector(h, vi);
+  else if (type_ == enum_for_type<vdouble_t>()) hash_vector(h, vd);
+  else if (type_ == enum_for_type<vstring_t>())
+    {
+      hash_size(h, vs.size());
+      for (auto const& x : vs) hash_string(h, x);
+    }
+  else if (type_ == enum_for_type<vcomplex_t>()) hash_vector(h, vz);
+  else if (type_ == enum_for_type<nd_int_t>()) hash_ndarray(h, ndi);
+  else if (type_ == enum_for_type<nd_double_t>()) hash_ndarray(h, ndd);
+  else if (type_ == enum_for_type<nd_complex_t>()) hash_ndarray(h, ndz);
+  else throw BadEntry();
+}
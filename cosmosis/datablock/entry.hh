@@ -1,6 +1,7 @@
 #ifndef COSMOSIS_ENTRY_HH
 #define COSMOSIS_ENTRY_HH
 
+#include <cstdint>
 #include <string>
 #include <complex>
 #include <vector>
@@ -102,6 +103,15 @@ namespace cosmosis
     // vector is greater than MAXINT, return -2.
     int size() const;
 
+    // Mix the type and the exact contents of the carried value into
+    // the running 64-bit FNV-1a hash h. Equal Entries always give the
+    // same result, on every platform with the same byte order.
+    void hash(std::uint64_t& h) const;
+
+    // Return the number of bytes of data in the carried value, not
+    // counting any bookkeeping overhead.
+    std::size_t nbytes() const;
+
     // Replace the existing value (of whatever type) with the given
     // value.
     void set_val(bool v);
@@ -164,6 +174,10 @@ namespace cosmosis
   // emplace is used to do placement new of type T, with value val, at
   // location addr.
   template <class T> void emplace(T* addr, T const& val);
+
+  // Mix n bytes starting at data into the running 64-bit FNV-1a hash h.
+  void hash_bytes(std::uint64_t& h, void const* data, std::size_t n);
+  constexpr std::uint64_t HASH_OFFSET_BASIS = 14695981039346656037ULL;
 } // namespace cosmosis
 
 
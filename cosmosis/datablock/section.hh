@@ -3,6 +3,7 @@
 
 #include <initializer_list>
 #include <map>
+#include <memory>
 #include <string>
 
 #include "exceptions.hh"
@@ -16,6 +17,11 @@ namespace cosmosis
   // provides 'get', 'put', and 'replace' ability for each type of
   // quantity.
   //
+  // Copies of a Section share their values until one of them is
+  // changed (copy-on-write), so copying a DataBlock is cheap even if
+  // it holds large arrays. Even then only the map of names is copied;
+  // the entries are shared until they are themselves replaced.
+  //
   // Original author: Marc Paterno (paterno@fnal.gov)
 
   class Section
@@ -72,6 +78,14 @@ namespace cosmosis
     DATABLOCK_STATUS get_array_shape(std::string const& name,
                                      std::vector<std::size_t>& extents) const;
 
+    // Mix the value with the given name into the running hash h (see
+    // Entry::hash). Return DBS_NAME_NOT_FOUND if there is no such value.
+    DATABLOCK_STATUS hash_value(std::string const& name, std::uint64_t& h) const;
+
+    // Set n to the number of bytes of data in the value with the given
+    // name. Return DBS_NAME_NOT_FOUND if there is no such value.
+    DATABLOCK_STATUS value_nbytes(std::string const& name, std::size_t& n) const;
+
     //Return the name of the key at position i
     std::string const& value_name(std::size_t i) const;
 
@@ -83,8 +97,18 @@ namespace cosmosis
     template <class T>
     T const& view(std::string const& name) const;
 
+    // Get shared ownership of the value with the given name. The Entry
+    // stays valid however the Section changes afterwards, since replacing
+    // a value that is shared makes a new Entry rather than changing it.
+    // Throws BadSectionAccess if the name can't be found.
+    std::shared_ptr<Entry const> entry(std::string const& name) const;
+
   private:
-    std::map<std::string, Entry> vals_;
+    typedef std::map<std::string, std::shared_ptr<Entry>> entry_map;
+    // Get the values for changing, first making our own copy of the
+    // map if it is shared with another Section.
+    entry_map& writable_vals();
+    std::shared_ptr<entry_map> vals_ = std::make_shared<entry_map>();
   };
 }
 
@@ -92,23 +116,22 @@ template <class T>
 DATABLOCK_STATUS
 cosmosis::Section::put_val(std::string const& name, T const& v)
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end() )
-    {
-      vals_.emplace(name, Entry(v));
-      return DBS_SUCCESS;
-    }
-  return DBS_NAME_ALREADY_EXISTS;
+  if (vals_->find(name) != vals_->end()) return DBS_NAME_ALREADY_EXISTS;
+  writable_vals().emplace(name, std::make_shared<Entry>(v));
+  return DBS_SUCCESS;
 }
 
 template <class T>
 DATABLOCK_STATUS
 cosmosis::Section::replace_val(std::string const& name, T const& v)
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  i->second.set_val(v);
+  auto i = vals_->find(name);
+  if (i == vals_->end()) return DBS_NAME_NOT_FOUND;
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  auto& entry = writable_vals().find(name)->second;
+  // Leave any other Section using this entry with the old value
+  if (entry.use_count() > 1) entry = std::make_shared<Entry>(v);
+  else entry->set_val(v);
   return DBS_SUCCESS;
 }
 
@@ -116,18 +139,18 @@ template <class T>
 bool
 cosmosis::Section::has_value(std::string const& name) const
 {
-  auto i = vals_.find(name);
-  return (i != vals_.end()) && i->second.is<T>();
+  auto i = vals_->find(name);
+  return (i != vals_->end()) && i->second->is<T>();
 }
 
 template <class T>
 DATABLOCK_STATUS
 cosmosis::Section::get_val(std::string const& name, T& v) const
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  v = i->second.val<T>();
+  auto i = vals_->find(name);
+  if (i == vals_->end()) return DBS_NAME_NOT_FOUND;
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  v = i->second->val<T>();
   return DBS_SUCCESS;
 }
 
@@ -135,14 +158,14 @@ template <class T>
 DATABLOCK_STATUS
 cosmosis::Section::get_val(std::string const& name, T const& def, T& v) const
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end())
+  auto i = vals_->find(name);
+  if (i == vals_->end())
     {
       v = def;
       return DBS_USED_DEFAULT;
     }
-  if (not i->second.is<T>()) return DBS_WRONG_VALUE_TYPE;
-  v = i->second.val<T>();
+  if (not i->second->is<T>()) return DBS_WRONG_VALUE_TYPE;
+  v = i->second->val<T>();
   return DBS_SUCCESS;
 }
 
@@ -151,10 +174,10 @@ DATABLOCK_STATUS
 cosmosis::Section::get_array_shape(std::string const& name,
                                    std::vector<std::size_t>& extents) const
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end()) return DBS_NAME_NOT_FOUND;
+  auto i = vals_->find(name);
+  if (i == vals_->end()) return DBS_NAME_NOT_FOUND;
   typedef ndarray<T> array_t;
-  if (not i->second.is<array_t>()) return DBS_WRONG_VALUE_TYPE;
+  if (not i->second->is<array_t>()) return DBS_WRONG_VALUE_TYPE;
   auto const& r = view<array_t>(name);
   extents = r.extents();
   return DBS_SUCCESS;
@@ -164,9 +187,9 @@ template <class T>
 T const&
 cosmosis::Section::view(std::string const& name) const
 {
-  auto i = vals_.find(name);
-  if (i == vals_.end()) throw BadSectionAccess();
-  return i->second.view<T>();
+  auto i = vals_->find(name);
+  if (i == vals_->end()) throw BadSectionAccess();
+  return i->second->view<T>();
 }
 
 #endif
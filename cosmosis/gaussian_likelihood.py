@@ -1,5 +1,3 @@
-import scipy.interpolate
-import scipy.integrate
 import numpy as np
 from .datablock import names, SectionOptions
 from .runtime import FunctionModule
@@ -179,7 +177,31 @@ class GaussianLikelihood:
         #gaussian likelihood
         d = x-mu
         chi2 = np.einsum('i,ij,j', d, self.inv_cov, d)
-        chi2 = float(chi2)
+        self.save_likelihood(block, x, mu, float(chi2))
+
+    def do_likelihood_batch(self, blocks):
+        """
+        Compute the likelihood for a list of blocks at once.  With a
+        constant covariance the chi^2 values are all computed in a
+        single vectorized operation.
+        """
+        if not self.constant_covariance:
+            for block in blocks:
+                self.do_likelihood(block)
+            return
+
+        x = np.array([np.atleast_1d(self.extract_theory_points(block)) for block in blocks])
+        mu = np.atleast_1d(self.data_y)
+        d = x - mu
+        chi2 = np.einsum('ai,ij,aj->a', d, self.inv_cov, d)
+        for block, x_i, chi2_i in zip(blocks, x, chi2):
+            self.save_likelihood(block, x_i, mu, float(chi2_i))
+
+    def save_likelihood(self, block, x, mu, chi2):
+        """
+        Save the likelihood and associated quantities to the block,
+        given the theory x, data mu and chi^2.
+        """
         like = -0.5*chi2
 
         #It can be useful to save the chi^2 as well as the likelihood,
@@ -248,6 +270,7 @@ class GaussianLikelihood:
 
     def generate_theory_points(self, theory_x, theory_y):
         "Generate theory predicted data points by interpolation into the theory"
+        import scipy.interpolate
         f = scipy.interpolate.interp1d(theory_x, theory_y, kind=self.kind)
         return np.atleast_1d(f(self.data_x))
 
@@ -264,6 +287,15 @@ class GaussianLikelihood:
             likelihoodCalculator.do_likelihood(block)
             return 0
 
+        def execute_batch(blocks, config):
+            likelihoodCalculator = config
+            likelihoodCalculator.do_likelihood_batch(blocks)
+            return 0
+
+        # Attached to the execute function so that module files using
+        # setup, execute, cleanup = X.build_module() get it automatically
+        execute.execute_batch = execute_batch
+
         def cleanup(config):
             likelihoodCalculator = config
             likelihoodCalculator.cleanup()
@@ -351,6 +383,8 @@ class WindowedGaussianLikelihood(GaussianLikelihood):
 
     def generate_theory_points(self, theory_x, theory_y):
         "Generate theory predicted data points using window function"
+        import scipy.interpolate
+        import scipy.integrate
         f = scipy.interpolate.interp(theory_x, theory_y, kind=self.kind)
         values = []
         for window_x, window_y in self.windows:
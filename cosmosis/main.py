@@ -10,6 +10,7 @@ import pdb
 import cProfile
 from .runtime.config import Inifile, CosmosisConfigurationError
 from .runtime.pipeline import LikelihoodPipeline
+from .datablock import DataBlock
 from .runtime import mpi_pool
 from .runtime import process_pool
 from .runtime.utils import ParseExtraParameters, stdout_redirected, import_by_path
@@ -229,7 +230,8 @@ def run_cosmosis(args, pool=None, ini=None, pipeline=None, values=None, priors=N
 
     for sample_method in sample_methods:
         if sample_method not in Sampler.registry:
-            raise ValueError("Unknown sampler method %s" % (sample_method,))
+            raise ValueError("Unknown sampler method %s. Available samplers are: %s"
+                             % (sample_method, ", ".join(Sampler.registry.names())))
 
     #Get that sampler from the system.
     sampler_classes = [Sampler.registry[sample_method] for sample_method in sample_methods]
@@ -388,6 +390,8 @@ def make_graph(inifile, dotfile, params=None, variables=None):
     """
     ini = Inifile(inifile, override=params)
     pipeline = LikelihoodPipeline(ini, override=variables)
+    # The graph is made from the log of the block
+    pipeline.block_log_level = DataBlock.LOG_FULL
     data = pipeline.run_parameters(pipeline.start_vector())
     pipeline.make_graph(data, dotfile)
 
@@ -396,6 +400,8 @@ def make_graph(inifile, dotfile, params=None, variables=None):
 parser = argparse.ArgumentParser(description="Run a pipeline with a single set of parameters", add_help=True)
 parser.add_argument("inifile", help="Input ini file of parameters")
 parser.add_argument("--mpi",action='store_true',help="Run in MPI mode.")
+parser.add_argument("--mpi-dynamic",action='store_true',help="In MPI mode, hand out tasks to processes as they become free instead of splitting them up in advance. Helps when some points are much slower than others.")
+parser.add_argument("--mpi-chunk",type=int,default=0,help="With --mpi-dynamic, the number of tasks to send to a process at once. The default, 0, chooses a size that shrinks as tasks run out.")
 parser.add_argument("--smp",type=int,default=0,help="Run with the given number of processes in shared memory multiprocessing (this is experimental and does not work for multinest).")
 parser.add_argument("--pdb",action='store_true',help="Start the python debugger on an uncaught error. Only in serial mode.")
 parser.add_argument("--segfaults", "--experimental-fault-handling", action='store_true',help="Activate a mode that gives more info on segfault")
@@ -424,7 +430,7 @@ def main():
 
         # initialize parallel workers
         if args.mpi:
-            with mpi_pool.MPIPool() as pool:
+            with mpi_pool.MPIPool(dynamic=args.mpi_dynamic, chunksize=args.mpi_chunk) as pool:
                 return run_cosmosis(args,pool)
         elif args.smp:
             with process_pool.Pool(args.smp) as pool:
@@ -0,0 +1,257 @@
+from .output_base import OutputBase
+from . import utils
+from ..runtime.utils import mkdir
+import numpy as np
+import json
+import os
+from collections import OrderedDict
+
+# The data file is a standard .npy file holding a 2D array of doubles,
+# with one row per sample.  The shape in its header is written with a
+# fixed width so that it can be updated in place as rows are appended.
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_LENGTH = 128
+DTYPE = np.dtype('<f8')
+
+
+def _npy_header(nrow, ncol):
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({:20d}, {}), }}".format(
+        DTYPE.str, nrow, ncol)
+    # Pad with spaces so that the data starts at a fixed, aligned offset
+    n = NPY_HEADER_LENGTH - len(NPY_MAGIC) - 2
+    header = header.ljust(n - 1) + '\n'
+    return NPY_MAGIC + n.to_bytes(2, 'little') + header.encode('latin1')
+
+
+def _json_value(x):
+    # numpy scalars and anything else json doesn't know about
+    if hasattr(x, 'item'):
+        return x.item()
+    return str(x)
+
+
+class BinaryOutput(OutputBase):
+    """
+    Binary chain output, which is much faster to write and read than text
+    and does not lose any precision.
+
+    The samples go in a .npy file (which numpy.load can read directly),
+    written in chunks of `chunk_size` rows or whenever the output is
+    flushed.  Column names, metadata, comments and final metadata go in
+    a JSON file alongside it.  Chains are loaded back as memory-mapped
+    arrays, so opening even a very large chain is instant and only the
+    parts that are used are ever read from disk.
+    """
+    FILE_EXTENSION = ".npy"
+    METADATA_EXTENSION = ".json"
+    _aliases = ["binary", "npy"]
+
+    def __init__(self, filename, rank=0, nchain=1, lock=True, resume=False, chunk_size=1000):
+        super(BinaryOutput, self).__init__()
+
+        if filename.endswith(self.FILE_EXTENSION):
+            filename = filename[:-len(self.FILE_EXTENSION)]
+
+        if nchain > 1:
+            filename = filename + "_{}".format(rank+1)
+
+        self.filename_base = filename
+        self._filename = filename + self.FILE_EXTENSION
+        self._metadata_filename = filename + self.METADATA_EXTENSION
+        self.chunk_size = chunk_size
+
+        dirname, _ = os.path.split(self._filename)
+        mkdir(dirname)
+
+        self._metadata = OrderedDict()
+        self._comments = []
+        self._final_metadata = OrderedDict()
+        self._rows = []
+        self._nrow = 0
+        self._ncol = None
+
+        if resume and utils.file_exists_and_is_not_empty(self._filename):
+            print("Note: You set resume=T so I will resume from file {}".format(self._filename))
+            self._file = open(self._filename, "r+b")
+            self._resume()
+        else:
+            if resume:
+                print("Note: You set resume=T but the file {} does not exist or is empty so I will start a new one".format(self._filename))
+            self._file = open(self._filename, "wb")
+            self.resumed = False
+
+        if lock:
+            try:
+                self.lock_file(self._file)
+            except IOError:
+                raise IOError("Another CosmoSIS process was trying to use the same output file ({}). "
+                              "You may have left out the --mpi flag, or have another run going "
+                              "with the same filename. If your file system cannot cope with file "
+                              "locks set lock=F in the [output] section.".format(self._filename))
+
+    def _resume(self):
+        nrow, ncol = self._read_shape(self._file)
+        # Drop any partly-written row at the end
+        self._file.truncate(NPY_HEADER_LENGTH + nrow * ncol * DTYPE.itemsize)
+        self._file.seek(0, 2)
+        self._nrow = nrow
+        self._ncol = ncol
+        with open(self._metadata_filename) as f:
+            info = json.load(f)
+        self._metadata = OrderedDict((k, (v, "")) for k, v in info["metadata"].items())
+        self._comments = info["comments"]
+        self.resumed = True
+
+    @staticmethod
+    def _read_shape(f):
+        # Work out the number of complete rows from the file size, not
+        # the header, in case the run was killed before the header was
+        # updated.
+        f.seek(0)
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            raise ValueError("File {} is not a cosmosis binary chain".format(f.name))
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        if len(shape) != 2 or fortran_order or dtype != DTYPE or offset != NPY_HEADER_LENGTH:
+            raise ValueError("File {} is not a cosmosis binary chain".format(f.name))
+        ncol = shape[1]
+        f.seek(0, 2)
+        nrow = (f.tell() - offset) // (ncol * DTYPE.itemsize)
+        return nrow, ncol
+
+    def _write_metadata_file(self):
+        info = {
+            "columns": [c[0] for c in self.columns],
+            "types": [getattr(c[1], "__name__", str(c[1])) for c in self.columns],
+            "metadata": OrderedDict((k, v) for k, (v, c) in self._metadata.items()),
+            "metadata_comments": OrderedDict((k, c) for k, (v, c) in self._metadata.items() if c),
+            "comments": self._comments,
+            "final": OrderedDict((k, v) for k, (v, c) in self._final_metadata.items()),
+        }
+        tmp_filename = self._metadata_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(info, f, indent=1, default=_json_value)
+        os.replace(tmp_filename, self._metadata_filename)
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(_npy_header(self._nrow, self._ncol))
+        self._file.seek(0, 2)
+
+    def _begun_sampling(self, params):
+        if self.resumed:
+            if len(self.columns) != self._ncol:
+                raise ValueError("Tried to resume file {} which has {} columns, "
+                                 "but this run has {}".format(self._filename, self._ncol, len(self.columns)))
+        else:
+            self._ncol = len(self.columns)
+            self._write_header()
+        self._write_metadata_file()
+
+    def _write_metadata(self, key, value, comment=''):
+        self._metadata[key] = (value, comment)
+
+    def _write_comment(self, comment):
+        self._comments.append(comment)
+
+    def _write_final(self, key, value, comment=''):
+        self._final_metadata[key] = (value, comment)
+
+    def _write_parameters(self, params):
+        self._rows.append(params)
+        if len(self._rows) >= self.chunk_size:
+            self._write_rows()
+
+    def _write_parameters_batch(self, rows):
+        # Keep the rows in order with any already waiting
+        self._write_rows()
+        rows.astype(DTYPE).tofile(self._file)
+        self._nrow += len(rows)
+        self._write_header()
+
+    def _write_rows(self):
+        if not self._rows:
+            return
+        np.array(self._rows, dtype=DTYPE).tofile(self._file)
+        self._nrow += len(self._rows)
+        self._rows = []
+        self._write_header()
+
+    def _flush(self):
+        self._write_rows()
+        self._file.flush()
+
+    def _close(self):
+        self._write_rows()
+        if self._ncol is None:
+            # No samples were ever written, but we still want a valid file
+            self._ncol = len(self.columns)
+            self._write_header()
+        self._write_metadata_file()
+        self._file.close()
+
+    def reset_to_chain_start(self):
+        if self._ncol is None:
+            return
+        self._rows = []
+        self._nrow = 0
+        self._file.truncate(NPY_HEADER_LENGTH)
+        self._write_header()
+        self._file.flush()
+
+    def name_for_sampler_resume_info(self):
+        return self.filename_base + '.sampler_status'
+
+    @classmethod
+    def from_options(cls, options, resume=False):
+        filename = options['filename']
+        rank = options.get('rank', 0)
+        nchain = options.get('parallel', 1)
+        lock = utils.boolean_string(options.get('lock', True))
+        chunk_size = int(options.get('chunk_size', 1000))
+        return cls(filename, rank, nchain, lock=lock, resume=resume, chunk_size=chunk_size)
+
+    @classmethod
+    def load_from_options(cls, options):
+        filename = options['filename']
+
+        if filename.endswith(cls.FILE_EXTENSION):
+            filename = filename[:-len(cls.FILE_EXTENSION)]
+        if os.path.exists(filename+cls.FILE_EXTENSION):
+            datafiles = [filename+cls.FILE_EXTENSION]
+        else:
+            datafiles = utils.chain_files(filename, cls.FILE_EXTENSION)
+            if not datafiles:
+                raise RuntimeError("No datafiles found starting with %s!"%filename)
+
+        metadata = []
+        final_metadata = []
+        data = []
+        comments = []
+        column_names = None
+
+        for datafile in datafiles:
+            print('LOADING CHAIN FROM FILE: ', datafile)
+            with open(datafile, "rb") as f:
+                nrow, ncol = cls._read_shape(f)
+            if nrow:
+                chain = np.memmap(datafile, dtype=DTYPE, mode='r',
+                                  offset=NPY_HEADER_LENGTH, shape=(nrow, ncol))
+            else:
+                # Can't map an empty region
+                chain = np.zeros((0, ncol))
+
+            with open(datafile[:-len(cls.FILE_EXTENSION)] + cls.METADATA_EXTENSION) as f:
+                info = json.load(f)
+            column_names = info["columns"]
+
+            data.append(chain)
+            metadata.append(info["metadata"])
+            final_metadata.append(info["final"])
+            comments.append(info["comments"])
+
+        if column_names is None:
+            raise ValueError("Could not find column names for file starting %s"%filename)
+
+        return column_names, data, metadata, comments, final_metadata
@@ -48,6 +48,11 @@ class CosmoMCOutput(TextColumnOutput):
             self._last_params = params[:]
             self._multiplicity = 1
     
+    def _write_parameters_batch(self, rows):
+        # Each row has to be compared with the last to count repeats
+        for params in rows.tolist():
+            self._write_parameters(params)
+
     def _write_parameters_multiplicity(self):
         if self._last_params:
             post = self._last_params[-1]
@@ -106,6 +106,10 @@ class FitsOutput(OutputBase):
         row=np.atleast_1d(row)
         self._hdu.append(row)
 
+    def _write_parameters_batch(self, rows):
+        table = np.rec.fromarrays(list(rows.T), dtype=self._dtype)
+        self._hdu.append(table)
+
     def _write_final(self, key, value, comment=''):
         #I suppose we can put this at the end - why not?
         if self.is_reserved_fits_keyword(key):
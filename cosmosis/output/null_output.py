@@ -5,6 +5,9 @@ class NullOutput(OutputBase):
     def _write_parameters(self, params):
         pass
 
+    def _write_parameters_batch(self, rows):
+        pass
+
     def _write_metadata(self, key, value, comment):
         pass
 
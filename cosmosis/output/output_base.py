@@ -4,6 +4,7 @@ import numpy as np
 import fcntl
 import datetime
 import os
+import time
 
 output_registry = {}
 LOG_LEVEL_NOISY = 15
@@ -46,6 +47,9 @@ class OutputBase(metaclass=OutputMetaclass):
         self.closed=False
         self.begun_sampling = False
         self.resumed = False
+        # If set, flush the output if it has not been for this many seconds
+        self.flush_interval = 0.0
+        self._last_flush = time.time()
 
     def log_debug(self, message, *args, **kwargs):
         logging.debug(message, *args, **kwargs)
@@ -137,6 +141,60 @@ class OutputBase(metaclass=OutputMetaclass):
             self.begun_sampling=True
         #Pass to the subclasses to write output
         self._write_parameters(params)
+        self._flush_if_due()
+
+    def parameters_batch(self, *column_groups):
+        """
+        Tell the outputter to save many vectors of parameters at once,
+        which is much faster than calling parameters for each of them.
+
+        Each argument is either a 2D array with one row per sample,
+        or a 1D array with one value per sample; they are joined
+        together column-wise, in the same way that parameters joins
+        its arguments.  So a sampler with n samples might call:
+
+            output.parameters_batch(samples, extras, priors, posts)
+
+        where samples is n x nparam, extras is n x nextra, and the
+        others have length n.
+
+        Each column is converted to the type it was declared with, so
+        integer columns are still written as integers.
+        """
+        if self.closed:
+            raise RuntimeError("Tried to write parameters to closed output")
+
+        columns = []
+        for p in column_groups:
+            p = np.asarray(p)
+            if p.ndim == 1:
+                p = p[:, np.newaxis]
+            columns.extend(p.T)
+
+        if len(columns) != len(self._columns):
+            raise ValueError("Sampler error - tried to save wrong number of parameters, or failed to set column names")
+        if len(columns[0]) == 0:
+            return
+
+        columns = [np.asarray(column, dtype=c[1]) for column, c in zip(columns, self._columns)]
+        if all(column.dtype == float for column in columns):
+            rows = np.column_stack(columns)
+        else:
+            # Mixing types in one array needs an object array, which
+            # keeps each value as the right python type
+            rows = np.empty((len(columns[0]), len(columns)), dtype=object)
+            for i, column in enumerate(columns):
+                rows[:, i] = column.tolist()
+
+        if not self.begun_sampling:
+            self._begun_sampling(rows[0].tolist())
+            self.begun_sampling=True
+        self._write_parameters_batch(rows)
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        if self.flush_interval and time.time() - self._last_flush > self.flush_interval:
+            self.flush()
 
     def reset_to_chain_start(self):
         """
@@ -151,6 +209,7 @@ class OutputBase(metaclass=OutputMetaclass):
         For supported output classes, flush all pending output
         """
         self._flush()
+        self._last_flush = time.time()
 
     def metadata(self, key, value, comment=""):
         """
@@ -219,6 +278,11 @@ class OutputBase(metaclass=OutputMetaclass):
     def _flush(self):
         pass
 
+    def _write_parameters_batch(self, rows):
+        # Subclasses can override this with something faster
+        for params in rows.tolist():
+            self._write_parameters(params)
+
     @abc.abstractmethod
     def _write_parameters(self, params):
         pass
@@ -3,7 +3,8 @@ from . import utils
 from ..runtime.utils import mkdir
 import numpy as np
 import os
-from glob import glob
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from collections import OrderedDict
 
 comment_indicator = "_cosmosis_comment_indicator_"
@@ -31,6 +32,9 @@ class TextColumnOutput(OutputBase):
         dirname, _ = os.path.split(self._filename)
         mkdir(dirname)
 
+        if resume and os.path.exists(self._filename):
+            self._truncate_partial_line(self._filename)
+
         if resume and utils.file_exists_and_is_empty(self._filename):
             print("You set resume=T but the file {} is empty so I will start afresh".format(self._filename))
             self._file = open(self._filename, "w")
@@ -67,6 +71,25 @@ In the last case you can set lock=F in the [output] section to disable this feat
         # For resetting
         self._start_mark = None
 
+    @staticmethod
+    def _truncate_partial_line(filename):
+        # A run that was killed while writing a row can leave an incomplete
+        # line at the end of the file, which we remove before appending.
+        with open(filename, "rb+") as f:
+            end = f.seek(0, 2)
+            pos = end
+            while pos > 0:
+                start = max(0, pos - 4096)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b'\n')
+                if newline >= 0:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            if pos < end:
+                print("Removing an incomplete last line from {}".format(filename))
+                f.truncate(pos)
+
     def _close(self):
         self._flush_metadata(self._final_metadata)
         self._final_metadata={}
@@ -114,6 +137,12 @@ In the last case you can set lock=F in the [output] section to disable this feat
         line = self.delimiter.join(str(x) for x in params) + '\n'
         self._file.write(line)
 
+    def _write_parameters_batch(self, rows):
+        # Format everything first and write it in one go
+        lines = [self.delimiter.join(map(str, params)) for params in rows.tolist()]
+        lines.append('')
+        self._file.write('\n'.join(lines))
+
     def _write_final(self, key, value, comment=''):
         #I suppose we can put this at the end - why not?
         self._final_metadata[key]= (value, comment)
@@ -146,6 +175,116 @@ In the last case you can set lock=F in the [output] section to disable this feat
         lock = utils.boolean_string(options.get('lock', True))
         return cls(filename, rank, nchain, delimiter=delimiter, lock=lock, resume=resume)
 
+    @staticmethod
+    def _parse_comment_line(line, metadata, comments):
+        #remove the first #
+        #if there is another then this is a comment,
+        #not metadata
+        line = line.strip()[1:]
+        if line.startswith('#'):
+            comments.append(line[1:])
+            return
+        #parse form '#key=value #comment'
+        if line.count('#') == 0:
+            key_val = line.strip()
+        else:
+            key_val, _ = line.split('#', 1)
+        key,val = key_val.split('=',1)
+        metadata[key] = utils.parse_value(val)
+
+    @classmethod
+    def _load_chain_file(cls, datafile, delimiter=None):
+        """
+        Read a single chain file.  The comment and metadata lines are
+        split off in one pass and the numbers are then all parsed at once
+        by numpy, which is much faster than going line by line.
+        """
+        with open(datafile, 'rb') as f:
+            text = f.read()
+
+        # Metadata lines come at the start of the file, and final metadata
+        # at the end.  Find the block of data in between.
+        start = 0
+        while start < len(text):
+            end = text.find(b'\n', start)
+            if end == -1:
+                end = len(text)
+            line = text[start:end].strip()
+            if line and not line.startswith(b'#'):
+                break
+            start = end + 1
+        header = text[:start].decode().splitlines()
+
+        end = len(text)
+        while end > start:
+            line_start = max(text.rfind(b'\n', start, end - 1) + 1, start)
+            line = text[line_start:end].strip()
+            # A cut-off line of data is left for the check below
+            if line and not line.startswith(b'#'):
+                break
+            end = max(line_start, start)
+        footer = text[end:].decode().splitlines()
+        body = text[start:end]
+
+        # A chain that was resumed has the final metadata of the previous
+        # run part way through.  This is rare, so it can be slower.
+        if b'#' in body:
+            lines = body.split(b'\n')
+            footer = [line.decode() for line in lines if line.lstrip().startswith(b'#')] + footer
+            body = b'\n'.join(line for line in lines if not line.lstrip().startswith(b'#'))
+        del text
+
+        column_names = None
+        chain_metadata = {}
+        chain_final_metadata = {}
+        chain_comments = []
+        for i, line in enumerate(header):
+            if i == 0 and line.startswith('#'):
+                column_names = line[1:].split()
+            elif line.strip():
+                cls._parse_comment_line(line, chain_metadata, chain_comments)
+        for line in footer:
+            if line.strip():
+                cls._parse_comment_line(line, chain_final_metadata, chain_comments)
+
+        if column_names is None:
+            ncol = len(body.split(b'\n', 1)[0].split())
+        else:
+            ncol = len(column_names)
+
+        if delimiter is not None and delimiter.strip():
+            body = body.replace(delimiter.encode(), b' ')
+        body = body.strip()
+
+        #strip off the last line if it is incompletely written as often
+        #the chain is interrupted
+        last_line_start = body.rfind(b'\n') + 1
+        if body and len(body[last_line_start:].split()) != ncol:
+            print("Skipping last line of chain as it seems to have been cut off")
+            print("This could conceivably cause problems for some samplers, though")
+            print("not the ones like metropolis and emcee where it is most likely to happen.")
+            print("If any more lines have the wrong length then this will raise an error.")
+            print()
+            print("You should probably check the final lines of the other files for errors")
+            print("that are harder to detect, like values being truncated.")
+            print()
+            body = body[:last_line_start].strip()
+
+        nrow = body.count(b'\n') + 1 if body else 0
+        try:
+            with warnings.catch_warnings():
+                # Older numpy versions warn rather than fail on bad values
+                warnings.simplefilter("ignore", DeprecationWarning)
+                chain = np.fromstring(body, sep=' ')
+        except ValueError:
+            chain = None
+        #if any more are the wrong length then something has gone wrong:
+        if chain is None or chain.size != nrow * ncol:
+            raise ValueError("Your chain file is corrupted somehow: not all the lines have {} numeric columns".format(ncol))
+        chain = chain.reshape((nrow, ncol))
+
+        return column_names, chain, chain_metadata, chain_comments, chain_final_metadata
+
     @classmethod
     def load_from_options(cls, options):
         filename = options['filename']
@@ -161,76 +300,28 @@ In the last case you can set lock=F in the [output] section to disable this feat
         elif os.path.exists(filename) and not cut:
             datafiles = [filename]
         else:
-            datafiles = glob(filename+"_[0-9]*"+cls.FILE_EXTENSION)
+            datafiles = utils.chain_files(filename, cls.FILE_EXTENSION)
             if not datafiles:
                 raise RuntimeError("No datafiles found starting with %s!"%filename)
 
-        #Read the metadata
-        started_data = False
+        # The files are read in separate threads, since much of the time
+        # goes on reading from disc and parsing in numpy.
+        for datafile in datafiles:
+            print('LOADING CHAIN FROM FILE: ', datafile)
+        nthread = min(len(datafiles), os.cpu_count() or 1)
+        with ThreadPoolExecutor(nthread) as executor:
+            chains = list(executor.map(lambda f: cls._load_chain_file(f, delimiter), datafiles))
+
         metadata = []
         final_metadata = []
         data = []
         comments = []
         column_names = None
 
-        for datafile in datafiles:
-            print('LOADING CHAIN FROM FILE: ', datafile)
-            chain = []
-            chain_metadata = {}
-            chain_final_metadata = {}
-            chain_comments = []
-            for i,line in enumerate(open(datafile)):
-                line = line.strip()
-                if not line: continue
-                if line.startswith('#'):
-                    #remove the first #
-                    #if there is another then this is a comment,
-                    #not metadata
-                    line=line[1:]
-                    if i == 0:
-                        column_names = line.split()
-                    elif line.startswith('#'):
-                        comment = line[1:]
-                        chain_comments.append(comment)
-                    else:
-                        #parse form '#key=value #comment'
-                        if line.count('#') == 0:
-                            key_val = line.strip()
-                            comment = ''
-                        else:
-                            key_val, comment = line.split('#', 1)
-                        key,val = key_val.split('=',1)
-                        val = utils.parse_value(val)
-                        if started_data:
-                            chain_final_metadata[key] = val
-                        else:
-                            chain_metadata[key] = val
-                else:
-                    started_data = True
-                    words = line.split(delimiter)
-                    vals = [float(word) for word in words]
-                    chain.append(vals)
-            ncol = len(column_names)
-            line_lengths = np.array([len(row) for row in chain])
-            #strip off the last line if it is incompletely written as often
-            #the chain is interrupted
-            if line_lengths[-1]!=ncol:
-                print("Skipping last line of chain as it seems to have been cut off")
-                print("This could conceivably cause problems for some samplers, though")
-                print("not the ones like metropolis and emcee where it is most likely to happen.")
-                print("If any more lines have the wrong length then this will raise an error.")
-                print()
-                print("You should probably check the final lines of the other files for errors")
-                print("that are harder to detect, like values being truncated.")
-                print()
-                chain = chain[:-1]
-                line_lengths = line_lengths[:-1]
-            #if any more are the wrong length then something has gone wrong:
-            if np.any(line_lengths!=ncol):
-                raise ValueError("Your chain file is corrupted somehow: not all the lines have {} columns".format(ncol))
-
-
-            data.append(np.array(chain))
+        for chain_column_names, chain, chain_metadata, chain_comments, chain_final_metadata in chains:
+            if chain_column_names is not None:
+                column_names = chain_column_names
+            data.append(chain)
             metadata.append(chain_metadata)
             final_metadata.append(chain_final_metadata)
             comments.append(chain_comments)
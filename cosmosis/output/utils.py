@@ -1,4 +1,5 @@
 import os
+import glob
 
 TRUE_STRINGS =  ["T","t","True","TRUE","true","y","Y","yes","Yes","YES","1"]
 FALSE_STRINGS = ["F","f","False","FALSE","false","n","N","no","No","NO","0"]
@@ -49,3 +50,14 @@ def file_exists_and_is_not_empty(fpath):
     from https://stackoverflow.com/questions/2507808/how-to-check-whether-a-file-is-empty-or-not
     """
     return os.path.isfile(fpath) and os.path.getsize(fpath) > 0
+
+def chain_files(base, extension):
+    """
+    The files base_1<extension>, base_2<extension>, ... written by the
+    separate processes of a parallel run, in order of their number
+    (so _10 comes after _9 rather than after _1).
+    """
+    def number(filename):
+        suffix = filename[len(base) + 1:len(filename) - len(extension)]
+        return (0, int(suffix), filename) if suffix.isdigit() else (1, 0, filename)
+    return sorted(glob.glob(base + "_[0-9]*" + extension), key=number)
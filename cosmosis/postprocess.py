@@ -2,6 +2,7 @@
 from .postprocessing.postprocess import postprocessor_for_sampler
 from .postprocessing.inputs import read_input
 from .postprocessing.plots import Tweaks
+from .postprocessing import streaming
 from .runtime.utils import mkdir
 import sys
 import argparse
@@ -29,6 +30,11 @@ inputs=parser.add_argument_group(title="Inputs", description="Options controllin
 inputs.add_argument("--text", action='store_true', help="Tell postprocess that its argument is a text file, regardless of its suffix")
 inputs.add_argument("--derive", default="", help="Read a python script with functions in that derive new columns from existing ones")
 
+stream=parser.add_argument_group(title="Streaming", description="Options for chains too large to load into memory")
+stream.add_argument("--stream", action='store_true', help="Compute summary statistics in one pass over chunks of the chain files, without loading them or making plots. Text and binary chains only.")
+stream.add_argument("--chunk-rows", default=100000, type=int, help="Number of rows to read at once in streaming mode")
+stream.add_argument("--procs", default=1, type=int, help="Number of processes to use for computing plot densities, and in streaming mode for reading chain files")
+
 plots=parser.add_argument_group(title="Plotting", description="Plotting options")
 plots.add_argument("--legend", help="Add a legend to the plot with the specified titles, separated by | (the pipe symbol)")
 plots.add_argument("--legend-loc", default='best', help="The location of the legend: best, UR, UL, LL, LR, R, CL, CR, LC, UC, C (use quotes for the ones with two words.)")
@@ -46,6 +52,7 @@ plots.add_argument("--fix-edges", dest='fix_edges', default=True, action='store_
 plots.add_argument("--no-fix-edges", dest='fix_edges', default=False, action='store_false', help="Switch off the edge fixing")
 plots.add_argument("--n-kde", default=100, type=int, help="Number of KDE smoothing points per dimension to use for MCMC 2D curves. Reduce to speed up, but can make plots look worse.")
 plots.add_argument("--factor-kde", default=2.0, type=float, help="Smoothing factor for MCMC plots.  More makes plots look better but can smooth out too much.")
+plots.add_argument("--density-cache", dest='density_cache', default=False, action='store_true', help="Save the smoothed MCMC plot densities to, and load them from, a cache file in the output directory")
 plots.add_argument("--no-fill", dest='fill', default=True, action='store_false', help="Do not fill in 2D constraint plots with color")
 plots.add_argument("--extra", dest='extra', default="", help="Load extra post-processing steps from this file.")
 plots.add_argument("--tweaks", dest='tweaks', default="", help="Load plot tweaks from this file.")
@@ -74,6 +81,10 @@ def main(args):
 	else:
 		labels = args.inifile
 
+	if args.stream:
+		stream_statistics(args, labels)
+		return
+
 	if len(args.inifile)>1 and args.run_max_post:
 		raise ValueError("Can only use the --run-max-post argument with a single parameter file for now")
 
@@ -124,5 +135,16 @@ def main(args):
 	#Save all the image files and close the text files
 	processor.finalize()
 
+def stream_statistics(args, labels):
+	for i,ini_filename in enumerate(args.inifile):
+		sampler, filenames = streaming.chain_files_for_input(ini_filename, args.text)
+		print("Streaming statistics from {} chain file(s) made by {}".format(len(filenames), sampler))
+		summary = streaming.summarise_chains(filenames, sampler, burn=args.burn, thin=args.thin,
+			chunk_rows=args.chunk_rows, procs=args.procs)
+		#Later chains are added to the files from the first
+		mode = "w" if i==0 else "a"
+		stats = streaming.StreamingStatistics(summary, labels[i], args.outdir, args.prefix, mode=mode)
+		stats.run()
+
 if __name__=="__main__":
 	main(sys.argv[1:])
@@ -0,0 +1,100 @@
+"""
+A cache of the smoothed densities and contour levels used in the
+MCMC plots, saved to a file alongside them so that re-running
+postprocess after changing only the plot styling does not mean
+repeating all the KDE calculations.
+
+Entries are keyed by a hash of everything the density depends on:
+the chain values themselves (so after burn-in, thinning and any
+blinding have been applied), the weights, the parameter limits, and
+the smoothing options.  So a stale entry is never used; it just
+stops being looked up and is dropped the next time the file is saved.
+"""
+import hashlib
+import os
+import zipfile
+import numpy as np
+
+# Change this if the way densities are computed changes, so that
+# any existing cache files are ignored
+CACHE_VERSION = 1
+
+
+def array_digest(x):
+    """A hex digest of the contents, shape and type of an array."""
+    x = np.ascontiguousarray(x)
+    h = hashlib.sha1()
+    h.update(str((x.dtype.str, x.shape)).encode('ascii'))
+    h.update(x.data)
+    return h.hexdigest()
+
+
+def density_key(*parts):
+    """A key made from the repr of any number of (simple) objects."""
+    text = repr((CACHE_VERSION,) + parts)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DensityCache(object):
+    """
+    A dictionary of density results, each a tuple of arrays and numbers,
+    that can be loaded from and saved to an npz file.
+
+    Only the entries that were looked up or added since loading are
+    saved, so the file only ever holds what the last run needed.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with np.load(self.filename) as data:
+                if int(data["version"]) != CACHE_VERSION:
+                    return
+                entries = {}
+                for name in data.files:
+                    if name == "version":
+                        continue
+                    key, i = name.rsplit("_", 1)
+                    value = data[name]
+                    # Numbers like contour levels were saved as 0-d arrays
+                    if value.ndim == 0:
+                        value = value.item()
+                    entries.setdefault(key, {})[int(i)] = value
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as error:
+            print("Ignoring unreadable density cache file {}: {}".format(self.filename, error))
+            return
+        for key, parts in entries.items():
+            self.entries[key] = tuple(parts[i] for i in range(len(parts)))
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.used.add(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = tuple(np.asarray(v) for v in value)
+        self.used.add(key)
+
+    def save(self):
+        arrays = {"version": np.array(CACHE_VERSION)}
+        for key in self.used:
+            for i, v in enumerate(self.entries[key]):
+                arrays["{}_{}".format(key, i)] = v
+        # Write to a temporary file first so an interrupted run
+        # can't leave a corrupted cache behind
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_filename, self.filename)
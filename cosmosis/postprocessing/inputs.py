@@ -1,5 +1,6 @@
 from cosmosis.output.text_output import TextColumnOutput
 from cosmosis.output.fits_output import FitsOutput
+from cosmosis.output.binary_output import BinaryOutput
 from cosmosis.runtime.config import Inifile
 import os
 
@@ -8,6 +9,7 @@ def read_input(filename, force_text=False, weighted=False):
     """
     Read cosmosis output data, either by:
      - specifying a cosmosis .txt output file
+     - specifying a cosmosis .npy (binary format) output file
      - specifying a cosmosis .ini input file that includes the output file specification
      - specifying a directory containing cosmosis test sampler output
      - specifying a non-cosmosis output file containing samples or weighted samples
@@ -50,6 +52,15 @@ def read_input(filename, force_text=False, weighted=False):
         else:
             ini = {"sampler":sampler, sampler:metadata, "data":output_info, "output":dict(format="fits", filename=filename)}
 
+    elif filename.endswith(BinaryOutput.FILE_EXTENSION):
+        # The chain is memory-mapped rather than read in
+        output_info = BinaryOutput.load_from_options({"filename":filename})
+        metadata=output_info[2][0]
+        sampler = metadata.get("sampler")
+        if sampler is None:
+            raise ValueError("The file {} does not say which sampler made it".format(filename))
+        ini = {"sampler":sampler, sampler:metadata, "data":output_info, "output":dict(format="binary", filename=filename)}
+
     elif os.path.isdir(filename):
         ini = Inifile(None)
         ini.add_section("runtime")
@@ -2,18 +2,19 @@ from .elements import PostProcessorElement
 from .elements import MCMCPostProcessorElement, MultinestPostProcessorElement, WeightedMCMCPostProcessorElement
 from .elements import Loadable
 from .outputs import PostprocessPlot
-from ..plotting.kde import KDE
 from ..runtime import Parameter
-from .utils import std_weight, mean_weight
+from .utils import std_weight, mean_weight, AdaptiveGrid
 from .density import smooth_density_estimate_1d, smooth_density_estimate_2d
+from .density_cache import DensityCache, array_digest, density_key
 from . import cosmology_theory_plots
+from ..runtime.process_pool import Pool
 import configparser
 import numpy as np
-import scipy.optimize
 from . import lazy_pylab as pylab
 import itertools
 import os
 import warnings
+import traceback
 
 
 default_latex_file = os.path.join(os.path.split(__file__)[0], "latex.ini")
@@ -44,6 +45,9 @@ class Plots(PostProcessorElement):
         self.quiet =  False
         self.truth = None
         self.cache = {}
+        self.densities = {}
+        self.density_cache = None
+        self.column_signatures = {}
         truth = self.options.get("truth")
         if truth:
             self.truth = {str(p): p.start for p in Parameter.load_parameters(truth)}
@@ -202,13 +206,40 @@ class Plots(PostProcessorElement):
 
 
 class GridPlots(Plots):
-    excluded_columns=["post","like", "prior"]
+    excluded_columns=["post","like", "prior", "grid_level"]
     def __init__(self, *args, **kwargs):
         super(GridPlots, self).__init__(*args, **kwargs)
         self.nsample_dimension = self.source.metadata[0]['nsample_dimension']
+        self._adaptive_grid = None
+
+    @property
+    def adaptive(self):
+        return "grid_level" in self.source.colnames
+
+    def adaptive_grid(self):
+        #Adaptive grids are sparse so we marginalize them
+        #onto the finest level of the grid instead
+        if self._adaptive_grid is None:
+            nv = self.source.metadata[0]['n_varied']
+            names = self.source.colnames[:nv]
+            try: like = self.source.get_col("post")
+            except: like = self.source.get_col("like")
+            self._adaptive_grid = AdaptiveGrid([self.source.get_col(name) for name in names],
+                like, self.source.get_col("grid_level"))
+        return self._adaptive_grid
+
+    def adaptive_marginal(self, *names):
+        nv = self.source.metadata[0]['n_varied']
+        varied_params = self.source.colnames[:nv]
+        grids, like = self.adaptive_grid().marginal([varied_params.index(name) for name in names])
+        #Return the log-likelihood as the dense grids do
+        with np.errstate(divide='ignore'):
+            like = np.log(like)
+        return grids, like
 
     @staticmethod
     def find_grid_contours(like, contour1, contour2):
+        import scipy.optimize
         like_total = like.sum()
         def objective(limit, target):
             w = np.where(like>limit)
@@ -229,7 +260,13 @@ class GridPlots(Plots):
 class GridPlots1D(GridPlots):
 
     def run(self):
-        return [self.plot_1d(name) for name in self.source.colnames if name not in self.excluded_columns]
+        names = [name for name in self.source.colnames if name not in self.excluded_columns]
+        #Derived parameters are not on the grid, so the adaptive
+        #grid cannot be marginalized onto them
+        if self.adaptive:
+            nv = self.source.metadata[0]['n_varied']
+            names = [name for name in names if name in self.source.colnames[:nv]]
+        return [self.plot_1d(name) for name in names]
 
     def plot_1d(self, name1):
         filename = self.filename(name1)
@@ -245,9 +282,13 @@ class GridPlots1D(GridPlots):
         like = like-like.max()
 
         #marginalize
-        for k,v1 in enumerate(vals1):
-            w = np.where(cols1==v1)
-            like_sum[k] = np.log(np.exp(like[w]).sum())
+        if self.adaptive:
+            (vals1,), like_sum = self.adaptive_marginal(name1)
+            n1 = len(vals1)
+        else:
+            for k,v1 in enumerate(vals1):
+                w = np.where(cols1==v1)
+                like_sum[k] = np.log(np.exp(like[w]).sum())
         like = like_sum.flatten()
         like -= like.max()
 
@@ -359,11 +400,16 @@ class GridPlots2D(GridPlots):
 
         #Marginalize over all the other parameters by summing
         #them up
-        like_sum = np.zeros((n1,n2))
-        for k,(v1, v2) in enumerate(itertools.product(vals1, vals2)):
-            w = np.where((cols1==v1)&(cols2==v2))
-            i,j = np.unravel_index(k, like_sum.shape)
-            like_sum[i,j] = np.log(np.exp(like[w]).sum())
+        if self.adaptive:
+            (vals1, vals2), like_sum = self.adaptive_marginal(name1, name2)
+            n1 = len(vals1)
+            n2 = len(vals2)
+        else:
+            like_sum = np.zeros((n1,n2))
+            for k,(v1, v2) in enumerate(itertools.product(vals1, vals2)):
+                w = np.where((cols1==v1)&(cols2==v2))
+                i,j = np.unravel_index(k, like_sum.shape)
+                like_sum[i,j] = np.log(np.exp(like[w]).sum())
         like = like_sum.flatten()
 
         #Normalize the log-likelihood to peak=0
@@ -401,7 +447,7 @@ class GridPlots2D(GridPlots):
             
             sm = pylab.cm.ScalarMappable(cmap=colormap, norm=norm)
             sm._A = [] #hack from StackOverflow to make this work
-            pylab.colorbar(sm, label='Posterior')
+            pylab.colorbar(sm, ax=pylab.gca(), label='Posterior')
 
         #Add contours
         level1, level2 = self.find_grid_contours(like, 0.68, 0.95)
@@ -504,14 +550,161 @@ def next_entry(l, m):
     return m[(l.index(m) + 1)%len(m)]
 
 
+# The plots object whose densities are being computed in a process pool.
+# The worker processes are forked, so they get a copy of it, and the
+# chain data it refers to, without anything being pickled.
+density_plots = None
+
+class DensityError(object):
+    # An error from a worker, kept until the plot is made
+    def __init__(self, error, traceback):
+        self.error = error
+        self.traceback = traceback
+
+def density_task(names):
+    try:
+        if len(names) == 1:
+            return density_plots.density_1d(names[0])
+        else:
+            return density_plots.density_2d(*names)
+    except Exception as error:
+        return DensityError(error, traceback.format_exc())
+
+
 class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
     def run(self):
-        return self.run_1d() + self.run_2d()
+        self.compute_densities()
+        filenames = self.run_1d() + self.run_2d()
+        if self.density_cache is not None:
+            self.density_cache.save()
+        return filenames
+
+    def names_1d(self):
+        return [name for name in self.source.colnames if name.lower() not in self.excluded_columns]
+
+    def compute_densities(self):
+        """
+        Load any of the 1D and 2D densities for the plots that were saved
+        by an earlier run with the same chain and settings.  Then, if the
+        procs option is set, compute all the others in parallel before any
+        of the plots are drawn.  Otherwise they are computed one by one
+        as the plots are made.
+        """
+        self.densities = {}
+        tasks = [(name,) for name in self.names_1d()]
+        if not self.options.get("no_2d", False):
+            tasks += list(self.parameter_pairs())
+
+        if self.options.get("density_cache", False):
+            filename = PostProcessorElement.filename(self, "npz", "density_cache", str(self.plot_set))
+            self.density_cache = DensityCache(filename)
+            for names in tasks:
+                density = self.density_cache.get(self.cache_key(names))
+                if density is not None:
+                    self.densities[names] = density
+            if self.densities:
+                print("Loaded {} of {} densities for plots from {}".format(len(self.densities), len(tasks), filename))
+            tasks = [names for names in tasks if names not in self.densities]
+
+        procs = self.options.get("procs", 1)
+        if procs <= 1 or not tasks:
+            return
+        print("Computing {} densities for plots using {} processes".format(len(tasks), procs))
+        global density_plots
+        density_plots = self
+        try:
+            with Pool(procs) as pool:
+                results = pool.map(density_task, tasks)
+        finally:
+            density_plots = None
+        self.densities.update(zip(tasks, results))
+
+    def get_density(self, *names):
+        if names in self.densities:
+            result = self.densities.pop(names)
+            if isinstance(result, DensityError):
+                # Show where things went wrong in the worker, unless
+                # it is an error that we report more simply anyway
+                if not isinstance(result.error, np.linalg.LinAlgError):
+                    print(result.traceback)
+                raise result.error
+        elif len(names) == 1:
+            result = self.density_1d(*names)
+        else:
+            result = self.density_2d(*names)
+        if result is not None and self.density_cache is not None:
+            self.density_cache.put(self.cache_key(names), result)
+        return result
+
+    def column_signature(self, name):
+        """
+        Everything about a column that its smoothed density depends on:
+        a digest of its values, after any burn-in, thinning, and blinding,
+        and its parameter limits if they are used to fix the edges.
+        """
+        signature = self.column_signatures.get(name)
+        if signature is None:
+            limits = None
+            if self.options.get("fix_edges"):
+                try:
+                    limits = tuple(get_param_limits(self.source, name))
+                except ValueError:
+                    pass
+            signature = (array_digest(self.reduced_col(name)), limits)
+            self.column_signatures[name] = signature
+        return signature
+
+    def weights_signature(self):
+        return None
+
+    def cache_key(self, names):
+        """
+        The key under which the density for the named columns is cached.
+        """
+        return density_key(
+            self.__class__.__name__,
+            names,
+            [self.column_signature(name) for name in names],
+            self.weights_signature(),
+            self.options.get("n_kde", 100),
+            self.options.get("factor_kde", 2.0),
+            bool(self.options.get("fix_edges")),
+        )
+
+    def density_1d(self, name):
+        """
+        The x axis and normalized likelihood for a 1D plot, or None
+        if the parameter does not vary.
+        """
+        x = self.reduced_col(name)
+        if x.max()-x.min()==0:
+            return None
+        x_axis, like = self.smooth_likelihood_1d(x, name)
+        like/=like.max()
+        return x_axis, like
+
+    def density_2d(self, name1, name2):
+        """
+        The x and y axes, likelihood, and 68% and 95% contour levels for a
+        2D plot, or None if either parameter does not vary.
+        """
+        x = self.reduced_col(name1)
+        y = self.reduced_col(name2)
+        if x.max()-x.min()==0 or y.max()-y.min()==0:
+            return None
+        x_axis, y_axis, like = self.smooth_likelihood_2d(x, y, name1, name2)
+
+        #Choose levels at which to plot contours
+        contour1=1-0.68
+        contour2=1-0.95
+        level1, level2, total_mass = self._find_contours(like, x, y, x_axis, y_axis, contour1, contour2)
+        return x_axis, y_axis, like, level1, level2
 
     def keywords_1d(self):
         return {}
 
     def smooth_likelihood_1d(self, x, name):
+        from ..plotting.kde import KDE
         #Interpolate using KDE
         if self.options.get("fix_edges"):
             return self.smooth_likelihood_with_boundaries_1d(x, name)
@@ -532,17 +725,16 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
 
 
     def make_1d_plot(self, name, figure=None):
-        x = self.reduced_col(name)
         if not self.quiet:
             print(" - 1D plot ", name)
         if figure is None:
             figure, filename = self.figure(name)
         else:
             filename = None
-        if x.max()-x.min()==0: return
+        density = self.get_density(name)
+        if density is None: return
 
-        x_axis, like = self.smooth_likelihood_1d(x, name)
-        like/=like.max()
+        x_axis, like = density
         self.cache[name] = x_axis, like
 
         #Choose colors
@@ -560,8 +752,7 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
 
     def run_1d(self):
         filenames = []
-        for name in self.source.colnames:
-            if name.lower() in self.excluded_columns: continue
+        for name in self.names_1d():
             filename = self.make_1d_plot(name)
             if filename: filenames.append(filename)
         return filenames
@@ -570,6 +761,7 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
         return {}
 
     def _find_contours(self, like, x, y, x_axis, y_axis, contour1, contour2):
+        import scipy.optimize
         N = len(x)
         hx = 0.5 * (x_axis[1] - x_axis[0])
         hy = 0.5 * (y_axis[1] - y_axis[0])
@@ -589,6 +781,7 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
         return level1, level2, like.sum()
 
     def smooth_likelihood_2d(self, x, y, xname, yname):
+        from ..plotting.kde import KDE
         if self.options.get("fix_edges"):
             return self.smooth_likelihood_with_boundaries_2d(x, y, xname, yname)
 
@@ -728,37 +921,27 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
 
 
     def make_2d_plot(self, name1, name2, figure=None):
-        #Get the data
-        x = self.reduced_col(name1)
-        y = self.reduced_col(name2)
-
+        #Get the KDE-smoothed likelihood and its contour levels
+        try:
+            density = self.get_density(name1, name2)
+        except np.linalg.LinAlgError:
+            print("  -- these two parameters have singular covariance - probably a linear relation")
+            print("Not making a 2D plot of them")
+            return []
 
-        if x.max()-x.min()==0 or y.max()-y.min()==0:
+        if density is None:
             return
 
         if not self.quiet:
             print("  (making %s vs %s)" % (name1, name2))
 
-
-        #Interpolate using KDE
-        try:
-            x_axis, y_axis, like = self.smooth_likelihood_2d(x, y, name1, name2)
-        except np.linalg.LinAlgError:
-            print("  -- these two parameters have singular covariance - probably a linear relation")
-            print("Not making a 2D plot of them")
-            return []
+        x_axis, y_axis, like, level1, level2 = density
 
         if figure is None:
             figure, filename = self.figure("2D", name1, name2)
         else:
             filename = None
 
-
-        #Choose levels at which to plot contours
-        contour1=1-0.68
-        contour2=1-0.95
-        level1, level2, total_mass = self._find_contours(like, x, y, x_axis, y_axis, contour1, contour2)
-
         level0 = np.inf
         levels = [level2, level1, level0]
 
@@ -786,7 +969,7 @@ class MetropolisHastingsPlots(MetropolisHastingsPlotsBase):
             figure.cosmosis_extra_labels.append((cs.legend_elements()[0][0], self.source.label))
 
         if plot_points:
-            pylab.plot(x, y, ',')
+            pylab.plot(self.reduced_col(name1), self.reduced_col(name2), ',')
 
 
         #Do the labels
@@ -858,7 +1041,14 @@ class TestPlots(Plots):
 class WeightedPlots(object):
     excluded_columns = ["like","old_like","post", "weight", "log_weight", "old_log_weight", "old_weight", "old_post", "prior"]
 
+    def weights_signature(self):
+        # Stored with the column signatures so the weights are only hashed once
+        if None not in self.column_signatures:
+            self.column_signatures[None] = array_digest(self.weight_col())
+        return self.column_signatures[None]
+
     def smooth_likelihood_1d(self, x, name):
+        from ..plotting.kde import KDE
         #Interpolate using KDE
         n = self.options.get("n_kde", 100)
         weights = self.weight_col()
@@ -884,6 +1074,7 @@ class WeightedPlots(object):
         return xout[cut], like[cut]
 
     def smooth_likelihood_2d(self, x, y, xname, yname):
+        from ..plotting.kde import KDE
         weights = self.weight_col()
 
         if self.options.get("fix_edges"):
@@ -917,6 +1108,7 @@ class WeightedPlots(object):
 
 
     def _find_contours(self, like, x, y, x_axis, y_axis, contour1, contour2):
+        import scipy.optimize
         N = len(x)
         weights = self.weight_col()
         hx = 0.5 * (x_axis[1] - x_axis[0])
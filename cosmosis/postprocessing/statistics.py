@@ -8,7 +8,7 @@ except:
 # getdist not implemented for polychord and grid sampler yet
 import numpy as np
 import scipy as sp
-from .utils import std_weight, mean_weight, median_weight, percentile_weight, find_asymmetric_errorbars
+from .utils import std_weight, mean_weight, median_weight, percentile_weight, find_asymmetric_errorbars, AdaptiveGrid
 from .outputs import PostprocessText
 
 class Statistics(PostProcessorElement):
@@ -421,6 +421,21 @@ class GridStatistics(ConstrainingStatistics):
         extra = self.source.sampler_option("extra_output","").replace('/','--').split()
         self.grid_columns = [i for i in range(self.ncol) if (not self.source.colnames[i] in extra) and (self.source.colnames[i]!="post") and (self.source.colnames[i]!="like")]
         self.ndim = len(self.grid_columns)
+        grid_names = [self.source.colnames[i] for i in range(self.ncol) if i in self.grid_columns]
+
+        #Adaptive grids are sparse, so are not reshaped into
+        #a full array
+        self.adaptive = "grid_level" in self.source.colnames
+        if self.adaptive:
+            try:
+                post = self.source.get_col("post")
+            except:
+                post = self.source.get_col("like")
+            self.adaptive_grid = AdaptiveGrid([self.source.get_col(name) for name in grid_names],
+                post, self.source.get_col("grid_level"))
+            self.grid = self.adaptive_grid.grids
+            return
+
         assert self.nrow == self.nsample**self.ndim
         self.shape = np.repeat(self.nsample, self.ndim)
 
@@ -433,7 +448,6 @@ class GridStatistics(ConstrainingStatistics):
 
         self.like = np.exp(like).reshape(self.shape)
 
-        grid_names = [self.source.colnames[i] for i in range(self.ncol) if i in self.grid_columns]
         self.grid = [np.unique(self.source.get_col(name)) for name in grid_names]
 
     def run(self):
@@ -488,7 +502,10 @@ class GridStatistics(ConstrainingStatistics):
         col = self.source.get_col(name)
         #Sum the likelihood over all the axes other than this one
         #to get the marginalized likelihood
-        marge_like = self.like.sum(tuple(j for j in range(self.ndim) if j!=i))
+        if self.adaptive:
+            _, marge_like = self.adaptive_grid.marginal([i])
+        else:
+            marge_like = self.like.sum(tuple(j for j in range(self.ndim) if j!=i))
         marge_like = marge_like / marge_like.sum()
         
         #Find the grid points with this value
@@ -510,8 +527,11 @@ class GridStatistics(ConstrainingStatistics):
         #sum over everything
         name = self.source.colnames[i]
         col = self.source.get_col(name)
-        try:like = self.source.get_col("post")
-        except:like = self.source.get_col("like")
+        if self.adaptive:
+            like = self.adaptive_grid.weights()
+        else:
+            try:like = self.source.get_col("post")
+            except:like = self.source.get_col("like")
         like = like / like.sum()
         mu = (col*like).sum()
         sigma2 = ((col-mu)**2*like).sum()
@@ -0,0 +1,654 @@
+#coding: utf-8
+u"""
+Summary statistics for chains that are too large to load into memory.
+
+The chain files are read a chunk of rows at a time, and each chunk is
+added to a set of accumulators which hold only a fixed amount of
+information however long the chain is.  Accumulators for different
+files can be merged, so the files can be processed in parallel and the
+results combined at the end.  This is used by the --stream option to
+cosmosis-postprocess.
+"""
+import os
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ..output.text_output import TextColumnOutput
+from ..output.binary_output import BinaryOutput, NPY_HEADER_LENGTH, DTYPE
+from ..output.utils import chain_files
+from ..runtime.config import Inifile
+
+# These samplers make chains where the burn-in has already been removed
+# or which are not Markov chains at all, so --burn and --thin do not apply.
+UNBURNED_SAMPLERS = ["multinest", "polychord", "dynesty", "nautilus", "pmc", "poco"]
+
+# These samplers write a group of walkers at each step, which are thinned together
+WALKER_SAMPLERS = ["emcee", "zeus"]
+
+# Columns left out of the covariance matrix
+NON_PARAMETER_COLUMNS = ["like", "post", "importance", "weight", "prior", "log_weight"]
+
+
+class MomentAccumulator(object):
+    u"""
+    The weighted mean and covariance of a set of columns, built up a chunk
+    of rows at a time.  Two can be combined with `merge`, using the method
+    of Chan, Golub & LeVeque (1979).
+    """
+    def __init__(self, ncol):
+        self.count = 0
+        self.weight = 0.0
+        self.weight2 = 0.0
+        self.mean = np.zeros(ncol)
+        self.comoment = np.zeros((ncol, ncol))
+
+    def add(self, x, w=None):
+        if len(x) == 0:
+            return
+        if w is None:
+            w = np.ones(len(x))
+        total = w.sum()
+        if total == 0:
+            self.count += len(x)
+            return
+        mean = np.dot(w, x) / total
+        d = x - mean
+        comoment = np.dot(d.T * w, d)
+        self._combine(len(x), total, (w**2).sum(), mean, comoment)
+
+    def merge(self, other):
+        if other.weight > 0:
+            self._combine(other.count, other.weight, other.weight2, other.mean, other.comoment)
+        else:
+            self.count += other.count
+
+    def _combine(self, count, weight, weight2, mean, comoment):
+        total = self.weight + weight
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (weight / total)
+        self.comoment = self.comoment + comoment + np.outer(delta, delta) * (self.weight * weight / total)
+        self.count += count
+        self.weight = total
+        self.weight2 += weight2
+
+    def scale(self, factor):
+        u"""Multiply all the weights added so far by factor."""
+        self.weight *= factor
+        self.weight2 *= factor**2
+        self.comoment *= factor
+
+    def variance(self):
+        u"""The variance of each column, normalized like numpy.var"""
+        return np.diag(self.comoment) / self.weight
+
+    def covariance(self):
+        u"""The covariance matrix, normalized like numpy.cov"""
+        return self.comoment / (self.weight - self.weight2 / self.weight)
+
+
+class QuantileAccumulator(object):
+    u"""
+    A weighted histogram of a single column, from which quantiles can be
+    estimated, built up a chunk at a time.
+
+    There are at most `nbin` bins, whose width is always a power of two
+    and which start at a multiple of the width.  When new values fall
+    outside the range the bins cover the width is doubled, merging pairs
+    of bins.  This means that any two histograms can be merged exactly,
+    and quantiles are accurate to about 1/nbin of the full range of the
+    values.
+    """
+    def __init__(self, nbin=10000):
+        self.nbin = nbin
+        self.width = None
+        self.start = 0
+        self.counts = np.zeros(0)
+
+    def add(self, x, w=None):
+        if w is None:
+            w = np.ones(len(x))
+        ok = np.isfinite(x) & (w > 0)
+        x = x[ok]
+        w = w[ok]
+        if len(x) == 0:
+            return
+        low = x.min()
+        high = x.max()
+
+        if self.width is None:
+            span = max(high - low, 1e-12 * max(abs(low), abs(high)), 1e-300)
+            self.width = 2.0**np.ceil(np.log2(span / (self.nbin - 1)))
+
+        # Make the bins wide enough to cover the new values as well as
+        # the existing ones before working out any bin indices
+        while True:
+            first = np.floor(low / self.width)
+            last = np.floor(high / self.width)
+            if len(self.counts):
+                first = min(first, self.start)
+                last = max(last, self.start + len(self.counts) - 1)
+            if last - first < self.nbin:
+                break
+            self._coarsen()
+
+        index = np.floor(x / self.width).astype(np.int64)
+        start = index.min()
+        self._insert(start, np.bincount(index - start, weights=w))
+
+    def merge(self, other):
+        if other.width is None:
+            return
+        if self.width is None:
+            self.width = other.width
+            self.start = other.start
+            self.counts = other.counts.copy()
+            return
+        other_start = other.start
+        other_counts = other.counts
+        other_width = other.width
+        while self.width < other_width:
+            self._coarsen()
+        while other_width < self.width:
+            other_start, other_counts = self._coarsen_counts(other_start, other_counts)
+            other_width *= 2
+        while (max(self.start + len(self.counts), other_start + len(other_counts))
+               - min(self.start, other_start)) > self.nbin:
+            self._coarsen()
+            other_start, other_counts = self._coarsen_counts(other_start, other_counts)
+        self._insert(other_start, other_counts)
+
+    def scale(self, factor):
+        self.counts *= factor
+
+    @staticmethod
+    def _coarsen_counts(start, counts):
+        index = (start + np.arange(len(counts))) // 2
+        new_start = start // 2
+        return new_start, np.bincount(index - new_start, weights=counts)
+
+    def _coarsen(self):
+        self.start, self.counts = self._coarsen_counts(self.start, self.counts)
+        self.width *= 2
+
+    def _insert(self, start, counts):
+        if len(self.counts) == 0:
+            self.start = start
+            self.counts = counts.astype(float)
+            return
+        first = min(start, self.start)
+        last = max(start + len(counts), self.start + len(self.counts))
+        combined = np.zeros(last - first)
+        combined[self.start - first:self.start - first + len(self.counts)] += self.counts
+        combined[start - first:start - first + len(counts)] += counts
+        self.start = first
+        self.counts = combined
+
+    def percentile(self, q):
+        u"""Estimate the q'th percentile, interpolating within the bin it falls in."""
+        if self.width is None:
+            return np.nan
+        cumulative = np.concatenate([[0.0], np.cumsum(self.counts)])
+        edges = (self.start + np.arange(len(cumulative))) * self.width
+        return np.interp(q / 100.0 * cumulative[-1], cumulative, edges)
+
+
+class BestRowAccumulator(object):
+    u"""Keeps the row with the highest value in one column."""
+    def __init__(self, column):
+        self.column = column
+        self.value = -np.inf
+        self.row = None
+
+    def add(self, x, w=None):
+        if len(x) == 0:
+            return
+        values = np.where(np.isnan(x[:, self.column]), -np.inf, x[:, self.column])
+        i = values.argmax()
+        if self.row is None or values[i] > self.value:
+            self.value = values[i]
+            self.row = x[i].copy()
+
+    def merge(self, other):
+        if other.row is not None and (self.row is None or other.value > self.value):
+            self.value = other.value
+            self.row = other.row
+
+
+class ChainSummary(object):
+    u"""
+    All the accumulators for a chain, or a set of chains merged together.
+    """
+    def __init__(self, colnames, nbin=10000):
+        self.colnames = colnames
+        ncol = len(colnames)
+        self.moments = MomentAccumulator(ncol)
+        self.quantiles = [QuantileAccumulator(nbin) for i in range(ncol)]
+        if "post" in colnames:
+            self.best = BestRowAccumulator(colnames.index("post"))
+        elif "like" in colnames:
+            self.best = BestRowAccumulator(colnames.index("like"))
+        else:
+            self.best = None
+        # The moments of each separate chain, for the Gelman-Rubin test
+        self.chain_moments = []
+
+    def add(self, x, w=None):
+        self.moments.add(x, w)
+        for i, q in enumerate(self.quantiles):
+            q.add(x[:, i], w)
+        if self.best is not None:
+            self.best.add(x, w)
+
+    def scale(self, factor):
+        self.moments.scale(factor)
+        for q in self.quantiles:
+            q.scale(factor)
+
+    def merge(self, other):
+        if other.colnames != self.colnames:
+            raise ValueError("Cannot combine chains with different columns")
+        self.moments.merge(other.moments)
+        for q, other_q in zip(self.quantiles, other.quantiles):
+            q.merge(other_q)
+        if self.best is not None:
+            self.best.merge(other.best)
+        self.chain_moments += other.chain_moments
+
+    def gelman_rubin(self):
+        u"""
+        The Gelman-Rubin R-1 for each column, in the same simplified form
+        as the non-streaming version, or None if there is only one chain.
+        Unlike that version the chains are not cut to the same length.
+        """
+        if len(self.chain_moments) < 2:
+            return None
+        means = np.array([m.mean for m in self.chain_moments])
+        variances = np.array([m.variance() for m in self.chain_moments])
+        number_chains = len(self.chain_moments)
+        B_over_n = np.var(means, axis=0, ddof=1)
+        W = variances.mean(axis=0)
+        V = W + (1. + 1./number_chains) * B_over_n
+        return np.sqrt(V/W) - 1.0
+
+
+class ChainFileReader(object):
+    u"""
+    Reads the column names and metadata from a text or binary chain file,
+    and then the samples a chunk of rows at a time.  The final metadata
+    is only available once all the chunks have been read.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.binary = filename.endswith(BinaryOutput.FILE_EXTENSION)
+        self.final_metadata = {}
+        self.comments = []
+        if self.binary:
+            with open(filename[:-len(BinaryOutput.FILE_EXTENSION)] + BinaryOutput.METADATA_EXTENSION) as f:
+                info = json.load(f)
+            self.colnames = info["columns"]
+            self.metadata = info["metadata"]
+            self.comments = info["comments"]
+            self.final_metadata = info["final"]
+        else:
+            self._read_text_header()
+
+    def _read_text_header(self):
+        self.colnames = None
+        self.metadata = {}
+        with open(self.filename) as f:
+            for i, line in enumerate(f):
+                if line.strip() and not line.startswith('#'):
+                    break
+                if i == 0:
+                    self.colnames = line[1:].split()
+                elif line.strip():
+                    TextColumnOutput._parse_comment_line(line, self.metadata, self.comments)
+        if self.colnames is None:
+            raise ValueError("Could not find column names in {}".format(self.filename))
+
+    def count_rows(self):
+        u"""Quickly count the rows in the file without parsing them.
+
+        In text files a last row without a newline is not counted,
+        since it may be only partly written.
+        """
+        if self.binary:
+            with open(self.filename, "rb") as f:
+                return BinaryOutput._read_shape(f)[0]
+        rows = 0
+        with open(self.filename, "rb") as f:
+            for line in f:
+                if line.endswith(b'\n') and line.strip() and not line.startswith(b'#'):
+                    rows += 1
+        return rows
+
+    def chunks(self, chunk_rows):
+        if self.binary:
+            return self._binary_chunks(chunk_rows)
+        return self._text_chunks(chunk_rows)
+
+    def _binary_chunks(self, chunk_rows):
+        with open(self.filename, "rb") as f:
+            nrow, ncol = BinaryOutput._read_shape(f)
+        if nrow == 0:
+            return
+        data = np.memmap(self.filename, dtype=DTYPE, mode='r',
+                         offset=NPY_HEADER_LENGTH, shape=(nrow, ncol))
+        for start in range(0, nrow, chunk_rows):
+            yield np.array(data[start:start + chunk_rows])
+
+    def _text_chunks(self, chunk_rows):
+        ncol = len(self.colnames)
+        started_data = False
+        with open(self.filename, "rb") as f:
+            lines = list(itertools.islice(f, chunk_rows))
+            while lines:
+                # Read ahead so we know if this is the end of the file
+                next_lines = list(itertools.islice(f, chunk_rows))
+                body = []
+                for line in lines:
+                    if line.startswith(b'#'):
+                        # Header lines have already been read
+                        if started_data:
+                            TextColumnOutput._parse_comment_line(line.decode(), self.final_metadata, self.comments)
+                    elif line.strip():
+                        started_data = True
+                        body.append(line)
+                # A cut-off line can only be the last one in the file
+                if body and not next_lines and len(body[-1].split()) != ncol:
+                    print("Skipping last line of {} as it seems to have been cut off".format(self.filename))
+                    body = body[:-1]
+                lines = next_lines
+                if not body:
+                    continue
+                values = np.fromstring(b' '.join(body), sep=' ')
+                if values.size != len(body) * ncol:
+                    raise ValueError("Your chain file {} is corrupted somehow: not all the lines have {} columns".format(self.filename, ncol))
+                yield values.reshape((len(body), ncol))
+
+
+class RowReader(object):
+    u"""
+    Gives out the rows from an iterator over chunks of them, such as
+    ChainFileReader.chunks, any number at a time.
+    """
+    def __init__(self, chunks, ncol):
+        self.chunks = chunks
+        self.buffer = np.zeros((0, ncol))
+
+    def read(self, n):
+        u"""Return the next n rows, or all the remaining ones if there are fewer."""
+        chunks = [self.buffer]
+        count = len(self.buffer)
+        while count < n:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+            count += len(chunk)
+        rows = np.concatenate(chunks)
+        self.buffer = rows[n:]
+        return rows[:n]
+
+
+def summarise_chain_file(filename, sampler, burn=0.0, thin=1, chunk_rows=100000, nbin=10000):
+    u"""
+    Read a chain file in chunks and return a ChainSummary of it.
+    Weighted chains use their weight or log_weight columns (and any
+    old_weight from importance sampling); for others the burn and thin
+    options are applied, as in the non-streaming postprocessor.
+    """
+    reader = ChainFileReader(filename)
+    colnames = [c.lower() for c in reader.colnames]
+    summary = ChainSummary(colnames, nbin)
+    chain_moments = MomentAccumulator(len(colnames))
+
+    weight_index = colnames.index("weight") if "weight" in colnames else None
+    log_weight_index = colnames.index("log_weight") if "log_weight" in colnames else None
+    old_weight_index = colnames.index("old_weight") if "old_weight" in colnames else None
+    old_log_weight_index = colnames.index("old_log_weight") if "old_log_weight" in colnames else None
+    weighted = (weight_index is not None) or (log_weight_index is not None)
+
+    if sampler in UNBURNED_SAMPLERS:
+        burn = 0
+        thin = 1
+    if 0.0 < burn < 1.0:
+        burn = int(reader.count_rows() * burn)
+    else:
+        burn = int(burn)
+    walkers = int(reader.metadata.get("walkers", 1)) if sampler in WALKER_SAMPLERS else 1
+
+    # Log weights are exponentiated relative to the largest seen so far,
+    # and everything is rescaled whenever a larger one turns up.
+    log_weight_offset = None
+
+    row = 0
+    for chunk in reader.chunks(chunk_rows):
+        index = row + np.arange(len(chunk))
+        row += len(chunk)
+        keep = (index >= burn) & (((index - burn) // walkers) % thin == 0)
+        chunk = chunk[keep]
+        if len(chunk) == 0:
+            continue
+
+        if not weighted:
+            w = None
+        else:
+            logw = np.zeros(len(chunk))
+            if weight_index is not None:
+                with np.errstate(divide='ignore'):
+                    logw += np.log(chunk[:, weight_index])
+            else:
+                logw += chunk[:, log_weight_index]
+            if old_weight_index is not None:
+                with np.errstate(divide='ignore'):
+                    logw += np.log(chunk[:, old_weight_index])
+            elif old_log_weight_index is not None:
+                logw += chunk[:, old_log_weight_index]
+            logw[~np.isfinite(logw)] = -np.inf
+            chunk_max = logw.max()
+            if not np.isfinite(chunk_max):
+                continue
+            if log_weight_offset is None:
+                log_weight_offset = chunk_max
+            elif chunk_max > log_weight_offset:
+                factor = np.exp(log_weight_offset - chunk_max)
+                summary.scale(factor)
+                chain_moments.scale(factor)
+                log_weight_offset = chunk_max
+            w = np.exp(logw - log_weight_offset)
+
+        summary.add(chunk, w)
+        chain_moments.add(chunk, w)
+
+    if not weighted:
+        summary.chain_moments = [chain_moments]
+    summary.metadata = reader.metadata
+    summary.final_metadata = reader.final_metadata
+    summary.weighted = weighted
+    summary.log_weight_offset = log_weight_offset
+    return summary
+
+
+def _summarise_chain_file(args):
+    return summarise_chain_file(*args)
+
+
+def summarise_chains(filenames, sampler, burn=0.0, thin=1, chunk_rows=100000, procs=1, nbin=10000):
+    u"""
+    Summarise each of the chain files, in parallel if procs>1, and merge
+    the results.
+    """
+    tasks = [(filename, sampler, burn, thin, chunk_rows, nbin) for filename in filenames]
+    if procs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(min(procs, len(tasks))) as executor:
+            summaries = list(executor.map(_summarise_chain_file, tasks))
+    else:
+        summaries = [_summarise_chain_file(task) for task in tasks]
+
+    # Put weights from the different files on the same scale before merging
+    offsets = [s.log_weight_offset for s in summaries if s.log_weight_offset is not None]
+    if offsets:
+        top = max(offsets)
+        for s in summaries:
+            if s.log_weight_offset is not None:
+                s.scale(np.exp(s.log_weight_offset - top))
+
+    summary = summaries[0]
+    for other in summaries[1:]:
+        summary.merge(other)
+    return summary
+
+
+def chain_files_for_input(filename, force_text=False):
+    u"""
+    Find the sampler name and the chain files from a command-line argument
+    to cosmosis-postprocess, which can be a chain file or the parameter
+    file that made it.
+    """
+    is_chain = force_text or filename.endswith(TextColumnOutput.FILE_EXTENSION) \
+        or filename.endswith(BinaryOutput.FILE_EXTENSION)
+    if is_chain:
+        base = filename
+        binary = filename.endswith(BinaryOutput.FILE_EXTENSION)
+        sampler = None
+    else:
+        ini = Inifile(filename)
+        sampler = ini.get("runtime", "sampler")
+        base = ini.get("output", "filename")
+        output_format = ini.get("output", "format", fallback="text")
+        if output_format not in ["text", "txt", "binary", "npy"]:
+            raise ValueError("Streaming postprocessing only works with text and binary chains")
+        binary = output_format in ["binary", "npy"]
+
+    extension = BinaryOutput.FILE_EXTENSION if binary else TextColumnOutput.FILE_EXTENSION
+    if base.endswith(extension):
+        base = base[:-len(extension)]
+    if os.path.exists(base + extension):
+        filenames = [base + extension]
+    elif os.path.exists(base) and not binary:
+        filenames = [base]
+    else:
+        filenames = chain_files(base, extension)
+        if not filenames:
+            raise RuntimeError("No datafiles found starting with %s!" % base)
+
+    if sampler is None:
+        metadata = ChainFileReader(filenames[0]).metadata
+        sampler = metadata.get("sampler", "metropolis")
+    return sampler, filenames
+
+
+class StreamingStatistics(object):
+    u"""
+    Prints and saves the statistics from a ChainSummary, in the same
+    format as the usual postprocessing statistics files.  Use mode="a"
+    to add to the files from a previous chain rather than replacing them.
+    """
+    def __init__(self, summary, name, outdir=".", prefix="", mode="w"):
+        self.summary = summary
+        self.mode = mode
+        self.name = name
+        self.outdir = outdir
+        self.prefix = prefix + "_" if prefix else ""
+        moments = summary.moments
+        self.colnames = summary.colnames
+        self.mu = moments.mean
+        self.sigma = np.sqrt(moments.variance())
+        self.median = [q.percentile(50.) for q in summary.quantiles]
+        self.l68 = [q.percentile(32.) for q in summary.quantiles]
+        self.u68 = [q.percentile(68.) for q in summary.quantiles]
+        self.l95 = [q.percentile(5.) for q in summary.quantiles]
+        self.u95 = [q.percentile(95.) for q in summary.quantiles]
+
+    def filename(self, base):
+        return "{0}/{1}{2}.txt".format(self.outdir, self.prefix, base)
+
+    def _write_columns(self, base, header, line_format, *columns):
+        filename = self.filename(base)
+        with open(filename, self.mode) as f:
+            f.write(header + "\n")
+            f.write("#%s\n" % self.name)
+            for P in zip(self.colnames, *columns):
+                f.write(line_format % P)
+        return filename
+
+    def run(self):
+        summary = self.summary
+        print("Samples after cutting:", summary.moments.count)
+        print()
+        print("Marginalized mean, std-dev:")
+        for P in zip(self.colnames, self.mu, self.sigma):
+            print('    %s = %g ± %g ' % P)
+        print()
+        print("Marginalized median, std-dev:")
+        for P in zip(self.colnames, self.median, self.sigma):
+            print('    %s = %g ± %g' % P)
+        print()
+
+        files = [
+            self._write_columns("means", "#parameter mean std_dev", "%s   %e   %e\n", self.mu, self.sigma),
+            self._write_columns("medians", "#parameter median std_dev", "%s   %e   %e\n", self.median, self.sigma),
+            self._write_columns("low95", "#parameter low95", "%s     %g\n", self.l95),
+            self._write_columns("upper95", "#parameter upper95", "%s     %g\n", self.u95),
+            self._write_columns("low68", "#parameter low68", "%s     %g\n", self.l68),
+            self._write_columns("upper68", "#parameter upper68", "%s     %g\n", self.u68),
+        ]
+
+        if summary.best is not None and summary.best.row is not None:
+            print("Best likelihood:")
+            for name, val in zip(self.colnames, summary.best.row):
+                print('    %s = %g' % (name, val))
+            print()
+            files.append(self._write_columns("best_fit", "#parameter value", "%s        %g\n", summary.best.row))
+
+        files += self.write_covariance()
+        files += self.write_gelman_rubin()
+        return files
+
+    def write_covariance(self):
+        index = [i for i, c in enumerate(self.colnames) if c not in NON_PARAMETER_COLUMNS]
+        if len(index) < 2 or self.summary.moments.weight == 0:
+            return []
+        if self.mode == "a":
+            print("NOT saving more than one covariance matrix - just using first chain")
+            return []
+        covmat = self.summary.moments.covariance()[index][:, index]
+        names = [self.colnames[i] for i in index]
+        filename = self.filename("covmat")
+        with open(filename, "w") as f:
+            f.write('#' + '    '.join(names) + '\n')
+            np.savetxt(f, covmat)
+        files = [filename]
+        n = self.summary.metadata.get("n_varied")
+        if n is not None:
+            n = int(n)
+            filename = self.filename("proposal")
+            with open(filename, "w") as f:
+                f.write('#' + '    '.join(names[:n]) + '\n')
+                np.savetxt(f, covmat[:n, :n])
+            files.append(filename)
+        return files
+
+    def write_gelman_rubin(self):
+        R1 = self.summary.gelman_rubin()
+        if R1 is None:
+            return []
+        filename = self.filename("gelman")
+        print("Gelman-Rubin tests")
+        print("------------------")
+        print("(Variance of means / Mean of variances.  Smaller is better, a few percent is usually good convergence)")
+        print()
+        with open(filename, self.mode) as f:
+            f.write("#parameter   R-1\n")
+            for name, r in zip(self.colnames, R1):
+                if name in ['weight', 'like', 'post']:
+                    continue
+                f.write("{}   {}\n".format(name, r))
+                if r > 0.1:
+                    print("{}    {}  -- POORLY CONVERGED PARAMETER AT 10% LEVEL".format(name, r))
+                else:
+                    print("{}    {}".format(name, r))
+        print()
+        return [filename]
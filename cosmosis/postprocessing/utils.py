@@ -1,3 +1,4 @@
+import itertools
 import numpy as np
 
 def std_weight(x, w):
@@ -85,3 +86,79 @@ def find_asymmetric_errorbars(levels, v, weights=None):
         limits.append((low,high))
 
     return peak1d, limits
+
+
+class AdaptiveGrid(object):
+    """
+    The samples from an adaptive grid run, which are the centres of
+    boxes in parameter space of different sizes.  Each box is a third
+    of the size of its parent along each axis, and the grid_level
+    column says how many times it was divided.
+
+    A sample whose box was refined also appears at the next level,
+    as the centre of the middle child box.  Only the copy at the
+    finest level is used.
+    """
+    def __init__(self, cols, post, levels):
+        levels = np.round(levels).astype(int)
+        self.ndim = len(cols)
+        self.finest = levels.max()
+        scale = 3**self.finest
+
+        # Work out the finest grid along each axis from the
+        # coarse level, which covers the whole space
+        self.grids = []
+        centres = []
+        for x in cols:
+            coarse = np.unique(x[levels==0])
+            if len(coarse) < 2:
+                raise ValueError("Adaptive grids need at least two coarse points per dimension")
+            h = (coarse[-1] - coarse[0]) / (len(coarse) - 1)
+            lower = coarse[0] - 0.5*h
+            step = h / scale
+            n = len(coarse) * scale
+            self.grids.append(lower + (np.arange(n) + 0.5) * step)
+            centres.append(np.round((x - lower) / step - 0.5).astype(int))
+        centres = np.array(centres).T
+
+        # Keep just the finest copy of each point
+        order = np.argsort(-levels, kind='stable')
+        _, first = np.unique(centres[order], axis=0, return_index=True)
+        leaf = np.zeros(len(levels), dtype=bool)
+        leaf[order[first]] = True
+
+        self.centres = centres[leaf]
+        self.levels = levels[leaf]
+        self.side = 3**(self.finest - self.levels)
+        self.like = np.exp(post[leaf] - post[leaf].max())
+        self.leaf = leaf
+
+    def weights(self):
+        """
+        The posterior mass of each sample, including the ones that
+        are not used, which get zero weight.
+        """
+        w = np.zeros(len(self.leaf))
+        w[self.leaf] = self.like * self.side.astype(float)**self.ndim
+        return w
+
+    def marginal(self, dims):
+        """
+        Marginalise the posterior onto the finest grid in the given
+        dimensions.  The mass of each box is spread evenly over the
+        cells of the finest grid that it covers.
+
+        Returns the list of grid values along each dimension and the
+        (un-normalized) marginal posterior, with one axis for each.
+        """
+        k = len(dims)
+        marginal = np.zeros([len(self.grids[d]) for d in dims])
+        for side in np.unique(self.side):
+            w = self.side == side
+            mass = self.like[w] * float(side)**(self.ndim - k)
+            centres = [self.centres[w, d] for d in dims]
+            half = side // 2
+            for offset in itertools.product(range(-half, half+1), repeat=k):
+                index = tuple(c + o for c, o in zip(centres, offset))
+                np.add.at(marginal, index, mass)
+        return [self.grids[d] for d in dims], marginal
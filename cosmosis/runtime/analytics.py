@@ -33,6 +33,17 @@ class Analytics(object):
 
         self.total_steps += traces.shape[0]
 
+    def covariance(self):
+        """
+        The covariance matrix of the traces added so far to this
+        process, or None if there are fewer than two of them.
+        """
+        if self.total_steps < 2:
+            return None
+        C = self.cov_times_n / float(self.total_steps - 1)
+        # Rounding errors in the updates can leave it slightly asymmetric
+        return 0.5 * (C + C.T)
+
     def trace_means(self):
         if self.pool:
             return np.array(self.pool.gather(self.means)).T
@@ -0,0 +1,316 @@
+#coding: utf-8
+u"""Definition of :class:`BlockDiskCache`, a persistent cache of pipeline results,
+and :class:`SetupDiskCache`, a persistent cache of module setup results."""
+
+import os
+import sys
+import hashlib
+import json
+import pickle
+import tempfile
+import zipfile
+from ..utils import mkdir
+from ..datablock import BlockError
+
+
+def update_module_hash(h, module, options):
+    u"""Add a module's name, file, and the options in its section to the hash `h`."""
+    h.update(module.name.encode('utf-8'))
+    h.update(str(module.filename).encode('utf-8'))
+    if options.has_section(module.name):
+        for key, value in sorted(options.items(module.name)):
+            h.update("\0{}={}".format(key, value).encode('utf-8'))
+
+
+class BlockDiskCache(object):
+    """
+    A cache of the block as it is after selected modules, stored in a
+    directory so that it can be shared between runs and between MPI
+    processes on the same file system.
+
+    Each saved block is keyed by a hash of the values in the starting
+    block that were read by the modules up to and including the one it
+    was saved after, together with the configuration of those modules.
+    So changing a parameter that is only used later in the pipeline
+    does not stop the earlier results being used.  Which values each
+    module reads is taken from the block log the first time the
+    pipeline is run, and saved in the directory alongside the results;
+    like the fast/slow split, this assumes that modules always read
+    the same parameters.
+
+    Files are written atomically, so several processes can safely use
+    the same directory.  When the directory grows beyond `size_limit`
+    bytes (zero meaning no limit) the least recently used files are
+    deleted.
+
+    Note that changes to a module's code or to data files it reads are
+    not detected - clear the directory if you change those.
+    """
+    suffix = ".npz"
+
+    def __init__(self, cache_dir, modules, options, cache_indices, size_limit=0):
+        self.cache_dir = cache_dir
+        self.cache_indices = sorted(cache_indices)
+        self.size_limit = size_limit
+        mkdir(cache_dir)
+
+        # Hash the configuration of each module, chained so that the
+        # hash for each module includes all the ones before it
+        self.config_hashes = []
+        h = hashlib.sha1()
+        for module in modules:
+            update_module_hash(h, module, options)
+            self.config_hashes.append(h.hexdigest())
+
+        # The (section, name) keys from the starting block read by all
+        # the modules up to each cached one, or None until we know them
+        self.inputs = {i: self._load_inputs(i) for i in self.cache_indices}
+        self.start_block = None
+        self.input_hashes = {}
+        self.started_from = None
+        self.learning = False
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        self.total_size = self._scan()[1]
+
+    def _scan(self):
+        files = []
+        total = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Probably removed by another process
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        return files, total
+
+    def filename(self, module_index):
+        h = hashlib.sha1(self.input_hashes[module_index].encode('utf-8'))
+        h.update(self.config_hashes[module_index].encode('utf-8'))
+        return os.path.join(self.cache_dir, h.hexdigest() + self.suffix)
+
+    def inputs_filename(self, module_index):
+        return os.path.join(self.cache_dir, "inputs_{}.json".format(self.config_hashes[module_index]))
+
+    def _load_inputs(self, module_index):
+        try:
+            with open(self.inputs_filename(module_index)) as f:
+                return [tuple(key) for key in json.load(f)]
+        except (OSError, ValueError):
+            return None
+
+    def _save_inputs(self, module_index):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.inputs[module_index], f)
+            os.replace(tmp_path, self.inputs_filename(module_index))
+        except OSError as error:
+            sys.stderr.write("Could not save cache inputs for module {}: {}\n".format(module_index, error))
+            self.errors += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _hash_inputs(self, module_index):
+        keys = self.inputs[module_index]
+        h = hashlib.sha1(json.dumps(keys).encode('utf-8'))
+        try:
+            h.update("{:016x}".format(self.start_block.hash_values(keys)).encode('utf-8'))
+        except BlockError:
+            # This run does not have all the values read in the run that
+            # we learned the inputs from, so we cannot use the cache
+            return None
+        return h.hexdigest()
+
+    def needs_log(self):
+        u"""Whether the next run needs its block log, to learn the inputs of a cached module."""
+        return any(inputs is None for inputs in self.inputs.values())
+
+    def hash_inputs(self, block):
+        # This must be called on the starting block before anything else
+        # is added to it.  Keeping a copy of it is cheap, since the values
+        # are shared with it unless they are changed.
+        self.start_block = block.clone()
+        self.started_from = None
+        self.input_hashes = {}
+        for module_index, inputs in self.inputs.items():
+            if inputs is not None:
+                self.input_hashes[module_index] = self._hash_inputs(module_index)
+
+    def start_pipeline(self, block, first_module=0):
+        """
+        Look for the latest saved result that would let us skip more
+        than the first `first_module` modules.  If one is found, copy
+        the values it contains into the block, and return the index of
+        the module to start from.  Otherwise return first_module.
+        """
+        for module_index in reversed(self.cache_indices):
+            if module_index < first_module:
+                break
+            if self.input_hashes.get(module_index) is None:
+                continue
+            path = self.filename(module_index)
+            if not os.path.exists(path):
+                continue
+            try:
+                block.update_from_npz(path, replace=False)
+                os.utime(path)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as error:
+                # Most likely evicted or corrupted while we were reading.
+                sys.stderr.write("Could not read cached block {}: {}\n".format(path, error))
+                self.errors += 1
+                continue
+            self.hits += 1
+            self.started_from = module_index
+            self.learning = True
+            return module_index + 1
+        self.misses += 1
+        # If some earlier modules were skipped another way then the log
+        # will not show what they read
+        self.learning = (first_module == 0)
+        return first_module
+
+    def learn_inputs(self, module_index, block):
+        # The starting values that have been read so far, from the block log.
+        # Any modules we skipped by starting from a cached result read the
+        # inputs of that result.
+        start_keys = set(self.start_block.keys())
+        inputs = set()
+        if self.started_from is not None:
+            inputs.update(self.inputs[self.started_from])
+        for i in range(block.get_log_count()):
+            log_type, section, name, _ = block.get_log_entry(i)
+            if log_type == "READ-OK" and (section, name) in start_keys:
+                inputs.add((section, name))
+        self.inputs[module_index] = sorted(inputs)
+        self._save_inputs(module_index)
+        self.input_hashes[module_index] = self._hash_inputs(module_index)
+
+    def next_module_results(self, module_index, block):
+        if self.start_block is None or module_index not in self.cache_indices:
+            return
+        if self.inputs[module_index] is None:
+            if not self.learning or block.get_log_level() == block.LOG_OFF:
+                return
+            self.learn_inputs(module_index, block)
+        if self.input_hashes.get(module_index) is None:
+            return
+        path = self.filename(module_index)
+        if os.path.exists(path):
+            return
+        # Write to a temporary file first and then move it into place,
+        # so that other processes never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                block.save_to_npz(f)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError) as error:
+            sys.stderr.write("Could not save block to cache after module {}: {}\n".format(module_index, error))
+            self.errors += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.writes += 1
+        self.total_size += os.path.getsize(path)
+        if self.size_limit and self.total_size > self.size_limit:
+            self.evict()
+
+    def evict(self):
+        # Rescan, since other processes may also have been writing
+        files, total = self._scan()
+        files.sort()
+        for _, size, path in files:
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self.total_size = total
+
+    def report(self):
+        print("")
+        print("Disk cache usage in {}:".format(self.cache_dir))
+        print("    Hits: {}  Misses: {}  Writes: {}  Evicted: {}  Errors: {}".format(
+            self.hits, self.misses, self.writes, self.evictions, self.errors))
+        print("    Size: {:.1f} MB".format(self.total_size / 1024**2))
+        print("")
+
+
+
+class SetupDiskCache(object):
+    """
+    A cache of the results of module setup functions, stored in a
+    directory, so that modules which take a long time to set up (for
+    example to load large data files) only need to do it once.
+
+    Each result (the data returned by the setup function and any
+    parameters the module registered) is pickled, keyed by a hash of
+    the module's name, file, and options.  As with
+    :class:`BlockDiskCache` changes to a module's code or to the data
+    files it reads are not detected - clear the directory if you change
+    those.
+    """
+    suffix = ".pkl"
+
+    def __init__(self, cache_dir, options):
+        self.cache_dir = cache_dir
+        self.options = options
+        mkdir(cache_dir)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def filename(self, module):
+        h = hashlib.sha1()
+        update_module_hash(h, module, self.options)
+        return os.path.join(self.cache_dir, "{}_{}{}".format(module.name, h.hexdigest(), self.suffix))
+
+    def load(self, module):
+        """
+        Return (True, result) if there is a saved setup result for the
+        module, and (False, None) if not.
+        """
+        path = self.filename(module)
+        if not os.path.exists(path):
+            self.misses += 1
+            return False, None
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except Exception as error:
+            # Unpickling can fail in all sorts of ways if a module has
+            # changed since the file was saved; just run the setup instead.
+            sys.stderr.write("Could not read saved setup for module {} from {}: {}\n".format(module.name, path, error))
+            self.errors += 1
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, result
+
+    def save(self, module, result):
+        path = self.filename(module)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as error:
+            sys.stderr.write("Could not save setup for module {} to {}: {}\n".format(module.name, path, error))
+            self.errors += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.writes += 1
@@ -72,6 +72,14 @@ class Module(object):
     The optional /cleanup/ function is also passed the /setup/ʼs `data` object
     (only), and so may free any resources which that object clings on to.
 
+    Python modules may also define an /execute_batch/ function (named after
+    the execute function with "_batch" appended, or attached to the execute
+    function as its `execute_batch` attribute), which is called with a
+    list of :class:`DataBlock` objects (and the setup `data`) and returns a
+    list of statuses, one per block.  This lets a module vectorize its work
+    over many parameter sets when the pipeline is run in batch mode; modules
+    without one are just run on each block in turn.
+
     """
 
     def __init__(self, module_name, file_path,
@@ -93,6 +101,7 @@ class Module(object):
         self.setup_function = setup_function
         self.execute_function = execute_function
         self.cleanup_function = cleanup_function
+        self.execute_batch_function = execute_function + "_batch"
 
         # identify module filename
         filename = file_path
@@ -209,6 +218,21 @@ class Module(object):
         else:
             self.data = None
 
+        self.load_execute_functions()
+
+    def setup_with_data(self, data):
+        u"""Finish setting up the module using `data` as the result of its setup function.
+
+        This is used instead of :func:`setup` when the setup function
+        was run somewhere else, for example by another MPI process, or
+        in an earlier run whose result was saved.
+
+        """
+        self.data = data
+        self.load_execute_functions()
+
+    def load_execute_functions(self):
+        u"""Load the `execute_function`, once we know whether it needs the setup data."""
         if self.data is not None:
             module_type = MODULE_TYPE_EXECUTE_CONFIG
         else:
@@ -222,6 +246,15 @@ class Module(object):
             raise ValueError("Could not find a function 'execute' in module '"
                                  +  self.name + "'")
 
+        # The optional vectorized version only makes sense for python
+        if self.is_python:
+            self.execute_batch_function = (
+                self.load_function(self.library, self.execute_batch_function,
+                                   module_type, set_types=False)
+                or getattr(self.execute_function, "execute_batch", None))
+        else:
+            self.execute_batch_function = None
+
     def setup(self, config, quiet=True):
         u"""Call the /Module/ after copying config information constructor.
         
@@ -252,6 +285,26 @@ class Module(object):
 
 
 
+    def execute_batch(self, data_blocks):
+        u"""Run the module on each of a list of blocks, and return a list of statuses.
+
+        If the module has an /execute_batch/ function then it is called
+        once on the whole list; otherwise /execute/ is called on each block.
+
+        """
+        if not getattr(self, 'execute_batch_function', None):
+            return [self.execute(data_block) for data_block in data_blocks]
+        if not hasattr(self, 'data'):
+            raise RuntimeError("Must set up module before executing it")
+        if self.data is not None:
+            status = self.execute_batch_function(data_blocks, self.data)
+        else:
+            status = self.execute_batch_function(data_blocks)
+        # Allow a single status for the whole batch
+        if status is None or np.isscalar(status):
+            return [status for data_block in data_blocks]
+        return list(status)
+
     def cleanup(self):
         u"""Run the /cleanup/ function.
 
@@ -398,7 +451,7 @@ class FunctionModule(Module):
     """
 
     def __init__(self, name, setup_function, execute_function,
-                 cleanup_function=None):
+                 cleanup_function=None, execute_batch_function=None):
         """
         Initialize the subclass from the functions themselves.
 
@@ -413,6 +466,11 @@ class FunctionModule(Module):
         def execute(block, config):
             ...
             return 0
+
+        execute_batch_function is optional, and if set should be
+        def execute_batch(blocks, config):
+            ...
+            return [0 for block in blocks]
     
         """
         self.name = name
@@ -421,6 +479,7 @@ class FunctionModule(Module):
         self.setup_function = setup_function
         self.execute_function = execute_function
         self.cleanup_function = cleanup_function
+        self.execute_batch_function = execute_batch_function
 
         self.library = None
 
@@ -458,8 +517,16 @@ class ClassModule(metaclass=abc.ABCMeta):
             mod.execute(block)
             return 0
 
+        # Classes can optionally implement execute_batch(blocks)
+        if hasattr(cls, "execute_batch"):
+            def execute_batch(blocks, mod):
+                mod.execute_batch(blocks)
+                return 0
+        else:
+            execute_batch = None
+
         def cleanup(mod):
             mod.cleanup()
 
 
-        return FunctionModule(name, setup, execute, cleanup)
+        return FunctionModule(name, setup, execute, cleanup, execute_batch)
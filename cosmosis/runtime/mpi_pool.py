@@ -1,3 +1,7 @@
+import time
+from .pool_future import PoolFuture
+
+
 class _close_pool_message(object):
     def __repr__(self):
         return "<Close pool message>"
@@ -9,13 +13,43 @@ class _function_wrapper(object):
         self.callback = callback
 
 
+class _task_chunk(object):
+    # A chunk of tasks sent in dynamic mode, labelled with the index of
+    # its first task so the results can be put back in order.
+    def __init__(self, start, tasks):
+        self.start = start
+        self.tasks = tasks
+
+
 def _error_function(task):
     raise RuntimeError("Pool was sent tasks before being told what "
                        "function to apply.")
 
 
 class MPIPool(object):
-    def __init__(self, debug=False):
+    """
+    A pool of MPI processes, in which the master (rank 0) runs the
+    sampler and farms out likelihood evaluations to the others.
+
+    By default map splits the tasks evenly between the processes before
+    running them.  In dynamic mode the master instead hands out chunks
+    of tasks to each worker as it finishes the previous one, which keeps
+    everything busy when some points take much longer than others.
+    Chunks are `chunksize` tasks long, or if that is zero start at a
+    quarter of each worker's share of what is left and shrink towards
+    one task as the map proceeds.  If `master_works` is set the master
+    runs tasks itself, one at a time, between handing out chunks.
+
+    Tasks can also be run one at a time with submit, and their results
+    collected in the order they finish with as_completed.  Each is sent
+    to a worker as soon as one is free.  The master does not run these
+    tasks unless it is the only process.  Don't call map while any
+    submitted tasks are unfinished.
+
+    The time each process spends running tasks and waiting for them is
+    recorded, and a summary is printed when the pool is finished with.
+    """
+    def __init__(self, debug=False, dynamic=False, chunksize=0, master_works=True):
         try:
             from mpi4py import MPI
             self.MPI = MPI
@@ -26,20 +60,54 @@ class MPIPool(object):
         self.rank = self.comm.Get_rank()
         self.size = self.comm.Get_size()
         self.debug = debug
+        self.dynamic = dynamic
+        self.chunksize = chunksize
+        self.master_works = master_works
 
         self.function = _error_function
         self.callback = None
 
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.task_count = 0
+
+        # For tasks run with submit
+        self.futures = {}
+        self.next_future_id = 0
+        self.queued = []
+        self.idle_workers = list(range(1, self.size))
+        self.worker_functions = {}
+
     def is_master(self):
         return self.rank == 0
 
+    def _run_tasks(self, tasks):
+        t0 = time.time()
+        if self.callback:
+            def compose(x):
+                result = self.function(x)
+                self.callback(x, result)
+                return result
+            results = list(map(compose, tasks))
+        else:
+            results = list(map(self.function, tasks))
+        self.busy_time += time.time() - t0
+        self.task_count += len(tasks)
+        return results
+
+    def _recv(self, source, status=None):
+        t0 = time.time()
+        message = self.comm.recv(source=source, tag=self.MPI.ANY_TAG,
+                                 status=status)
+        self.idle_time += time.time() - t0
+        return message
+
     def wait(self):
         if self.is_master():
             raise RuntimeError("Master node told to await jobs")
         status = self.MPI.Status()
         while True:
-            task = self.comm.recv(source=0, tag=self.MPI.ANY_TAG,
-                                  status=status)
+            task = self._recv(0, status)
 
             if isinstance(task, _close_pool_message):
                 break
@@ -49,14 +117,10 @@ class MPIPool(object):
                 self.callback = task.callback
                 continue
 
-            if self.callback:
-                def compose(x):
-                    result = self.function(x)
-                    self.callback(x, result)
-                    return result
-                results = list(map(compose, task))
+            if isinstance(task, _task_chunk):
+                results = (task.start, self._run_tasks(task.tasks))
             else:
-                results = list(map(self.function, task))
+                results = self._run_tasks(task)
             self.comm.send(results, dest=0, tag=status.tag)
 
     def map(self, function, tasks, callback=None):
@@ -74,6 +138,10 @@ class MPIPool(object):
             requests = [self.comm.send(F, dest=i)
                         for i in range(1, self.size)]
             #self.MPI.Request.waitall(requests)
+            self.worker_functions = {i: function for i in range(1, self.size)}
+
+        if self.dynamic and self.size > 1:
+            return self._dynamic_map(tasks)
 
         # distribute tasks to workers
         requests = []
@@ -83,24 +151,127 @@ class MPIPool(object):
 
         # process local work
         results = [None]*len(tasks)
-
-        if self.callback:
-            def compose(x):
-                result = self.function(x)
-                self.callback(x, result)
-                return result
-            results[::self.size] = list(map(compose, tasks[::self.size]))
-        else:
-            results[::self.size] = list(map(self.function, tasks[::self.size]))
+        results[::self.size] = self._run_tasks(tasks[::self.size])
 
         # recover results from workers (in any order)
         status = self.MPI.Status()
         for i in range(self.size-1):
-            result = self.comm.recv(source=self.MPI.ANY_SOURCE,
-                                    status=status)
+            result = self._recv(self.MPI.ANY_SOURCE, status)
             results[status.source::self.size] = result
         return results
 
+    def _next_chunk_size(self, remaining):
+        if self.chunksize:
+            return self.chunksize
+        nproc = self.size if self.master_works else self.size - 1
+        return max(1, remaining // (4 * nproc))
+
+    def _dynamic_map(self, tasks):
+        results = [None]*len(tasks)
+        next_task = 0
+        running = 0
+
+        def next_chunk(size=None):
+            nonlocal next_task
+            start = next_task
+            if size is None:
+                size = self._next_chunk_size(len(tasks) - start)
+            next_task = min(len(tasks), start + size)
+            return _task_chunk(start, tasks[start:next_task])
+
+        # Give every worker something to start with
+        for i in range(1, self.size):
+            if next_task == len(tasks):
+                break
+            self.comm.send(next_chunk(), dest=i)
+            running += 1
+
+        status = self.MPI.Status()
+        while running:
+            # Do some work ourselves if there is any left and no
+            # worker is waiting for more.  We only take one task at a
+            # time so that workers are not kept waiting long.
+            if (self.master_works and next_task < len(tasks)
+                    and not self.comm.Iprobe(source=self.MPI.ANY_SOURCE)):
+                chunk = next_chunk(1)
+                results[chunk.start:next_task] = self._run_tasks(chunk.tasks)
+                continue
+
+            start, chunk_results = self._recv(self.MPI.ANY_SOURCE, status)
+            results[start:start+len(chunk_results)] = chunk_results
+            running -= 1
+
+            if next_task < len(tasks):
+                self.comm.send(next_chunk(), dest=status.source)
+                running += 1
+
+        # There may be some left if the master is supposed to be working
+        # but there were no other processes running
+        if next_task < len(tasks):
+            results[next_task:] = self._run_tasks(tasks[next_task:])
+
+        return results
+
+    def submit(self, function, task):
+        """
+        Queue function(task) to be run on a worker, and return a PoolFuture
+        that will hold the result.
+        """
+        future = PoolFuture(function, task)
+        future_id = self.next_future_id
+        self.next_future_id += 1
+        self.futures[future_id] = future
+        self.queued.append(future_id)
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        # Send queued tasks to any idle workers
+        while self.queued and self.idle_workers:
+            worker = self.idle_workers.pop(0)
+            future_id = self.queued.pop(0)
+            future = self.futures[future_id]
+            if self.worker_functions.get(worker) is not future.function:
+                self.comm.send(_function_wrapper(future.function), dest=worker)
+                self.worker_functions[worker] = future.function
+                # The workers no longer all have the same function,
+                # so map will have to send it again.
+                self.function = _error_function
+            self.comm.send(_task_chunk(future_id, [future.task]), dest=worker)
+
+    def as_completed(self, futures):
+        """
+        Yield each of the futures from submit as its task finishes.
+        """
+        waiting = set()
+        for future in futures:
+            if future.done():
+                yield future
+            else:
+                waiting.add(future)
+
+        # With no workers we have to do everything ourselves
+        if self.size == 1:
+            while self.queued:
+                future = self.futures.pop(self.queued.pop(0))
+                self.function = future.function
+                self.callback = None
+                future.set_result(self._run_tasks([future.task])[0])
+                if future in waiting:
+                    waiting.remove(future)
+                    yield future
+
+        status = self.MPI.Status()
+        while waiting:
+            future_id, result = self._recv(self.MPI.ANY_SOURCE, status)
+            self.idle_workers.append(status.source)
+            self._dispatch()
+            future = self.futures.pop(future_id)
+            future.set_result(result[0])
+            if future in waiting:
+                waiting.remove(future)
+                yield future
+
     def gather(self, data, root=0):
         return self.comm.gather(data, root)
 
@@ -118,8 +289,40 @@ class MPIPool(object):
             for i in range(1, self.size):
                 self.comm.isend(_close_pool_message(), dest=i)
 
+    def report(self):
+        """
+        Collect the time each process spent running and waiting for tasks,
+        and print a summary from the master.  Must be called by every process.
+        """
+        stats = self.comm.gather((self.busy_time, self.idle_time, self.task_count))
+        if not self.is_master():
+            return
+        print("")
+        print("MPI process usage (time in seconds):")
+        print("    Rank       Busy       Idle   Tasks")
+        for rank, (busy, idle, count) in enumerate(stats):
+            print("    {:4d} {:10.1f} {:10.1f} {:7d}".format(rank, busy, idle, count))
+        # Efficiency of the workers - the master may be running the
+        # sampler rather than waiting when it is not busy with tasks.
+        busy = sum(s[0] for s in stats[1:])
+        total = busy + sum(s[1] for s in stats[1:])
+        if total > 0:
+            print("Worker efficiency: {:.1f}%".format(100 * busy / total))
+        print("")
+
     def __enter__(self):
         return self
 
-    def __exit__(self, *args):
+    def __exit__(self, exc_type, *args):
         self.close()
+        if self.size == 1:
+            return
+        # If something has gone wrong on a worker then the master may
+        # never get as far as this, so don't wait for it.  The master
+        # does always get here, since closing the pool lets the workers
+        # finish, but it should only collect the report if everything
+        # went well, so first all the processes agree on that.
+        if exc_type is not None and not self.is_master():
+            return
+        if self.comm.allreduce(int(exc_type is None), op=self.MPI.MIN):
+            self.report()
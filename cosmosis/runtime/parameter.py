@@ -329,7 +329,8 @@ def register_new_parameter(options,
     """
     from .pipeline import LikelihoodPipeline
 
-    n = len(LikelihoodPipeline.pipeline_being_set_up)
+    setup_state = LikelihoodPipeline.setup_state
+    n = len(setup_state.pipelines)
 
     if n == 0:
         print("Tried to register_new_parameter from a module not in a pipeline: skipping.")
@@ -337,13 +338,13 @@ def register_new_parameter(options,
     elif n != 1:
         raise RuntimeError("Multiple pipelines are currently being set up, cannot register new parameter")
 
-    if len(LikelihoodPipeline.module_being_set_up) != n:
+    if len(setup_state.modules) != n:
         raise RuntimeError("Internal error: not clear what module is being set up.")
 
     # Now we have established the numbers are right we
     # register the parameter
-    pipeline = LikelihoodPipeline.pipeline_being_set_up[0]
-    caller = LikelihoodPipeline.module_being_set_up[0]
+    pipeline = setup_state.pipelines[0]
+    caller = setup_state.modules[0]
 
 
     pipeline._register_new_parameter(caller,
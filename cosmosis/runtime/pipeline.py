@@ -14,11 +14,16 @@ import warnings
 import configparser
 import traceback
 import signal
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from . import utils
 from . import config
 from . import parameter
 from . import prior
 from . import module
+from .disk_cache import BlockDiskCache, SetupDiskCache
+from .profiler import PipelineProfiler
 from ..datablock.cosmosis_py import block, section_names
 try:
     import faulthandler
@@ -27,6 +32,12 @@ except ImportError:
     pass
 
 
+BLOCK_LOG_LEVELS = {
+    "off": block.DataBlock.LOG_OFF,
+    "first_use": block.DataBlock.LOG_FIRST_USE,
+    "full": block.DataBlock.LOG_FULL,
+}
+
 class PipelineResults(object):
     def __init__(self, vector, number_extra):
         self.vector = vector
@@ -69,21 +80,188 @@ class MissingLikelihoodError(Exception):
         self.pipeline_data = data
 
 
-class LimitedSizeDict(collections.OrderedDict):
-    "From http://stackoverflow.com/questions/2437617/limiting-the-size-of-a-python-dictionary"
-    def __init__(self, *args, **kwds):
-        self.size_limit = kwds.pop("size_limit", None)
-        collections.OrderedDict.__init__(self, *args, **kwds)
-        self._check_size_limit()
+class CheckpointLevel(object):
+    """
+    One level of the fast/slow checkpoint cache.
+
+    A level stores copies of the block as it was just before module
+    `module_index` was run, keyed by the values of every parameter
+    first used by the modules before that one.  Entries are evicted
+    in least-recently-used order once either the entry count or the
+    memory budget (in bytes, zero meaning unlimited) is exceeded.
+    """
+    def __init__(self, module_index, module_name, new_params, fast_params,
+                 size_limit=3, memory_limit=0):
+        self.module_index = module_index
+        self.module_name = module_name
+        # The parameters first used by the modules since the previous level
+        self.new_params = new_params
+        self.encoded_params = block.DataBlock.encode_keys(new_params)
+        # The parameters first used by this module or later ones, which
+        # must not be copied back in from the cached block
+        self.fast_params = fast_params
+        self.size_limit = size_limit
+        self.memory_limit = memory_limit
+        self.cache = collections.OrderedDict()
+        self.block_size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.cache.clear()
+
+    def get(self, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.cache.move_to_end(key)
+        self.hits += 1
+        return cached
+
+    def put(self, key, block):
+        cached = block.clone()
+        # All the blocks at one level have much the same contents,
+        # so we only need to measure one of them to apply the budget.
+        if self.memory_limit and self.block_size is None:
+            self.block_size = block_nbytes(cached)
+        self.cache[key] = cached
+        self.cache.move_to_end(key)
+        limit = self.size_limit
+        if self.memory_limit and self.block_size:
+            limit = min(limit, max(1, self.memory_limit // self.block_size))
+        while len(self.cache) > limit:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+
+class ResultsCache(object):
+    """
+    A least-recently-used cache of the results of running the pipeline,
+    keyed on the exact bytes of the parameter vector and on the state of
+    the parameters (which are fixed and at what values, and the limits of
+    the others).  Samplers that re-run points from existing chains, which
+    often repeat the same point many times, can switch this on with
+    `LikelihoodPipeline.enable_results_cache` so that each distinct point
+    is only run once.
+
+    The blocks in the results are only kept if `keep_blocks` is set,
+    since they can be large.
+    """
+    def __init__(self, size_limit=1000, keep_blocks=False):
+        self.size_limit = size_limit
+        self.keep_blocks = keep_blocks
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _copy(results):
+        # The vector and extra outputs are often changed in place by
+        # samplers, and blocks are cheap to clone
+        results = copy.copy(results)
+        results.vector = copy.copy(results.vector)
+        results.extra = copy.copy(results.extra)
+        if results.block is not None:
+            results.block = results.block.clone()
+        return results
+
+    @staticmethod
+    def key(pipeline, p, all_params):
+        state = tuple((param.section, param.name, param.limits,
+                      param.start if param.is_fixed() else None)
+                      for param in pipeline.parameters)
+        return (np.asarray(p, dtype=float).tobytes(), all_params, state)
+
+    def get(self, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.cache.move_to_end(key)
+        self.hits += 1
+        # A copy, so that callers can change the results they get
+        return self._copy(cached)
+
+    def put(self, key, results):
+        cached = self._copy(results)
+        if not self.keep_blocks:
+            cached.block = None
+        self.cache[key] = cached
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size_limit:
+            self.cache.popitem(last=False)
+
+    def clear(self):
+        self.cache.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def report(self):
+        # Nothing to say if the pipeline was only run in other processes
+        if self.hits + self.misses == 0:
+            return
+        print("")
+        print("Pipeline results cache: {} hits, {} misses ({:.1f}% hit rate)".format(
+            self.hits, self.misses, 100 * self.hit_rate()))
+        print("")
+
+
+class BlockPool(object):
+    """
+    The DataBlocks made for the most recent samples.  Once nothing else
+    refers to one of them it is reset and used again for a later sample,
+    which is cheaper than making a new block each time.  Blocks that are
+    still in use elsewhere, for example because a sampler kept them, are
+    never touched.
+    """
+    def __init__(self, size_limit=4):
+        self.size_limit = size_limit
+        self.blocks = collections.deque()
+        self.made = 0
+        self.reused = 0
+
+    def get(self):
+        # A block is free if the only references to it are the pool's
+        # own and the one passed to getrefcount
+        free = [i for i in range(len(self.blocks)) if sys.getrefcount(self.blocks[i]) == 2]
+        # Free the memory of all the blocks we have finished with
+        for i in free:
+            self.blocks[i].reset()
+        if free:
+            data = self.blocks[free[0]]
+            del self.blocks[free[0]]
+            self.reused += 1
+        else:
+            data = block.DataBlock()
+            self.made += 1
+            if len(self.blocks) >= self.size_limit:
+                self.blocks.popleft()
+        self.blocks.append(data)
+        return data
 
-    def __setitem__(self, key, value):
-        collections.OrderedDict.__setitem__(self, key, value)
-        self._check_size_limit()
 
-    def _check_size_limit(self):
-        if self.size_limit is not None:
-            while len(self) > self.size_limit:
-                self.popitem(last=False)
+def block_nbytes(data):
+    """Rough estimate of the memory used by the values in a block"""
+    nbytes = 0
+    for section, name in data.keys():
+        value = data[section, name]
+        if isinstance(value, str):
+            nbytes += len(value)
+        else:
+            nbytes += np.asarray(value).nbytes
+    return nbytes
 
 
 class SlowSubspaceCache(object):
@@ -92,66 +270,116 @@ class SlowSubspaceCache(object):
     are fast and which are slow, and then caches the results of new sets
     of slow parameters so that if only fast parameters have changed the 
     pipeline can be much faster.
+
+    Pipelines often have more than two speed tiers, so as well as the
+    single fast/slow split used by samplers we keep a checkpoint of the
+    block before each module that introduces new parameters. Each run
+    restarts from the deepest checkpoint whose upstream parameters are
+    unchanged.
     """
-    def __init__(self, first_fast_module=None, cache_size_limit=3,):
-        self.current_hash = np.nan
+    def __init__(self, first_fast_module=None, cache_size_limit=3,
+                 cache_memory_limit=0, all_levels=True):
+        self.current_keys = {}
         self.analyzed = False
-        self.cache = LimitedSizeDict(size_limit=cache_size_limit)
+        self.levels = []
         self.first_fast_module = first_fast_module
+        self.cache_size_limit = cache_size_limit
+        self.cache_memory_limit = cache_memory_limit
+        self.all_levels = all_levels
 
     def clear_cache(self):
-        self.cache.clear()
-        self.current_hash = np.nan
+        for level in self.levels:
+            level.clear()
+        self.current_keys = {}
 
-    def hash_slow_parameters(self, block):
+    def hash_parameters(self, block, level, previous_key=0):
         """This is not a general block hash! 
-        It just looks at the slow parameters.
+        It just looks at the parameters new to this level, which may be
+        scalars, strings, or arrays, and chains on from the key for the
+        previous level.
         """
-        pairs = block.keys()
-        pairs.sort()
-        values = []
-        for section,name in pairs:
-            if (section,name) not in self.slow_params:
-                continue
-            value = block[section, name]
-            if not np.isscalar(value):
-                #non-scalar in the block - this must
-                #reflect some feature not coded yet
-                warnings.warn("Vector parameter(s) in the input means that fast-slow split will not work - this can be fixed - please open an issue if it affects you.  Or set fast_slow=F")
-                return np.nan # 
-            values.append(value)
-        values = tuple(values)
-        return hash(values)
+        return block.hash_values(level.encoded_params, seed=previous_key)
 
     def start_pipeline(self, initial_block):
         # We may be in the process of analyzing the pipeline
         # the first time.
         if not self.analyzed:
             return 0
-        #
-        new_hash = self.hash_slow_parameters(initial_block)
-        cached = self.cache.get(new_hash)
-        if cached is None:
-            self.current_hash = new_hash
-            first_module = 0
-        else:            
+
+        # Work out the key for each level.  Each one includes
+        # the keys for all the levels before it.
+        self.current_keys = {}
+        key = 0
+        for level in self.levels:
+            key = self.hash_parameters(initial_block, level, key)
+            self.current_keys[level.module_index] = key
+
+        # Look for the deepest level that we have already computed
+        for level in reversed(self.levels):
+            key = self.current_keys.get(level.module_index)
+            if key is None:
+                continue
+            cached = level.get(key)
+            if cached is None:
+                continue
             # Now we need to use the old cached results in the new block.
             # We put everything from the old block into the new block,
-            # EXCEPT for the fast parameters themselves.
+            # EXCEPT for the parameters used from this level onwards.
             for section,name in cached.keys():
-                if (section,name) not in self.fast_params:
+                if (section,name) not in level.fast_params:
                     initial_block[section,name] = cached[section,name]
-            first_module = self.split_index
-        return first_module
+            return level.module_index
+        return 0
 
     def next_module_results(self, module_index, block):
         if not self.analyzed:
             return
 
-        if module_index != self.split_index-1:
+        level = self.level_starts.get(module_index + 1)
+        if level is None:
+            return
+
+        key = self.current_keys.get(level.module_index)
+        if key is None:
             return
 
-        self.cache[self.current_hash] = block.clone()
+        level.put(key, block)
+
+    def report(self):
+        if not self.levels:
+            return
+        print("")
+        print("Fast/slow checkpoint cache usage:")
+        print("    {:<24}  {:>8}  {:>8}  {:>8}  {:>9}".format(
+            "Restart module", "Hits", "Misses", "Evicted", "Hit rate"))
+        for level in self.levels:
+            print("    {:<24}  {:>8}  {:>8}  {:>8}  {:>8.1f}%".format(
+                level.module_name[:24], level.hits, level.misses,
+                level.evictions, 100 * level.hit_rate()))
+        print("")
+
+    def _build_levels(self, pipeline, first_use):
+        # A checkpoint is only useful before a module that introduces
+        # new parameters - otherwise the checkpoint after the next module
+        # has the same key and saves more time.
+        per_module = list(first_use.values())[:len(pipeline.modules)]
+        if self.all_levels:
+            starts = [i for i in range(1, len(per_module)) if per_module[i]]
+        elif 0 < self.split_index < len(per_module):
+            starts = [self.split_index]
+        else:
+            starts = []
+        self.levels = []
+        previous = 0
+        for i in starts:
+            new_params = sum(per_module[previous:i], [])
+            fast_params = set(sum(per_module[i:], []))
+            level = CheckpointLevel(i, pipeline.modules[i].name, new_params, fast_params,
+                                    size_limit=self.cache_size_limit,
+                                    memory_limit=self.cache_memory_limit)
+            self.levels.append(level)
+            previous = i
+        self.level_starts = {level.module_index: level for level in self.levels}
 
     def analyze_pipeline(self, pipeline, all_params=False, grid=False):
         """
@@ -166,27 +394,38 @@ class SlowSubspaceCache(object):
         #likely more typical than any random starting position
         start = pipeline.start_vector()
 
-        if pipeline.has_run:
-            print("Pipeline has been run once already so no further initialization steps")
-        else:
-            print("")
-            print("Analyzing pipeline to determine fast and slow parameters (because fast_slow=T in [pipeline] section)")
+        # These runs have to run every module and see every parameter
+        # being read, so results must not be loaded from the disk cache
+        block_cache = pipeline.block_cache
+        pipeline.block_cache = None
+        try:
+            if pipeline.has_run:
+                print("Pipeline has been run once already so no further initialization steps")
+            else:
+                print("")
+                print("Analyzing pipeline to determine fast and slow parameters (because fast_slow=T in [pipeline] section)")
+                print("")
+                print("Running pipeline once to make sure everything is initialized before timing.")
+                print("")
+                pipeline.posterior(start)
             print("")
-            print("Running pipeline once to make sure everything is initialized before timing.")
+            print("Running the pipeline again to determine timings and fast-slow split")
             print("")
-            pipeline.posterior(start)
-        print("")
-        print("Running the pipeline again to determine timings and fast-slow split")
-        print("")
-        #Run with timing but make sure to re-set back to the original setting
-        #of timing after it finishes
-        #This will also print out the timing, which is handy.
-        original_timing = pipeline.timing
-        pipeline.timing = True
-        #Also get the datablock since it contains a log
-        #of all the parameter accesses
-        _, _, block = pipeline.posterior(start, return_data=True)
-        pipeline.timing = original_timing
+            #Run with timing but make sure to re-set back to the original setting
+            #of timing after it finishes
+            #This will also print out the timing, which is handy.
+            original_timing = pipeline.timing
+            pipeline.timing = True
+            #Also get the datablock since it contains a log
+            #of all the parameter accesses. We only need the first
+            #time each one is used.
+            original_log_level = pipeline.block_log_level
+            pipeline.block_log_level = max(original_log_level, block.DataBlock.LOG_FIRST_USE)
+            _, _, data = pipeline.posterior(start, return_data=True)
+            pipeline.timing = original_timing
+            pipeline.block_log_level = original_log_level
+        finally:
+            pipeline.block_cache = block_cache
         timings = pipeline.timings
 
         if timings is None:
@@ -202,7 +441,7 @@ class SlowSubspaceCache(object):
             params = pipeline.parameters
         else:
             params = pipeline.varied_params
-        first_use = block.get_first_parameter_use(params)
+        first_use = data.get_first_parameter_use(params)
         first_use_count = [len(f) for f in first_use.values()]
         if sum(first_use_count)!=len(params):
             used = sum(first_use.values(), [])
@@ -270,6 +509,13 @@ class SlowSubspaceCache(object):
                 print("        {}--{}".format(*param))
             print("")
             print("")
+
+        self._build_levels(pipeline, first_use)
+        if self.worth_splitting and self.levels:
+            print("Caching pipeline checkpoints before these modules:")
+            for level in self.levels:
+                print("        {}".format(level.module_name))
+            print("")
         self.analyzed = True
 
     def _choose_fast_slow_split(self, first_use_count, timings, grid_mode):
@@ -369,7 +615,19 @@ class Pipeline(object):
             sys.stderr.write("Warning: you have the fast_slow and shortcut options both set, and we can only do one of those at once (we will do shortcut)\n")
             self.do_fast_slow = False
         self.slow_subspace_cache = None #until set in method
+        # Switched on by samplers with enable_results_cache
+        self.results_cache = None
+        # Blocks for new samples are re-used once finished with
+        if self.options.getboolean(PIPELINE_INI_SECTION, "reuse_blocks", fallback=True):
+            self.block_pool = BlockPool()
+        else:
+            self.block_pool = None
         self.first_fast_module = self.options.get(PIPELINE_INI_SECTION, "first_fast_module", fallback="")
+        # Options for the checkpoints saved in fast/slow mode. The memory
+        # limit is per cache level, in MB, with 0 meaning no limit.
+        self.fast_slow_levels = self.options.getboolean(PIPELINE_INI_SECTION, "fast_slow_levels", fallback=True)
+        self.fast_slow_cache_size = self.options.getint(PIPELINE_INI_SECTION, "fast_slow_cache_size", fallback=3)
+        self.fast_slow_cache_mb = self.options.getfloat(PIPELINE_INI_SECTION, "fast_slow_cache_mb", fallback=0.0)
 
         # initialize modules
         self.modules = []
@@ -408,6 +666,70 @@ class Pipeline(object):
             self.shortcut_module=0
             self.shortcut_data=None
 
+        # Optional persistent cache of the block after chosen modules,
+        # which can be shared between runs and processes.
+        self.block_cache = None
+        cache_dir = self.options.get(PIPELINE_INI_SECTION, "cache_dir", fallback="")
+        if cache_dir and self.modules:
+            module_names = [m.name for m in self.modules]
+            cache_modules = self.options.get(PIPELINE_INI_SECTION, "cache_modules", fallback="").split()
+            for name in cache_modules:
+                if name not in module_names:
+                    raise ValueError("You set cache_modules to include {} but that module is not in the pipeline".format(name))
+            if not cache_modules:
+                cache_modules = module_names
+            cache_mb = self.options.getfloat(PIPELINE_INI_SECTION, "cache_size_mb", fallback=1024.0)
+            self.block_cache = BlockDiskCache(cache_dir, self.modules, self.options,
+                [module_names.index(name) for name in cache_modules],
+                size_limit=int(cache_mb * 1024**2))
+
+        # Module setups can be run in parallel threads.  The results of
+        # chosen python modules' setups can be computed once and shared
+        # with the other MPI processes, and saved for later runs.
+        self.setup_threads = self.options.getint(PIPELINE_INI_SECTION, "setup_threads", fallback=1)
+        self.shared_setup = self.options.get(PIPELINE_INI_SECTION, "shared_setup", fallback="").split()
+        module_names = [m.name for m in self.modules]
+        for name in self.shared_setup:
+            if name not in module_names:
+                raise ValueError("You set shared_setup to include {} but that module is not in the pipeline".format(name))
+            if not self.modules[module_names.index(name)].is_python:
+                raise ValueError("You set shared_setup to include {} but only python modules "
+                                 "can share their setup results".format(name))
+        self.setup_cache = None
+        setup_cache_dir = self.options.get(PIPELINE_INI_SECTION, "setup_cache_dir", fallback="")
+        if setup_cache_dir and self.shared_setup:
+            self.setup_cache = SetupDiskCache(setup_cache_dir, self.options)
+
+        # Optional per-module statistics, saved to a JSON file
+        self.profiler = None
+        profile_file = self.options.get(PIPELINE_INI_SECTION, "profile_file", fallback="")
+        if profile_file and self.modules:
+            # Under MPI each process keeps its own statistics
+            if "mpi4py.MPI" in sys.modules:
+                comm = sys.modules["mpi4py.MPI"].COMM_WORLD
+                if comm.Get_size() > 1:
+                    base, ext = os.path.splitext(profile_file)
+                    profile_file = "{}.{}{}".format(base, comm.Get_rank(), ext)
+            profile_interval = self.options.getint(PIPELINE_INI_SECTION, "profile_interval", fallback=1000)
+            self.profiler = PipelineProfiler(self.modules, profile_file, profile_interval)
+
+        # How much access to the blocks made for each sample is logged.
+        # The full log is only needed for debugging and profiling, (and
+        # the fast/slow analysis and graph, which switch it on themselves)
+        # so by default it is otherwise switched off.
+        block_log = self.options.get(PIPELINE_INI_SECTION, "block_log", fallback="auto")
+        if block_log == "auto":
+            if self.debug or self.profiler:
+                self.block_log_level = block.DataBlock.LOG_FULL
+            else:
+                self.block_log_level = block.DataBlock.LOG_OFF
+        else:
+            try:
+                self.block_log_level = BLOCK_LOG_LEVELS[block_log]
+            except KeyError:
+                raise ValueError("The block_log option in [pipeline] should be one of auto, {}, not {}".format(
+                    ", ".join(BLOCK_LOG_LEVELS), block_log))
+
 
 
     def find_module_file(self, path):
@@ -417,48 +739,108 @@ class Pipeline(object):
 
 
     def setup(self):
-        u"""Run all of our modulesʼ `setup()` routines."""
-        
-        if self.timing:
-            timings = [time.time()]
+        u"""Run all of our modulesʼ `setup()` routines.
 
-        for module in self.modules:
-            # identify parameters needed for module setup
-            relevant_sections = self.options.sections()
+        If the `setup_threads` option is more than one then the setups
+        are run in that many threads at once; this helps when modules
+        spend a long time reading files, or in compiled code.  Modules
+        listed in `shared_setup` are only set up on the root MPI process,
+        or loaded from `setup_cache_dir` if they have been set up before
+        with the same options, and their results sent to the others,
+        along with any parameters they registered.
 
-            #We let the user specify additional global sections that are
-            #visible to all modules
-            global_sections = self.options.get("runtime", "global", fallback=" ")
-            for global_section in global_sections.split():
-                relevant_sections.append(global_section)
+        The parameters registered by each module are collected in
+        `setup_parameters`, keyed by module name.
 
-            config_block = config_to_block(relevant_sections, self.options)
+        """
+        # identify parameters needed for module setup
+        relevant_sections = self.options.sections()
+
+        #We let the user specify additional global sections that are
+        #visible to all modules
+        global_sections = self.options.get("runtime", "global", fallback=" ")
+        for global_section in global_sections.split():
+            relevant_sections.append(global_section)
+
+        # Every module gets the same configuration, apart from its name,
+        # so we only build it once.  The copies share the values with it.
+        base_config = config_to_block(relevant_sections, self.options)
+
+        comm = None
+        if self.shared_setup and "mpi4py.MPI" in sys.modules:
+            comm = sys.modules["mpi4py.MPI"].COMM_WORLD
+            if comm.Get_size() == 1:
+                comm = None
+        is_root = comm is None or comm.Get_rank() == 0
+
+        # Each module's new parameters are kept separately, since the
+        # setups may run in any order in threads, or on another process.
+        self.setup_parameters = {module.name: [] for module in self.modules}
+
+        def setup_module(module):
+            t = time.time()
+            shared = module.name in self.shared_setup
+            if shared and not is_root:
+                # This will be sent from the root process below
+                return 0.0
+            if shared and self.setup_cache is not None:
+                found, result = self.setup_cache.load(module)
+                if found:
+                    data, self.setup_parameters[module.name] = result
+                    module.setup_with_data(data)
+                    return time.time() - t
+
+            config_block = base_config.clone()
             config_block[PIPELINE_INI_SECTION, 'current_module'] = module.name
-            # we need to store an ID here to allow a hack to add new parameters
-            # from the modules themselves.  Unfortunately cosmosis stores ints, whereas
-            # python IDs are long.  So we split the ID into two parts here
 
-            LikelihoodPipeline.pipeline_being_set_up.append(self)
-            LikelihoodPipeline.module_being_set_up.append(module.name)
+            # This lets modules find the pipeline to add new parameters to
+            setup_state = LikelihoodPipeline.setup_state
+            setup_state.pipelines.append(self)
+            setup_state.modules.append(module.name)
             try:
                 module.setup(config_block, quiet=self.quiet)
             finally:
                 # This should only go wrong if someone is doing something
                 # ridiculous, so I won't catch any error in it.
-                LikelihoodPipeline.pipeline_being_set_up.remove(self)
-                LikelihoodPipeline.module_being_set_up.remove(module.name)
+                setup_state.pipelines.remove(self)
+                setup_state.modules.remove(module.name)
 
-            if self.timing:
-                timings.append(time.time())
+            if shared and self.setup_cache is not None:
+                self.setup_cache.save(module, (module.data, self.setup_parameters[module.name]))
+            return time.time() - t
+
+        try:
+            if self.setup_threads > 1 and len(self.modules) > 1:
+                with ThreadPoolExecutor(self.setup_threads) as executor:
+                    timings = list(executor.map(setup_module, self.modules))
+            else:
+                timings = [setup_module(module) for module in self.modules]
+        except Exception:
+            # Tell the other processes, which would otherwise wait
+            # forever for our results below.
+            if comm is not None:
+                comm.allgather(True)
+            raise
+
+        if comm is not None:
+            failed = comm.allgather(False)
+            if any(failed):
+                ranks = [str(rank) for rank, f in enumerate(failed) if f]
+                raise RuntimeError("Pipeline module setup failed on MPI process(es) {}".format(", ".join(ranks)))
+            for module in self.modules:
+                if module.name in self.shared_setup:
+                    result = (module.data, self.setup_parameters[module.name]) if is_root else None
+                    data, self.setup_parameters[module.name] = comm.bcast(result, root=0)
+                    if not is_root:
+                        module.setup_with_data(data)
 
         if not self.quiet:
             sys.stdout.write("Setup all pipeline modules\n")
 
         if self.timing:
-            timings.append(time.time())
             sys.stdout.write("Module timing:\n")
-            for name, t2, t1 in zip(self.modules, timings[1:], timings[:-1]):
-                sys.stdout.write("%s %f\n" % (name, t2-t1))
+            for module, t in zip(self.modules, timings):
+                sys.stdout.write("%s %f\n" % (module, t))
 
 
     def setup_fast_subspaces(self, all_params=False, grid=False):
@@ -474,7 +856,11 @@ class Pipeline(object):
             else:
                 first_fast_index = None
 
-            self.slow_subspace_cache = SlowSubspaceCache(first_fast_module=first_fast_index)
+            self.slow_subspace_cache = SlowSubspaceCache(
+                first_fast_module=first_fast_index,
+                cache_size_limit=self.fast_slow_cache_size,
+                cache_memory_limit=int(self.fast_slow_cache_mb * 1024**2),
+                all_levels=self.fast_slow_levels)
             self.slow_subspace_cache.analyze_pipeline(self, all_params=all_params, grid=grid)
 
             if not self.slow_subspace_cache.worth_splitting:
@@ -511,6 +897,18 @@ class Pipeline(object):
         for module in self.modules:
             module.cleanup()
 
+        if self.slow_subspace_cache:
+            self.slow_subspace_cache.report()
+
+        if self.block_cache:
+            self.block_cache.report()
+
+        if self.results_cache:
+            self.results_cache.report()
+
+        if self.profiler:
+            self.profiler.write()
+
 
 
     def make_graph(self, data, filename):
@@ -598,6 +996,12 @@ class Pipeline(object):
             self.timings = None
 
         timings = []
+        if self.block_cache:
+            # The cache learns which values each module reads from the log
+            if self.block_cache.needs_log() and data_package.get_log_level() == data_package.LOG_OFF:
+                data_package.set_log_level(data_package.LOG_FIRST_USE)
+            self.block_cache.hash_inputs(data_package)
+
         if self.shortcut_module:
             if self.shortcut_data is None:
                 first_module = 0
@@ -615,21 +1019,40 @@ class Pipeline(object):
         else:
             first_module = 0
 
+        if self.block_cache:
+            start = self.block_cache.start_pipeline(data_package, first_module)
+            if start != first_module and (self.debug or self.timing):
+                sys.stdout.write("COOL: Quickstarting pipeline from module {} (disk cache)\n".format(start))
+                sys.stdout.flush()
+            first_module = start
+
         if self.timing:
             start_time = time.time()
 
+        if self.profiler:
+            self.profiler.start_sample(data_package, first_module)
+
+        # Save the calls into the block if it is not logging anything
+        log_modules = data_package.get_log_level() != block.DataBlock.LOG_OFF
+
         for module_number, module in enumerate(modules):
             if module_number<first_module:
                 continue
             if self.debug:
                 sys.stdout.write("Running %.20s ...\n" % module)
                 sys.stdout.flush()
-            data_package.log_access("MODULE-START", module.name, "")
+            if log_modules:
+                data_package.log_access("MODULE-START", module.name, "")
             if self.timing:
                 t1 = time.time()
+            if self.profiler:
+                self.profiler.start_module(data_package)
 
             status = module.execute(data_package)
 
+            if self.profiler:
+                self.profiler.end_module(module_number, data_package, status)
+
             if status is None:
                 raise ValueError(("A module you ran, '{}', did not return a proper status value.\n"+
                     "It should return an integer, 0 if everything worked.\n"+
@@ -659,11 +1082,13 @@ class Pipeline(object):
                                      "error status.\n")
                     if not self.debug:
                         sys.stderr.write("Setting debug=T in [pipeline] might help.\n")
+                if self.profiler:
+                    self.profiler.end_sample()
                 return None
 
-            # If we are using a fast/slow split (and we are not already running on a cached subset)
-            # Then see if it wants to cache these results
-            if self.slow_subspace_cache and first_module==0:
+            # If we are using a fast/slow split then see if it wants to
+            # checkpoint these results
+            if self.slow_subspace_cache:
                 self.slow_subspace_cache.next_module_results(module_number, data_package)
 
             # Alternatively we will do the shortcut thing
@@ -671,25 +1096,93 @@ class Pipeline(object):
                 print("Saving shortcut data")
                 self.shortcut_data = data_package.clone()
 
+            if self.block_cache:
+                self.block_cache.next_module_results(module_number, data_package)
+
         if self.timing:
             end_time = time.time()
             sys.stdout.write("Total pipeline time: {:.3} seconds\n".format(end_time-start_time))
             self.timings = timings
 
+        if self.profiler:
+            self.profiler.end_sample()
+
         if not self.quiet:
             sys.stdout.write("Pipeline ran okay.\n")
 
-        data_package.log_access("MODULE-START", "Results", "")
+        if log_modules:
+            data_package.log_access("MODULE-START", "Results", "")
         # return something
         self.has_run = True
         return True
 
+    def run_batch(self, data_packages):
+        u"""Run every module on each of a list of DataBlocks, and return a list of success flags.
+
+        Modules with an `execute_batch` function are run once on all
+        the blocks that have succeeded so far; others are run on each
+        block in turn.  A block for which any module fails is dropped
+        from later modules and gets False in the returned list.
+
+        The fast/slow, shortcut and disk caches and the timing, profiling
+        and debug options work point by point, so if any of them are in
+        use this just calls :func:`run` on each block.
+
+        """
+        if (self.slow_subspace_cache or self.block_cache or self.shortcut_module
+                or self.timing or self.debug or self.profiler):
+            return [bool(self.run(data_package)) for data_package in data_packages]
+
+        success = [True for data_package in data_packages]
+        active = list(range(len(data_packages)))
+        log_modules = [data_package.get_log_level() != block.DataBlock.LOG_OFF
+                       for data_package in data_packages]
+
+        for module in self.modules:
+            if not active:
+                break
+            blocks = [data_packages[i] for i in active]
+            for i in active:
+                if log_modules[i]:
+                    data_packages[i].log_access("MODULE-START", module.name, "")
+
+            statuses = module.execute_batch(blocks)
+
+            if len(statuses) != len(blocks) or any(status is None for status in statuses):
+                raise ValueError(("A module you ran, '{}', did not return a proper status value for each point.\n"+
+                    "It should return an integer, 0 if everything worked, or a list of them from execute_batch.").format(module))
+
+            failed = [i for i, status in zip(active, statuses) if status]
+            if failed and not self.quiet:
+                sys.stderr.write("Error running pipeline module {} on {} of {} points "
+                                 "- hopefully printed above here.\n".format(module, len(failed), len(active)))
+            for i in failed:
+                success[i] = False
+            active = [i for i, status in zip(active, statuses) if not status]
+
+        if active and not self.quiet:
+            sys.stdout.write("Pipeline ran okay on {} points.\n".format(len(active)))
+
+        for i in active:
+            if log_modules[i]:
+                data_packages[i].log_access("MODULE-START", "Results", "")
+        if active:
+            self.has_run = True
+        return success
+
     def clear_cache(self):
         self.slow_subspace_cache.clear_cache()
 
 
 
 
+class SetupState(threading.local):
+    u"""The pipelines and modules being set up, separately for each thread."""
+    def __init__(self):
+        self.pipelines = []
+        self.modules = []
+
+
 class LikelihoodPipeline(Pipeline):
 
     u"""Very specialized pipeline designed specifically for the prototypical case of Bayes-computed posterior distributions.
@@ -717,10 +1210,10 @@ class LikelihoodPipeline(Pipeline):
     ‘unzipped’ after computations have completed.
 
     """
-    # These class-level variables are used by the
-    # register_new_parameter function.
-    pipeline_being_set_up = []
-    module_being_set_up = []
+    # This class-level variable is used by the register_new_parameter
+    # function to find the pipeline and module being set up in the
+    # current thread.
+    setup_state = SetupState()
 
     def __init__(self, arg=None, id="", override=None, modules=None, load=True, values=None, priors=None, only=None):
         u"""Construct a :class:`LikelihoodPipeline`.
@@ -805,6 +1298,22 @@ class LikelihoodPipeline(Pipeline):
 
 
 
+    def setup(self):
+        u"""Run all of our modulesʼ `setup()` routines, and then add any parameters they registered.
+
+        The new parameters are added in the order of the modules in the
+        pipeline, whatever order the setups actually ran in.
+
+        """
+        super().setup()
+        for module in self.modules:
+            for param in self.setup_parameters[module.name]:
+                print("Pipeline module {} created new parameter {}".format(module.name, param))
+                print("    with start:", param.start)
+                print("    with limits:", param.limits)
+                print("    with prior:", param.prior)
+                self.parameters.append(param)
+
     def print_priors(self):
         u"""Pretty-print a table of priors for human inspection."""
         print("")
@@ -843,11 +1352,8 @@ class LikelihoodPipeline(Pipeline):
             prior_text = prior_name + " " + " ".join([str(x) for x in prior_args])
             prior_obj = prior.Prior.parse_prior(prior_text)
         param = parameter.Parameter(section, name, start, limits, prior_obj)
-        print("Pipeline module {} created new parameter {}".format(module_name, param))
-        print("    with start:", param.start)
-        print("    with limits:", param.limits)
-        print("    with prior:", param.prior)
-        self.parameters.append(param)
+        # These are added to the pipeline once all the setups are done
+        self.setup_parameters[module_name].append(param)
 
     def reset_fixed_varied_parameters(self):
         u"""Identify the sub-set of parameters which are fixed, and those which are to be varied."""
@@ -1076,7 +1582,11 @@ class LikelihoodPipeline(Pipeline):
             if self.is_out_of_range(p):
                 return None
 
-        data = block.DataBlock()
+        if self.block_pool is None:
+            data = block.DataBlock()
+        else:
+            data = self.block_pool.get()
+        data.set_log_level(self.block_log_level)
 
         if all_params:
             for param, x in zip(self.parameters, p):
@@ -1161,6 +1671,21 @@ class LikelihoodPipeline(Pipeline):
         else:
             return priors
 
+    def enable_results_cache(self, size_limit=1000, keep_blocks=False):
+        u"""Re-use the results for any parameter vector that has been run recently.
+
+        The last `size_limit` distinct results from :func:`run_results`
+        (and so :func:`posterior`) are kept, and returned again if the
+        same parameters are run, instead of running the pipeline.  This
+        is only worth doing when exactly the same points come up
+        repeatedly, as when re-running an MCMC chain.  The results are
+        kept without their blocks unless `keep_blocks` is set.  The
+        number of hits and misses are in `results_cache.hits` and
+        `results_cache.misses` and are reported by :func:`cleanup`.
+
+        """
+        self.results_cache = ResultsCache(size_limit, keep_blocks=keep_blocks)
+
     def run_results(self, p, all_params=False):
         u"""Run the pipeline on the given parameters and get a results object.
 
@@ -1187,7 +1712,20 @@ class LikelihoodPipeline(Pipeline):
         `-numpy.inf` will be returned as the final posterior (i.e., zero
         probability of this set of parameter values being correct).
 
+        If :func:`enable_results_cache` has been called, the results may
+        come from an earlier run with the same parameters.
+
         """
+        if self.results_cache is None:
+            return self._run_results(p, all_params=all_params)
+        key = self.results_cache.key(self, p, all_params)
+        r = self.results_cache.get(key)
+        if r is None:
+            r = self._run_results(p, all_params=all_params)
+            self.results_cache.put(key, r)
+        return r
+
+    def _run_results(self, p, all_params=False):
         r = PipelineResults(p, self.number_extra)
 
         priors = self.prior(p, all_params=all_params, total_only=False)
@@ -1231,6 +1769,78 @@ class LikelihoodPipeline(Pipeline):
 
 
 
+    def run_results_batch(self, P, all_params=False):
+        u"""Run the pipeline on a collection of parameter vectors and get a list of results objects.
+
+        This gives the same results as calling :func:`run_results` on
+        each row of `P`, but runs the pipeline with :func:`run_batch`, so
+        that modules which implement `execute_batch` can process all the
+        points at once.
+
+        """
+        results = []
+        to_run = []
+        for p in P:
+            r = PipelineResults(p, self.number_extra)
+            results.append(r)
+
+            priors = self.prior(p, all_params=all_params, total_only=False)
+            r.prior = sum(pr[1] for pr in priors)
+
+            if np.isnan(r.prior):
+                r.prior = -np.inf
+
+            if not np.isfinite(r.prior):
+                if not self.quiet:
+                    print("Proposed outside bounds: prior -infinity")
+                continue
+
+            data = self.build_starting_block(p, all_params=all_params)
+            to_run.append((r, priors, data))
+
+        try:
+            success = self.run_batch([data for (_, _, data) in to_run])
+        except Exception:
+            if self.debug:
+                raise
+            sys.stderr.write("\n\nERROR: there was an exception running the pipeline on a batch of {} points:\n".format(len(to_run)))
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.write("You should fix this but for now I will return NaN for the likelihoods (because you have debug=F)\n\n")
+            return results
+
+        for (r, priors, data), ok in zip(to_run, success):
+            if not ok:
+                sys.stderr.write("Pipeline failed on these parameters: {}\n".format(r.vector))
+                continue
+
+            if self.likelihood_names == NO_LIKELIHOOD_NAMES:
+                self._set_likelihood_names_from_block(data)
+
+            try:
+                like, r.extra = self._extract_likelihood_and_extras(data)
+            except Exception:
+                if self.debug:
+                    raise
+                sys.stderr.write("\n\nERROR: there was an exception running the likelihood:\n")
+                sys.stderr.write("The input parameters were:{}\n".format(repr(r.vector)))
+                traceback.print_exc(file=sys.stderr)
+                sys.stderr.write("You should fix this but for now I will return NaN for the likelihood (because you have debug=F)\n\n")
+                continue
+
+            r.block = data
+            r.set_like(like)
+            for name, pr in priors:
+                data["priors", name] = pr
+
+            if np.isnan(r.post):
+                r.post = -np.inf
+
+            if np.isnan(r.like):
+                r.like = -np.inf
+
+        return results
+
+
     def posterior(self, p, return_data=False, all_params=False):
         u"""Use the above methods to obtain prior and updated log-likelihoods, sum together to get Bayesian posterior.
 
@@ -1348,6 +1958,15 @@ class LikelihoodPipeline(Pipeline):
             else:
                 return -np.inf, [np.nan for i in range(self.number_extra)]
 
+        like, extra_saves = self._extract_likelihood_and_extras(data)
+
+        if return_data:
+            return like, extra_saves, data
+        else:
+            return like, extra_saves
+
+    def _extract_likelihood_and_extras(self, data):
+        "Extract the total likelihood and the extra_saves values from a completed block"
         like = self._extract_likelihoods(data)
 
         extra_saves = []
@@ -1374,10 +1993,7 @@ class LikelihoodPipeline(Pipeline):
                 # ---------------------------- otavio end ---------------------------
 
         self.n_iterations += 1
-        if return_data:
-            return like, extra_saves, data
-        else:
-            return like, extra_saves
+        return like, extra_saves
 
 
 
@@ -0,0 +1,34 @@
+class PoolFuture(object):
+    """
+    The result of a single task submitted to a pool with its submit
+    method, which will be filled in later.
+
+    Pass a collection of these to the pool's as_completed method to
+    wait for them; the `task` attribute holds the original argument, so
+    results can be matched up with their inputs.
+    """
+    def __init__(self, function, task):
+        self.function = function
+        self.task = task
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._done
+
+    def set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+    def result(self):
+        if not self._done:
+            raise RuntimeError("Task has not finished yet - use the pool's "
+                               "as_completed method to wait for it")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
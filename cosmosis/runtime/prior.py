@@ -15,7 +15,6 @@ Applications can get by only knowing about the :class:`Prior` superclass.
 from . import config
 import numpy as np
 import math
-from scipy import interpolate
 import copy
 
 class Prior(object):
@@ -191,6 +190,8 @@ class TabulatedPDF(Prior):
         totalprobability = cdf[-1]
         cdf /= totalprobability
 
+        # scipy is slow to import, so only load it if we need it
+        from scipy import interpolate
         self.inverse_cdf_interp = interpolate.interp1d(cdf, xarray, kind='linear')
         self.cdf_interp = interpolate.interp1d(xarray, cdf, kind='linear')
         self.pdf_interp = interpolate.interp1d(xarray, pdf_x, kind='linear')
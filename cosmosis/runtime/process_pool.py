@@ -1,34 +1,132 @@
 import multiprocessing
+import queue
 import os
+from .pool_future import PoolFuture
 
 
 class Pool(object):
-    def __init__(self, processes):
+    """
+    A pool of worker processes on the local machine, used for the --smp
+    option.
+
+    The worker processes are started the first time map is called, and
+    are then kept running until the pool is closed, which happens at the
+    end of each sampler.  They are forked from the master process, so
+    they inherit the pipeline (with its modules already set up) and
+    any global variables that the sampler has set up in its config
+    method.  After that only the tasks and the results are sent between
+    processes.
+
+    Since the workers are copies of the master at the time they were
+    started, anything changed in the master after that is not seen by
+    them.  The workers are restarted if map is called with a different
+    function, which usually means that a new sampler has been set up;
+    call restart directly if anything else needs updating.
+
+    As well as map, tasks can be run one at a time with submit, and
+    their results collected in the order they finish with as_completed.
+    """
+    def __init__(self, processes, initializer=None, initargs=()):
         self.size = processes
         self.rank = 0
         self.master_pid = os.getpid()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.pool = None
+        self.function = None
+        self.completed = queue.Queue()
+        self.outstanding = 0
 
     def is_master(self):
         return self.master_pid == os.getpid()
 
-    def map(self, function, args):
-        pool = multiprocessing.Pool(self.size)
-        results = pool.map(function, args)
-        pool.close()
-        return results
+    def start(self):
+        # Forking is needed so that the workers get the set-up pipeline
+        # without having to pickle it.  It is not available on Windows,
+        # but neither is the rest of cosmosis.
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(self.size, self.initializer, self.initargs)
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def _use_function(self, function):
+        # Restarting would lose any tasks still running
+        if self.pool is None or (function != self.function and not self.outstanding):
+            self.restart()
+            self.function = function
+
+    def map(self, function, args, chunksize=None):
+        self._use_function(function)
+        args = list(args)
+        # Send a few chunks to each worker, which balances the load
+        # reasonably without too much communication.
+        if chunksize is None:
+            chunksize, extra = divmod(len(args), self.size * 4)
+            if extra:
+                chunksize += 1
+        return self.pool.map(function, args, max(chunksize, 1))
+
+    def submit(self, function, task):
+        """
+        Start running function(task) on a worker, and return a PoolFuture
+        that will hold the result.
+        """
+        self._use_function(function)
+        future = PoolFuture(function, task)
+        self.outstanding += 1
+        # The callbacks are run in a thread in this process
+        self.pool.apply_async(function, (task,),
+            callback=lambda result: self.completed.put((future, result, None)),
+            error_callback=lambda error: self.completed.put((future, None, error)))
+        return future
+
+    def as_completed(self, futures):
+        """
+        Yield each of the futures from submit as its task finishes.
+        """
+        waiting = set()
+        for future in futures:
+            if future.done():
+                yield future
+            else:
+                waiting.add(future)
+        while waiting:
+            future, result, error = self.completed.get()
+            self.outstanding -= 1
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+            if future in waiting:
+                waiting.remove(future)
+                yield future
 
     def close(self):
-        pass
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.function = None
+            self.completed = queue.Queue()
+            self.outstanding = 0
 
-    def bcast(self, data):
-        return self.data
+    def bcast(self, data, root=0):
+        # Only the master process runs the sampler, so there is nowhere
+        # else to send the data.
+        return data
 
-    def gather(self, data):
-        return self.data
+    def gather(self, data, root=0):
+        return [data]
 
 
     def __enter__(self):
         return self
 
-    def __exit__(self, *args):
-        pass        
\ No newline at end of file
+    def __exit__(self, exc_type, *args):
+        # Don't wait for the workers to finish their tasks if we are
+        # exiting because of an error
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
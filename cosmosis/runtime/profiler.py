@@ -0,0 +1,182 @@
+#coding: utf-8
+u"""Definition of :class:`PipelineProfiler`, which records statistics on each module as the pipeline runs."""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_rss():
+    u"""The peak resident memory used so far by this process, in bytes, or zero if unknown."""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports this in kilobytes and macOS in bytes
+    if sys.platform != "darwin":
+        rss *= 1024
+    return rss
+
+
+class LogHistogram(object):
+    u"""
+    A histogram of positive values in logarithmically spaced bins, from
+    which totals and approximate percentiles can be found.  It uses a
+    fixed amount of memory however many values are added, and two can be
+    combined with `merge`.
+    """
+    def __init__(self, low=1e-6, high=1e4, bins_per_decade=20):
+        self.low = low
+        self.high = high
+        self.nbin = int(round(np.log10(high / low) * bins_per_decade))
+        self.edges = np.logspace(np.log10(low), np.log10(high), self.nbin + 1)
+        # The extra bins at either end are for values below low and above high
+        self.counts = np.zeros(self.nbin + 2, dtype=int)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, x):
+        self.counts[np.searchsorted(self.edges, x, side='right')] += 1
+        self.n += 1
+        self.total += x
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.n += other.n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def percentile(self, q):
+        u"""Estimate the q'th percentile, to within the width of one bin."""
+        if self.n == 0:
+            return 0.0
+        target = q / 100.0 * self.n
+        cumulative = np.cumsum(self.counts)
+        i = min(np.searchsorted(cumulative, target), self.nbin + 1)
+        if i == 0:
+            return self.edges[0]
+        if i == self.nbin + 1:
+            return self.max
+        # Geometric centre of the bin
+        return min(np.sqrt(self.edges[i-1] * self.edges[i]), self.max)
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "mean": self.mean(),
+            "max": self.max,
+            "percentiles": {str(q): self.percentile(q) for q in [50, 90, 99, 99.9]},
+            "bin_edges": self.edges.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+
+class ModuleProfile(object):
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.failures = 0
+        self.cached = 0
+        self.wall_time = LogHistogram()
+        self.cpu_time = LogHistogram()
+        self.rss_growth = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def to_dict(self):
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "cached": self.cached,
+            "wall_time": self.wall_time.to_dict(),
+            "cpu_time": self.cpu_time.to_dict(),
+            "peak_rss_growth": self.rss_growth,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class PipelineProfiler(object):
+    u"""
+    Records, for every module and every sample, the wall and CPU time
+    taken, the growth in the process's peak memory, the amount of data
+    read from and written to the block, and whether the module was
+    skipped because its results were cached.
+
+    The per-sample numbers are accumulated into histograms rather than
+    stored, so this can be left on for long runs.  The summary is written
+    as JSON to `filename` every `interval` samples and by `write`.
+    """
+    def __init__(self, modules, filename, interval=1000):
+        self.filename = filename
+        self.interval = interval
+        self.modules = [ModuleProfile(module.name) for module in modules]
+        self.samples = 0
+        self.cached_samples = 0
+        self.total_time = LogHistogram()
+        self.sample_start = None
+        self.module_start = None
+        self.pid = os.getpid()
+
+    def start_sample(self, block, first_module):
+        self.samples += 1
+        if first_module:
+            self.cached_samples += 1
+        for profile in self.modules[:first_module]:
+            profile.cached += 1
+        self.sample_start = time.perf_counter()
+
+    def start_module(self, block):
+        self.module_start = (time.perf_counter(), time.process_time(),
+                             peak_rss(), block.get_log_count())
+
+    def end_module(self, module_index, block, status):
+        wall_start, cpu_start, rss_start, log_start = self.module_start
+        profile = self.modules[module_index]
+        profile.runs += 1
+        if status:
+            profile.failures += 1
+        profile.wall_time.add(time.perf_counter() - wall_start)
+        profile.cpu_time.add(time.process_time() - cpu_start)
+        profile.rss_growth += peak_rss() - rss_start
+        bytes_read, bytes_written = block.get_log_bytes(log_start)
+        profile.bytes_read += bytes_read
+        profile.bytes_written += bytes_written
+
+    def end_sample(self):
+        self.total_time.add(time.perf_counter() - self.sample_start)
+        if self.interval and self.samples % self.interval == 0:
+            self.write()
+
+    def to_dict(self):
+        return {
+            "samples": self.samples,
+            "cached_samples": self.cached_samples,
+            "pipeline_time": self.total_time.to_dict(),
+            "modules": {profile.name: profile.to_dict() for profile in self.modules},
+        }
+
+    def write(self):
+        filename = self.filename
+        # Processes forked for --smp mode keep their own statistics
+        if os.getpid() != self.pid:
+            base, ext = os.path.splitext(filename)
+            filename = "{}.{}{}".format(base, os.getpid(), ext)
+        # Write to a temporary file first so that the file is always
+        # complete if someone looks at it during a run.
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp_filename, filename)
@@ -1,26 +1,18 @@
-from .sampler import Sampler, ParallelSampler, sample_ball, sample_ellipsoid
+import sys
+from .sampler import Sampler, ParallelSampler, sample_ball, sample_ellipsoid, builtin_samplers
 from .hints import Hints
-from .minuit.minuit_sampler import MinuitSampler
-from .test.test_sampler import TestSampler
-from .metropolis.metropolis_sampler import MetropolisSampler
-from .grid.grid_sampler import GridSampler
-from .pymc.pymc_sampler import PymcSampler
-from .emcee.emcee_sampler import EmceeSampler
-from .maxlike.maxlike_sampler import MaxlikeSampler
-from .pmaxlike.pmaxlike_sampler import PmaxlikeSampler
-from .gridmax.gridmax_sampler import GridmaxSampler
-from .importance.importance_sampler import ImportanceSampler
-from .multinest.multinest_sampler import MultinestSampler
-from .polychord.polychord_sampler import PolychordSampler
-from .pmc.pmc_sampler import PmcSampler
-from .snake.snake_sampler import SnakeSampler
-from .kombine.kombine_sampler import KombineSampler
-from .fisher.fisher_sampler import FisherSampler
-from .abc.abc_sampler import AbcSampler
-from .list.list_sampler import ListSampler
-from .star.star_sampler import StarSampler
-from .apriori.apriori_sampler import AprioriSampler
-from .dynesty.dynesty_sampler import DynestySampler
-from .zeus.zeus_sampler import ZeusSampler
-from .poco.poco_sampler import PocoSampler
-from .nautilus.nautilus_sampler import NautilusSampler
+
+# The samplers themselves (MetropolisSampler etc.) are imported
+# only when first used; see builtin_samplers in sampler.py
+def __getattr__(name):
+    if name.endswith("Sampler"):
+        config_name = name[:-len("Sampler")].lower()
+        if config_name in Sampler.registry:
+            return Sampler.registry[config_name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+# Module __getattr__ needs python 3.7, so import them all up front before that
+if sys.version_info < (3, 7):
+    for _name in builtin_samplers:
+        _sampler_class = Sampler.registry[_name]
+        globals()[_sampler_class.__name__] = _sampler_class
@@ -1,4 +1,5 @@
 from .. import ParallelSampler, sample_ellipsoid, sample_ball
+from ..sampler import batch_map
 import numpy as np
 import sys
 
@@ -7,6 +8,15 @@ def log_probability_function(p):
     r = emcee_pipeline.run_results(p)
     return r.post, (r.prior, r.extra)
 
+def log_probability_batch(P):
+    results = emcee_pipeline.run_results_batch(P)
+    return [(r.post, (r.prior, r.extra)) for r in results]
+
+def log_probability_vectorized(P):
+    # In vectorize mode emcee calls this once with every walker
+    # position, and ignores the pool, so we split them up ourselves.
+    return batch_map(log_probability_batch, P, emcee_sampler_pool)
+
 
 class EmceeSampler(ParallelSampler):
     parallel_output = False
@@ -14,8 +24,9 @@ class EmceeSampler(ParallelSampler):
     sampler_outputs = [("prior", float), ("post", float)]
 
     def config(self):
-        global emcee_pipeline
+        global emcee_pipeline, emcee_sampler_pool
         emcee_pipeline = self.pipeline
+        emcee_sampler_pool = self.pool
 
         if self.is_master():
             import emcee
@@ -28,6 +39,9 @@ class EmceeSampler(ParallelSampler):
             self.nwalkers = self.read_ini("walkers", int, 2)
             self.samples = self.read_ini("samples", int, 1000)
             self.nsteps = self.read_ini("nsteps", int, 100)
+            # Run the pipeline on all the walkers at once, for
+            # modules that can process several points together
+            self.batch = self.read_ini("batch", bool, False)
 
             assert self.nsteps>0, "You specified nsteps<=0 in the ini file - please set a positive integer"
             assert self.samples>0, "You specified samples<=0 in the ini file - please set a positive integer"
@@ -80,9 +94,16 @@ class EmceeSampler(ParallelSampler):
                 self.output.log_info("Generating starting positions in small ball around starting point")
 
             #Finally we can create the sampler
-            self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
-                                                       log_probability_function,
-                                                       pool=self.pool)
+            if self.batch:
+                if self.emcee_version < 3:
+                    raise ValueError("The emcee batch option needs emcee version 3 or above")
+                self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
+                                                           log_probability_vectorized,
+                                                           vectorize=True)
+            else:
+                self.ensemble = self.emcee.EnsembleSampler(self.nwalkers, self.ndim,
+                                                           log_probability_function,
+                                                           pool=self.pool)
 
     def resume(self):
         if self.output.resumed:
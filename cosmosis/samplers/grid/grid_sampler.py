@@ -33,6 +33,37 @@ class GridSampler(ParallelSampler):
         self.sample_points = None
         self.ndone = 0
 
+        self.adaptive = self.read_ini("adaptive", bool, False)
+        if self.adaptive:
+            self.config_adaptive()
+
+    def config_adaptive(self):
+        self.refine_levels = self.read_ini("refine_levels", int, 2)
+        self.refine_threshold = self.read_ini("refine_threshold", float, 10.0)
+        self.refine_difference = self.read_ini("refine_difference", float, 2.0)
+        if self.nsample < 2:
+            raise ValueError("The adaptive grid sampler needs nsample_dimension of at least 2")
+
+        # Save the level of each sample so that postprocessing knows
+        # how much of the space it covers. It goes with the other
+        # sampler outputs, before the prior and posterior.  MPI worker
+        # processes have no output.
+        if self.output is not None:
+            self.output.columns.insert(-2, ("grid_level", int, ""))
+
+        # Points are labelled by integer coordinates on the finest possible
+        # grid.  Coarse points are the centres of nsample boxes along each
+        # axis, and each refinement splits a box into three along each axis,
+        # so the centre of a box is also the centre of its middle child.
+        self.ndim = len(self.pipeline.varied_params)
+        self.scale = 3**self.refine_levels
+        self.lower = np.array([param.limits[0] for param in self.pipeline.varied_params])
+        upper = np.array([param.limits[1] for param in self.pipeline.varied_params])
+        self.step = (upper - self.lower) / (self.nsample * self.scale)
+        self.level = 0
+        self.posts = {}
+        self.level_results = []
+
     def setup_sampling(self):
         #Number of jobs to do at once.
         #Can be taken from the ini file.
@@ -64,6 +95,11 @@ class GridSampler(ParallelSampler):
                 print("[grid] section of the ini file.")
                 raise ValueError("Suspicously large number of grid points %d ( = n_samp ^ n_dim = %d ^ %d); set allow_large=T in [grid] section to permit this."%(total_samples,self.nsample,len(self.pipeline.varied_params)))
         print()
+
+        if self.adaptive:
+            coarse = np.array(list(itertools.product(range(self.nsample), repeat=self.ndim)))
+            self.sample_points = coarse * self.scale + self.scale // 2
+            return
         
         # If our pipeline allows it we arrange it so that the
         # fast parameters change fastest in the sequence.
@@ -88,6 +124,10 @@ class GridSampler(ParallelSampler):
         if self.sample_points is None:
             self.setup_sampling()
 
+        if self.adaptive:
+            self.execute_adaptive()
+            return
+
         #Chunk of tasks to do this run through, of size nstep.
         #This advances the self.sample_points forward so it knows
         #that these samples have been done
@@ -112,13 +152,83 @@ class GridSampler(ParallelSampler):
         #Update the count
         self.ndone += len(results)
 
-        #Save the results of the sampling
-        for sample, result  in zip(samples, results):
-            #Optionally save all the results calculated by each
-            #pipeline run to files
-            (prob, prior, extra) = result
-            #always save the usual text output
-            self.output.parameters(sample, extra, prior, prob)
+        #Save the results of the sampling, all in one go
+        prob, prior, extra = zip(*results)
+        self.output.parameters_batch(samples, extra, prior, prob)
+
+    def execute_adaptive(self):
+        # When the current level is finished, choose the boxes to refine
+        if len(self.sample_points) == 0:
+            self.refine()
+            if len(self.sample_points) == 0:
+                self.converged = True
+                return
+
+        centres = self.sample_points[:self.nstep]
+        self.sample_points = self.sample_points[self.nstep:]
+        samples = self.lower + (centres + 0.5) * self.step
+
+        sample_index = np.arange(len(samples)) + self.ndone
+        jobs = list(zip(sample_index, samples))
+
+        if self.pool:
+            results = self.pool.map(task, jobs)
+        else:
+            results = list(map(task, jobs))
+
+        self.ndone += len(results)
+
+        prob, prior, extra = zip(*results)
+        extra = np.array(extra, dtype=float).reshape((len(results), -1))
+        for c, p in zip(centres.tolist(), prob):
+            self.posts[tuple(c)] = p
+        self.level_results.append((centres, samples, extra, prior, prob))
+        level = np.repeat(self.level, len(samples))
+        self.output.parameters_batch(samples, extra, level, prior, prob)
+
+    def refine(self):
+        if self.level == self.refine_levels or not self.level_results:
+            return
+        centres, samples, extra, prior, prob = [np.concatenate(x) for x in zip(*self.level_results)]
+        self.level_results = []
+
+        # Refine boxes near the peak
+        peak = max(self.posts.values())
+        if not np.isfinite(peak):
+            print("No grid points had a finite posterior so I will not refine the grid")
+            self.level = self.refine_levels
+            return
+        cutoff = peak - self.refine_threshold
+        refine = prob >= cutoff
+
+        # And boxes next to those whose posterior is very different,
+        # since the high-posterior region may extend part way into them
+        side = self.scale // 3**self.level
+        for d in range(self.ndim):
+            for sign in [-1, 1]:
+                neighbours = centres.copy()
+                neighbours[:, d] += sign * side
+                neighbour_prob = np.array([self.posts.get(tuple(c), -np.inf) for c in neighbours.tolist()])
+                with np.errstate(invalid='ignore'):
+                    refine |= (neighbour_prob >= cutoff) & (np.abs(neighbour_prob - prob) > self.refine_difference)
+
+        self.level += 1
+        nrefine = refine.sum()
+        print("Refining {} of {} boxes to grid level {}".format(nrefine, len(refine), self.level))
+        if nrefine == 0:
+            return
+
+        # The parent sample is re-used as the middle child, so save it again
+        # at the new level.  Postprocessing only uses the finest copy.
+        level = np.repeat(self.level, nrefine)
+        self.output.parameters_batch(samples[refine], extra[refine], level, prior[refine], prob[refine])
+        self.level_results.append((centres[refine], samples[refine], extra[refine], prior[refine], prob[refine]))
+
+        # The other children need evaluating
+        child = side // 3
+        offsets = np.array([o for o in itertools.product([-1, 0, 1], repeat=self.ndim) if any(o)]) * child
+        children = centres[refine][:, np.newaxis, :] + offsets[np.newaxis, :, :]
+        self.sample_points = children.reshape((-1, self.ndim))
 
     def is_converged(self):
         return self.converged
@@ -1,8 +1,9 @@
-import itertools
-import collections
+import os
 import numpy as np
 
 from .. import ParallelSampler
+from ...output.text_output import TextColumnOutput
+from ...output.binary_output import BinaryOutput
 
 
 INI_SECTION = "importance"
@@ -14,45 +15,73 @@ def task(p):
 
 
 class ImportanceSampler(ParallelSampler):
-    #there are a bunch of these really, but we 
+    #there are a bunch of these really, but we
     #need to add them manually so that we can
     #keep the likelihood column at the end
     #so the postprocessors don't need to be re-written
     sampler_outputs = []
     parallel_output = False
+    supports_resume = True
 
     def config(self):
         global importance_pipeline
         importance_pipeline = self.pipeline
         self.input_filename = self.read_ini("input", str)
         self.nstep = self.read_ini("nstep", int, 128)
+        self.chunk_rows = self.read_ini("chunk_rows", int, 10000)
         self.add_to_likelihood = self.read_ini("add_to_likelihood", bool, False)
+        # Points repeated within a batch are only run once anyway, but
+        # this also catches repeats that are split between batches
+        if self.read_ini("cache_results", bool, False):
+            self.pipeline.enable_results_cache(self.read_ini("cache_size", int, 1000))
 
         self.converged = False
+        self.current_index = 0
+        self.number_evaluated = 0
         if self.is_master():
             self.load_samples(self.input_filename)
 
-    def load_samples(self, filename):
+    def open_input(self, filename):
+        """
+        Return the column names in the input chain and a RowReader for
+        its rows.  Text and binary chains are read a chunk at a time, so
+        they can be much larger than memory; other formats are loaded
+        in one go.
+        """
+        from ...postprocessing.streaming import ChainFileReader, RowReader
+        txt = TextColumnOutput.FILE_EXTENSION
+        npy = BinaryOutput.FILE_EXTENSION
+        for candidate in [filename, filename + txt, filename + npy]:
+            if not os.path.isfile(candidate):
+                continue
+            if candidate.endswith(txt) or candidate.endswith(npy) or isinstance(self.output, TextColumnOutput):
+                print("Reading samples from {} in chunks of {} rows".format(candidate, self.chunk_rows))
+                reader = ChainFileReader(candidate)
+                return reader.colnames, RowReader(reader.chunks(self.chunk_rows), len(reader.colnames))
+
         options = {"filename":filename}
         col_names, cols, metadata, comments, final_metadata = self.output.__class__.load_from_options(options)
+        print("Have %d samples from old chain." % len(cols[0]))
+        return col_names, RowReader(iter([cols[0]]), len(col_names))
+
+    def load_samples(self, filename):
+        col_names, self.input_rows = self.open_input(filename)
         # pull out the "post" column first
         col_names = [name.lower() for name in col_names]
-        likelihood_index = col_names.index('post')
-        if likelihood_index<0:
+        if 'post' not in col_names:
             raise ValueError("I could not find a 'post' column in the chain %s"%filename)
-        self.original_likelihoods = cols[0].T[likelihood_index]
+        self.likelihood_index = col_names.index('post')
 
         #We split the parameters into three groups:
         #   - ones that we have listed as varying
         #   - one that are fixed - WHAT SHOULD WE DO ABOUT THESE???
         #   - extras ones - these should be saved and put in the output
 
-        self.original_extras = collections.OrderedDict()
-        self.samples = []
-        self.varied_params = []
-        self.number_samples = len(cols[0])
-        print("Have %d samples from old chain." % self.number_samples)
-        for code,col in zip(col_names, cols[0].T):
+        # The indices of the columns to be copied to the output,
+        # and of the ones for the parameters we are varying
+        self.extra_indices = []
+        varied_indices = {}
+        for i,code in enumerate(col_names):
             #we have already handled the likelihood
             if code=='post':continue
             #parse the header names in to (section,name)
@@ -67,18 +96,17 @@ class ImportanceSampler(ParallelSampler):
                     #Record the values of this parameter for later importance
                     #sampling
                     print("Found column in both pipelines:", code)
-                    self.samples.append(col)
-                    self.varied_params.append(bits)
+                    varied_indices[(section,name)] = i
                 else:
                     print("Found column just in old pipeline:", code)
                     #This parameter was varied in the old code but is not
                     #here.  So we just save it for output
-                    self.original_extras[code] = col
+                    self.extra_indices.append(i)
                     self.output.add_column(code, float)
-            # anything here must be a sampler-specific 
+            # anything here must be a sampler-specific
             else:
                 print("Found non-parameter column:", code)
-                self.original_extras[code] = col
+                self.extra_indices.append(i)
                 if code=="weight":
                     code="old_weight"
                     print("Renaming weight -> old_weight")
@@ -91,56 +119,89 @@ class ImportanceSampler(ParallelSampler):
         self.output.add_column("log_weight", float) #This is the log-weight, the ratio of the likelihoods
         self.output.add_column("post", float) #This is the new likelihood, log(P')
 
-
-        #Now we need to reorder the list to match the order our pipeline is expecting
+        #Now we need to work out the order of columns our pipeline is expecting
         #If a parameter is not listed we use the starting value
-        reordered_cols = []
+        self.sample_indices = []
+        self.sample_starts = []
         for p in self.pipeline.varied_params:
-            try:
-                i = self.varied_params.index(p)
-            except ValueError:
-                i=-1
-            if i>=0:
-                col = self.samples[i]
-            else:
-                col = np.repeat(p.start,self.number_samples)
-            reordered_cols.append(col)
-        self.samples = np.transpose(reordered_cols)
-
-        self.current_index = 0
+            i = varied_indices.get((p.section, p.name), -1)
+            self.sample_indices.append(i)
+            self.sample_starts.append(p.start)
+        self.sample_indices = np.array(self.sample_indices, dtype=int)
+
+    def resume(self):
+        if not self.output.resumed:
+            return
+        info = self.read_resume_info()
+        if info is not None and info["input"] != self.input_filename:
+            raise ValueError("You are trying to resume importance sampling of {}, but the "
+                             "existing output was importance sampling {}".format(self.input_filename, info["input"]))
+
+        from ...postprocessing.streaming import ChainFileReader
+
+        # Samples are saved in the same order as the input, so the ones already
+        # in the output are the ones we can skip.  That can be a chunk more than
+        # the checkpoint if we were stopped between saving the two.
+        try:
+            done = ChainFileReader(self.output._filename).count_rows()
+        except (AttributeError, ValueError):
+            done = 0 if info is None else info["current_index"]
+        print("Resuming importance sampling - skipping {} samples that are already done".format(done))
+        while done > self.current_index:
+            rows = self.input_rows.read(min(done - self.current_index, self.chunk_rows))
+            if len(rows) == 0:
+                break
+            self.current_index += len(rows)
+        if self.current_index < done:
+            raise ValueError("The existing output has more samples ({}) than the input chain {} ({})".format(
+                done, self.input_filename, self.current_index))
 
     def execute(self):
-        self.output.comment("Importance sampling from %s"%self.input_filename)
+        if self.current_index == 0:
+            self.output.comment("Importance sampling from %s"%self.input_filename)
 
         #Pick out a chunk of samples to run on
-        start = self.current_index
-        end = start+self.nstep
-        samples_chunk = self.samples[start:end]
+        rows = self.input_rows.read(self.nstep)
+        if len(rows) < self.nstep:
+            self.converged = True
+        if len(rows) == 0:
+            return
+
+        # Build the sample vectors in the order the pipeline wants,
+        # using the start value for parameters not in the old chain
+        samples = np.tile(self.sample_starts, (len(rows), 1))
+        found = self.sample_indices >= 0
+        samples[:, found] = rows[:, self.sample_indices[found]]
+
+        # MCMC chains often repeat points, so only run the pipeline
+        # once on each distinct one and copy the results for the others
+        unique_samples, inverse = np.unique(samples, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
 
         #Run the pipeline on each of the samples
         if self.pool:
-            results = self.pool.map(task, samples_chunk)
+            results = self.pool.map(task, unique_samples)
         else:
-            results = list(map(task, samples_chunk))
-
-        #Collect together and output the results
-        for i,(sample, (new_like, extra)) in enumerate(zip(samples_chunk, results)):
-            #We already (may) have some extra values from the pipeline
-            #as derived parameters.  Add to those any parameters used in the
-            #old pipeline but not the new one
-            extra = list(extra)
-            for col in list(self.original_extras.values()):
-                extra.append(col[start+i])
-            #and then the old and new likelihoods
-            old_like = self.original_likelihoods[start+i]
-            if self.add_to_likelihood:
-                new_like += old_like
-            weight = new_like-old_like
-            extra = list(extra) + [old_like,weight,new_like]
-            #and save results
-            self.output.parameters(sample, extra)
-        #Update the current index
-        self.current_index+=self.nstep
+            results = list(map(task, unique_samples))
+        self.number_evaluated += len(unique_samples)
+
+        #Collect together and output the results.
+        #We already (may) have some extra values from the pipeline
+        #as derived parameters.  Add to those any parameters used in the
+        #old pipeline but not the new one, and then the old and new likelihoods
+        new_like = np.array([r[0] for r in results])[inverse]
+        extras = np.array([list(r[1]) for r in results], dtype=float).reshape((len(results), -1))[inverse]
+        old_like = rows[:, self.likelihood_index]
+        if self.add_to_likelihood:
+            new_like += old_like
+        weight = new_like - old_like
+        self.output.parameters_batch(samples, extras, rows[:, self.extra_indices], old_like, weight, new_like)
+
+        #Update the current index, and save it so we can resume
+        self.current_index += len(rows)
+        self.output.flush()
+        self.write_resume_info({"input": self.input_filename, "current_index": self.current_index})
+        print("Importance sampled {} samples ({} distinct)".format(self.current_index, self.number_evaluated))
 
     def is_converged(self):
-        return self.current_index>=self.number_samples
+        return self.converged
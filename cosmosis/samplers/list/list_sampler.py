@@ -1,11 +1,17 @@
-import itertools
+import os
 import numpy as np
 from cosmosis.output.text_output import TextColumnOutput
+from cosmosis.output.binary_output import BinaryOutput
 from .. import ParallelSampler
 
 
-def task(p):
-    i,p = p
+def task(job):
+    i,values = job
+    # Fill in the values from this row of the input file,
+    # keeping the other parameters at their starting values
+    p = list_sampler.start_vector[:]
+    for j, value in zip(list_sampler.replaced_indices, values):
+        p[j] = value
     results = list_sampler.pipeline.run_results(p, all_params=True)
     #If requested, save the data to file
     if list_sampler.save_name and results.block is not None:
@@ -17,6 +23,7 @@ def task(p):
 
 class ListSampler(ParallelSampler):
     parallel_output = False
+    supports_resume = True
     sampler_outputs = [("prior", float), ("post", float)]
 
     def config(self):
@@ -28,7 +35,18 @@ class ListSampler(ParallelSampler):
         self.save_name = self.read_ini("save", str, "")
         self.burn = self.read_ini("burn", int, 0)
         self.thin = self.read_ini("thin", int, 1)
+        self.nstep = self.read_ini("nstep", int, -1)
+        self.chunk_rows = self.read_ini("chunk_rows", int, 10000)
+        self.ndone = 0
         limits = self.read_ini("limits", bool, False)
+        # If the output order does not matter then under MPI or SMP
+        # we can write results as soon as each one is ready.
+        self.ordered = self.read_ini("ordered", bool, True)
+        # Chains often repeat the same point many times, so
+        # we can keep results to re-use for repeats.
+        if self.read_ini("cache_results", bool, False):
+            cache_size = self.read_ini("cache_size", int, 1000)
+            self.pipeline.enable_results_cache(cache_size, keep_blocks=bool(self.save_name))
 
         #overwrite the parameter limits
         if not limits:
@@ -49,13 +67,27 @@ class ListSampler(ParallelSampler):
                 for p,ptype in self.sampler_outputs:
                     self.output.add_column(p, ptype)
 
+        #Number of samples to do at once, between saving output.
+        #In parallel do four per process, otherwise 100.
+        if self.nstep == -1:
+            self.nstep = 4 * self.pool.size if self.pool else 100
 
-    def execute(self):
+        self.open_input()
+
+    def open_input(self):
+        from ...postprocessing.streaming import ChainFileReader, RowReader
+
+        filename = self.filename
+        for extension in ["", TextColumnOutput.FILE_EXTENSION, BinaryOutput.FILE_EXTENSION]:
+            if os.path.isfile(self.filename + extension):
+                filename = self.filename + extension
+                break
+        else:
+            raise ValueError("Could not find the input file {} for the list sampler".format(self.filename))
 
-        #Load in the filename that was requested
-        file_options = {"filename":self.filename}
-        column_names, samples, _, _, _ = TextColumnOutput.load_from_options(file_options)
-        samples = samples[0]
+        # This just reads the header; the samples are read a chunk at a time
+        reader = ChainFileReader(filename)
+        column_names = reader.colnames
         # find where in the parameter vector of the pipeline
         # each of the table parameters can be found
         replaced_params = []
@@ -64,7 +96,8 @@ class ListSampler(ParallelSampler):
             try:
                 section,name = column_name.split('--')
             except ValueError:
-                print("Not including column %s as not a cosmosis name" % column_name)
+                if self.is_master():
+                    print("Not including column %s as not a cosmosis name" % column_name)
                 continue
             section = section.lower()
             name = name.lower()
@@ -74,48 +107,101 @@ class ListSampler(ParallelSampler):
                 j = self.pipeline.parameters.index((section,name))
                 replaced_params.append((i,j))
             except ValueError:
-                print("Not including column %s as not in values file" % column_name)
-
-        #Create a collection of sample vectors at the start position.
-        #This has to be a list, not an array, as it can contain integer parameters,
-        #unlike most samplers
-        v0 = self.pipeline.start_vector(all_params=True, as_array=False)
-        sample_vectors = [v0[:] for i in range(len(samples))]
-        #Fill in the varied parameters. We are not using the
-        #standard parameter vector in the pipeline with its 
-        #split according to the ini file
-        for s, v in zip(samples, sample_vectors):
-            for i,j in replaced_params:
-                v[j] = s[i]
-
-        #Turn this into a list of jobs to be run 
-        #by the function above
-        sample_index = list(range(len(sample_vectors)))
-        jobs = list(zip(sample_index, sample_vectors))
-
-        #Run all the parameters
-        #This only outputs them all at the end
-        #which is a bit problematic, though you 
-        #can't use MPI and retain the output ordering.
-        #Have a few options depending on whether
-        #you care about this we should think about
-        #(also true for grid sampler).
-        if self.pool:
-            results = self.pool.map(task, jobs)
+                if self.is_master():
+                    print("Not including column %s as not in values file" % column_name)
+
+        # The columns of the file that we use, and where they go in the full
+        # parameter vector.  The workers only get sent the values from these
+        # columns, and fill them in to the starting vector.
+        # The starting vector has to be a list, not an array, as it can contain
+        # integer parameters, unlike most samplers
+        self.input_columns = np.array([i for (i,j) in replaced_params], dtype=int)
+        self.replaced_indices = np.array([j for (i,j) in replaced_params], dtype=int)
+        self.start_vector = self.pipeline.start_vector(all_params=True, as_array=False)
+
+        if self.is_master():
+            self.input_rows = RowReader(reader.chunks(self.chunk_rows), len(column_names))
+            self.input_rows.read(self.burn)
+
+    def skip_rows(self, n):
+        while n > 0:
+            rows = self.input_rows.read(min(n, self.chunk_rows))
+            if len(rows) == 0:
+                break
+            n -= len(rows)
+
+    def resume(self):
+        if not self.output.resumed:
+            return
+        if not self.ordered:
+            raise ValueError("The list sampler can only resume runs where ordered=T, "
+                             "since otherwise we can't tell which samples are done")
+        from ...postprocessing.streaming import ChainFileReader
+
+        # Each row of the output is one of the samples, in order.  If we
+        # can't read the output file back we use the last checkpoint.
+        try:
+            done = ChainFileReader(self.output._filename).count_rows()
+        except (AttributeError, ValueError):
+            try:
+                info = self.read_resume_info()
+            except NotImplementedError:
+                info = None
+            if info is None:
+                raise ValueError("The list sampler cannot resume from this kind of output, "
+                                 "since it can't tell which samples are done")
+            done = info["ndone"]
+        print("Resuming the list sampler - skipping {} samples that are already done".format(done))
+        self.skip_rows(done * self.thin)
+        self.ndone = done
+
+    def execute(self):
+        #Chunk of tasks to do this run through, of size nstep,
+        #once we have thinned them.
+        rows = self.input_rows.read(self.nstep * self.thin)
+        if len(rows) < self.nstep * self.thin:
+            self.converged = True
+        rows = rows[::self.thin]
+        if len(rows) == 0:
+            return
+
+        #Turn this into a list of jobs to be run
+        #by the function above. Each job has an index number
+        #in case we are saving the output results from each one
+        values = rows[:, self.input_columns]
+        sample_index = np.arange(len(rows)) + self.ndone
+        jobs = list(zip(sample_index, values))
+
+        #The complete parameter vectors, for the output
+        samples = np.tile(np.array(self.start_vector, dtype=float), (len(rows), 1))
+        samples[:, self.replaced_indices] = values
+
+        #Run all the parameters.
+        #If we don't care about the output ordering then
+        #we can save each result as soon as it is done.
+        #Otherwise this only outputs them at the end of the chunk.
+        if self.pool and not self.ordered:
+            futures = [self.pool.submit(task, job) for job in jobs]
+            for future in self.pool.as_completed(futures):
+                i, _ = future.task
+                (prob, (prior,extra)) = future.result()
+                self.output.parameters(samples[i - self.ndone], extra, prior, prob)
         else:
-            results = list(map(task, jobs))
-
-        #Save the results of the sampling
-        #We now need to abuse the output code a little.
-        for sample, result  in zip(sample_vectors, results):
-            #Optionally save all the results calculated by each
-            #pipeline run to files
-            (prob, (prior,extra)) = result
-            #always save the usual text output
-            self.output.parameters(sample, extra, prior, prob)
-        #We only ever run this once, though that could 
-        #change if we decide to split up the runs
-        self.converged = True
+            if self.pool:
+                results = self.pool.map(task, jobs)
+            else:
+                results = list(map(task, jobs))
+
+            #Save the results of the sampling, all in one go
+            prob = [result[0] for result in results]
+            prior = [result[1][0] for result in results]
+            extra = [result[1][1] for result in results]
+            self.output.parameters_batch(samples, extra, prior, prob)
+
+        #Either way the whole chunk is now done
+        self.ndone += len(rows)
+        self.output.flush()
+        self.write_resume_info({"input": self.filename, "ndone": self.ndone})
 
     def is_converged(self):
         return self.converged
@@ -1,5 +1,6 @@
 import numpy as np
 from .proposal.standard import Proposal, FastSlowProposal
+from ...runtime.analytics import Analytics
 from copy import copy
 
 
@@ -57,10 +58,12 @@ class MCMC(object):
         else:
             self.proposal = Proposal(cholesky, scaling=scaling, exponential_probability=exponential_probability)
 
-        #For adaptive sampling
+        #For adaptive sampling.  We keep running estimates of the mean
+        #and covariance of the chain rather than the chain itself, so
+        #that tuning and saving the sampler don't get slower as it grows.
         self.last_covariance_estimate = covariance.copy()       
         self.covariance_estimate = covariance.copy()
-        self.chain = []
+        self.chain_statistics = Analytics(range(self.ndim))
         self.n_cov_fail = 0
 
         #self.covariance_estimate.copy()
@@ -97,8 +100,7 @@ class MCMC(object):
             # generate a new sample
             s = sample_method()
             samples.append(s)
-            # hack - should unify these
-            self.chain.append(s.vector)
+            self.chain_statistics.add_traces(np.atleast_2d(s.vector))
 
             if self.should_tune_now():
                 self.tune()
@@ -231,20 +233,23 @@ class MCMC(object):
         )
 
 
+    def __setstate__(self, state):
+        # Resume files from older versions stored the complete chain
+        # instead of its running statistics
+        chain = state.pop("chain", None)
+        self.__dict__.update(state)
+        if chain is not None:
+            self.chain_statistics = Analytics(range(self.ndim))
+            if chain:
+                self.chain_statistics.add_traces(np.array(chain))
+
     def update_covariance_estimate(self):
-        n = self.iterations
-        self.mean_estimate = np.mean(self.chain, axis=0)
-        C = np.cov(np.transpose(self.chain))
-        if is_positive_definite(C):
+        self.mean_estimate = self.chain_statistics.means.copy()
+        C = self.chain_statistics.covariance()
+        if C is not None and is_positive_definite(C):
             self.covariance_estimate = C
         else:
             print("Cov estimate not SPD.  If this keeps happening, be concerned.")
-            # chain_outfile = 'joe_dump_chain_{}.txt'.format(self.n_cov_fail)
-            # cov_outfile = 'joe_dump_cov_{}.txt'.format(self.n_cov_fail)
-            # self.n_cov_fail += 1
-            # np.savetxt(chain_outfile, self.chain)
-            # np.savetxt(cov_outfile, np.transpose(C))
-            # print("TEMPORARY (JOE - REMOVE LATER) - dumping to file")
 
 
     def set_fast_slow(self, fast_indices, slow_indices, oversampling):
@@ -303,4 +308,10 @@ def accept(post1, post0):
     return (post1 > post0) or (post1-post0 > np.log(np.random.uniform(0,1)))
 
 def is_positive_definite(M):
-    return np.all(np.linalg.eigvals(M) > 0)
+    # Cholesky decomposition is much cheaper than finding the
+    # eigenvalues, and fails exactly when M is not positive definite
+    try:
+        np.linalg.cholesky(M)
+    except np.linalg.LinAlgError:
+        return False
+    return True
@@ -105,7 +105,11 @@ class MetropolisSampler(ParallelSampler):
         if resume_info is None:
             return
 
-        self.sampler, self.num_samples, self.num_samples_post_tuning = resume_info
+        self.sampler, self.num_samples, self.num_samples_post_tuning = resume_info[:3]
+        # The proposals and acceptance tests use numpy's global random state.
+        # Files from older versions did not save it.
+        if len(resume_info) > 3:
+            np.random.set_state(resume_info[3])
 
         # Fast slow is already configured on the sampler.
         self.fast_slow_done = True
@@ -176,7 +180,8 @@ class MetropolisSampler(ParallelSampler):
         if self.num_samples_post_tuning <= 0:
             print("Tuning ends at {} samples\n".format(self.tuning_end))
 
-        self.write_resume_info([self.sampler, self.num_samples, self.num_samples_post_tuning])
+        self.write_resume_info([self.sampler, self.num_samples, self.num_samples_post_tuning,
+                                np.random.get_state()])
 
     def is_converged(self):
          # user has pressed Ctrl-C
@@ -221,14 +221,13 @@ class MultinestSampler(ParallelSampler):
         self.log_z = ins_log_z if self.importance else log_z
         self.log_z_err = log_z_err
         data = np.array([posterior[i] for i in range(n*(self.npar+2))]).reshape((self.npar+2, n))
-        for row in data.T:
-            params = row[:self.ndim]
-            extra_vals = row[self.ndim:self.npar-2]
-            prior = row[self.npar-2]
-            post = row[self.npar-1]
-            like = row[self.npar]
-            importance = row[self.npar+1]
-            self.output.parameters(params, extra_vals, prior, like, post, importance)
+        params = data[:self.ndim].T
+        extra_vals = data[self.ndim:self.npar-2].T
+        prior = data[self.npar-2]
+        post = data[self.npar-1]
+        like = data[self.npar]
+        importance = data[self.npar+1]
+        self.output.parameters_batch(params, extra_vals, prior, like, post, importance)
         self.output.final("nsample", n)
         self.output.flush()
 
@@ -3,8 +3,7 @@ import numpy as np
 import os
 
 
-def log_probability_function(p):
-    r = pipeline.run_results(p)
+def results_tuple(r):
     out = [r.like, r.prior]
 
     # Flatten any vector outputs here
@@ -17,10 +16,29 @@ def log_probability_function(p):
     return out
 
 
+def log_probability_function(p):
+    r = pipeline.run_results(p)
+    return results_tuple(r)
+
+
+def log_probability_batch(P):
+    # In vectorized mode nautilus splits the points between the
+    # processes itself and wants an array for each output
+    rows = [results_tuple(r) for r in pipeline.run_results_batch(P)]
+    if not rows:
+        nextra = len(pipeline.output_names()) - pipeline.nvaried
+        return tuple(np.zeros(0) for i in range(2 + nextra))
+    return tuple(np.array(column) for column in zip(*rows))
+
+
 def prior_transform(p):
     return pipeline.denormalize_vector_from_prior(p)
 
 
+def prior_transform_batch(P):
+    return np.array([pipeline.denormalize_vector_from_prior(p) for p in P])
+
+
 class NautilusSampler(ParallelSampler):
     parallel_output = False
     internal_resume = True
@@ -51,6 +69,9 @@ class NautilusSampler(ParallelSampler):
             self.discard_exploration = self.read_ini(
                 "discard_exploration", bool, False)
             self.verbose = self.read_ini("verbose", bool, False)
+            # Run the pipeline on each process's share of a batch at
+            # once, for modules that can process several points together
+            self.batch = self.read_ini("batch", bool, False)
 
         self.converged = False
 
@@ -69,9 +90,14 @@ class NautilusSampler(ParallelSampler):
             if self.resume_ and os.path.exists(resume_filepath):
                 print(f"Resuming Nautilus from file {resume_filepath}")
 
+        if self.batch:
+            prior, likelihood = prior_transform_batch, log_probability_batch
+        else:
+            prior, likelihood = prior_transform, log_probability_function
+
         sampler = Sampler(
-            prior_transform,
-            log_probability_function,
+            prior,
+            likelihood,
             n_dim,
             n_live=self.n_live,
             n_update=self.n_update,
@@ -84,6 +110,7 @@ class NautilusSampler(ParallelSampler):
             filepath=resume_filepath,
             resume=self.resume_,
             pool=self.pool,
+            vectorized=self.batch,
             blobs_dtype=float
         )
 
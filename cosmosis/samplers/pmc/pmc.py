@@ -1,5 +1,6 @@
 from numpy import pi, dot, exp, einsum
 import numpy as np
+from ..sampler import batch_map
 
 
 class PopulationMonteCarlo(object):
@@ -13,16 +14,19 @@ class PopulationMonteCarlo(object):
 
 
 	"""
-	def __init__(self, posterior, n, start, sigma, pool=None, quiet=False, student=False, nu=2.0):
+	def __init__(self, posterior, n, start, sigma, pool=None, quiet=False, student=False, nu=2.0, posterior_batch=None):
 		"""
 		posterior: the posterior function
 		n: number of components to use in the mixture
 		start: estimated mean of the distribution
 		sigma: estimated covariance matrix
 		pool (optional): an MPI or multiprocessing worker pool
+		posterior_batch (optional): a function giving the posterior results
+		    for a list of points at once, used instead of posterior
 
 		"""
 		self.posterior = posterior
+		self.posterior_batch = posterior_batch
 		mu = np.random.multivariate_normal(start, sigma, size=n)
 
 		if student:
@@ -40,7 +44,9 @@ class PopulationMonteCarlo(object):
 		component_index, x = self.draw(n)
 
 		#calculate likelihoods
-		if self.pool is None:
+		if self.posterior_batch is not None:
+			samples = batch_map(self.posterior_batch, x, self.pool)
+		elif self.pool is None:
 			samples = list(map(self.posterior, x))
 		else:
 			samples = self.pool.map(self.posterior, x)
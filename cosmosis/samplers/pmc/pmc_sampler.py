@@ -11,6 +11,10 @@ def posterior(p):
     r = pipeline.run_results(p)
     return r.post, (r.prior, r.extra)
 
+def posterior_batch(P):
+    results = pipeline.run_results_batch(P)
+    return [(r.post, (r.prior, r.extra)) for r in results]
+
 
 class PmcSampler(ParallelSampler):
     parallel_output = False
@@ -26,6 +30,9 @@ class PmcSampler(ParallelSampler):
             default=1000)
         self.final_samples = self.read_ini("final_samples", int, 
             default=5000)
+        # Run the pipeline on each process's share of the samples at
+        # once, for modules that can process several points together
+        batch = self.read_ini("batch", bool, default=False)
 
         #Student's t mode
         student = self.read_ini("student", bool, default=False)
@@ -50,7 +57,8 @@ class PmcSampler(ParallelSampler):
         #Sampler object itself.
         quiet = self.pipeline.quiet
         self.sampler = pmc.PopulationMonteCarlo(posterior, self.n_components, 
-            start, covmat, quiet=quiet, student=student, nu=nu, pool=self.pool)
+            start, covmat, quiet=quiet, student=student, nu=nu, pool=self.pool,
+            posterior_batch=posterior_batch if batch else None)
 
         self.interrupted = False
         self.iterations = 0
@@ -312,15 +312,13 @@ class PolychordSampler(ParallelSampler):
         self.log_z_err = log_z_err
         data = np.array([dead[i] for i in range(npars*ndead)]).reshape((ndead, npars))
         logw = np.array([logweights[i] for i in range(ndead)])
-        for row, w in zip(data,logw):
-            params = row[:self.ndim]
-            extra_vals = row[self.ndim:self.ndim+self.nderived-1]
-            prior = row[self.ndim+self.nderived-1]
-            birth_like = row[self.ndim+self.nderived]
-            like = row[self.ndim+self.nderived+1]
-            importance = np.exp(w)
-            post = like + prior
-            self.output.parameters(params, extra_vals, prior, like, post, importance)
+        params = data[:, :self.ndim]
+        extra_vals = data[:, self.ndim:self.ndim+self.nderived-1]
+        prior = data[:, self.ndim+self.nderived-1]
+        like = data[:, self.ndim+self.nderived+1]
+        importance = np.exp(logw)
+        post = like + prior
+        self.output.parameters_batch(params, extra_vals, prior, like, post, importance)
         self.output.final("nsample", ndead)
         self.output.flush()
 
@@ -3,6 +3,7 @@ from ..runtime.utils import get_git_revision
 from ..runtime import Inifile
 from ..output import InMemoryOutput
 import datetime
+import importlib
 import platform
 import getpass
 import os
@@ -14,13 +15,67 @@ import shutil
 import numpy as np
 import configparser
 
+# The modules, relative to this package, defining the built-in samplers.
+# These are only imported when a sampler is first looked up, since many
+# of them import large libraries, and every MPI process of a run (and
+# every postprocessing run) would otherwise pay to import all of them.
+builtin_samplers = {
+    "abc": "abc.abc_sampler",
+    "apriori": "apriori.apriori_sampler",
+    "dynesty": "dynesty.dynesty_sampler",
+    "emcee": "emcee.emcee_sampler",
+    "fisher": "fisher.fisher_sampler",
+    "grid": "grid.grid_sampler",
+    "gridmax": "gridmax.gridmax_sampler",
+    "importance": "importance.importance_sampler",
+    "kombine": "kombine.kombine_sampler",
+    "list": "list.list_sampler",
+    "maxlike": "maxlike.maxlike_sampler",
+    "metropolis": "metropolis.metropolis_sampler",
+    "minuit": "minuit.minuit_sampler",
+    "multinest": "multinest.multinest_sampler",
+    "nautilus": "nautilus.nautilus_sampler",
+    "pmaxlike": "pmaxlike.pmaxlike_sampler",
+    "pmc": "pmc.pmc_sampler",
+    "poco": "poco.poco_sampler",
+    "polychord": "polychord.polychord_sampler",
+    "pymc": "pymc.pymc_sampler",
+    "snake": "snake.snake_sampler",
+    "star": "star.star_sampler",
+    "test": "test.test_sampler",
+    "zeus": "zeus.zeus_sampler",
+}
+
+
+class SamplerRegistry(dict):
+    """
+    A dictionary of sampler classes by name, which imports built-in
+    samplers the first time they are looked up.  Samplers defined
+    anywhere else are added when their class is created, as before.
+    """
+    def __missing__(self, name):
+        if name not in builtin_samplers:
+            raise KeyError(name)
+        importlib.import_module("." + builtin_samplers[name], __package__)
+        return dict.__getitem__(self, name)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in builtin_samplers
+
+    def names(self):
+        "All the available sampler names, without importing any"
+        return sorted(set(self.keys()) | set(builtin_samplers))
+
+
 # Sampler metaclass that registers each of its subclasses
 
 class RegisteredSampler(type):
-    registry = {}
+    registry = SamplerRegistry()
     def __new__(meta, name, bases, class_dict):
         if name.endswith("Sampler"):
-            meta.registry = {name : cls for name, cls in meta.registry.items() if cls not in bases}
+            for key, cls in list(meta.registry.items()):
+                if cls in bases:
+                    del meta.registry[key]
             config_name = name[:-len("Sampler")].lower()
             cls = type.__new__(meta, name, bases, class_dict)
             cls.name = config_name
@@ -154,7 +209,7 @@ class Sampler(metaclass=RegisteredSampler):
     @classmethod
     def get_sampler(cls, name):
         try:
-            cls.registry[name.lower()]
+            return cls.registry[name.lower()]
         except KeyError:
             raise KeyError(f"Unknown sampler {name}")
 
@@ -230,6 +285,23 @@ class ParallelSampler(Sampler):
         return self.pool is None or self.pool.is_master()
 
 
+def batch_map(function, points, pool=None):
+    """
+    Apply a function that takes a list of points and returns a list of
+    results to all of `points`, splitting them into one chunk per
+    process if a pool is in use.  Returns the combined list of results.
+    """
+    points = list(points)
+    if pool is None:
+        return list(function(points))
+    chunks = [points[i::pool.size] for i in range(pool.size)]
+    chunk_results = pool.map(function, chunks)
+    results = [None for p in points]
+    for i, chunk_result in enumerate(chunk_results):
+        results[i::pool.size] = chunk_result
+    return results
+
+
 # These are marked as deprecated in emcee, so I moved them here.
 # I think I wrote the first one.  And I've rewritten the second
 # to use the first
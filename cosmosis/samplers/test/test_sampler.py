@@ -1,6 +1,7 @@
 from .. import Sampler
 import numpy as np
 from ...runtime import pipeline
+from ...datablock import DataBlock
 import sys
 
 
@@ -19,6 +20,9 @@ class TestSampler(Sampler):
         self.graph = self.read_ini("graph", str, "")
         self.analyze_fast_slow = self.read_ini("analyze_fast_slow", bool, False)
         self.print_log = self.read_ini("print_log", bool, False)
+        # There is only one run, so keep its full log for
+        # print_log and the graph
+        self.pipeline.block_log_level = DataBlock.LOG_FULL
 
     def execute(self):
         # load initial parameter values
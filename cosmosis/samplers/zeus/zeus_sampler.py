@@ -1,4 +1,5 @@
 from .. import ParallelSampler, sample_ellipsoid, sample_ball
+from ..sampler import batch_map
 import numpy as np
 import sys
 
@@ -7,6 +8,15 @@ def log_probability_function(p):
     r = zeus_pipeline.run_results(p)
     return r.post, (r.prior, r.extra)
 
+def log_probability_batch(P):
+    results = zeus_pipeline.run_results_batch(P)
+    return [(r.post, (r.prior, r.extra)) for r in results]
+
+def log_probability_vectorized(P):
+    # In vectorize mode zeus calls this once with every walker
+    # position, and ignores the pool, so we split them up ourselves.
+    return batch_map(log_probability_batch, P, zeus_sampler_pool)
+
 
 class ZeusSampler(ParallelSampler):
     parallel_output = False
@@ -14,8 +24,9 @@ class ZeusSampler(ParallelSampler):
     sampler_outputs = [("prior", float), ("post", float)]
 
     def config(self):
-        global zeus_pipeline
+        global zeus_pipeline, zeus_sampler_pool
         zeus_pipeline = self.pipeline
+        zeus_sampler_pool = self.pool
 
         if self.is_master():
             import emcee
@@ -76,6 +87,9 @@ class ZeusSampler(ParallelSampler):
             self.patience = self.read_ini("patience", int, 5)
             self.maxiter = self.read_ini("maxiter", int, 10000)
             self.verbose = self.read_ini("verbose", bool, False)
+            # Run the pipeline on all the walkers at once, for
+            # modules that can process several points together
+            self.batch = self.read_ini("batch", bool, False)
 
             #Starting positions and values for the chain
             self.num_samples = 0
@@ -122,15 +136,20 @@ class ZeusSampler(ParallelSampler):
 
             #Finally we can create the sampler
             self.started = False
+            if self.batch:
+                function, pool = log_probability_vectorized, None
+            else:
+                function, pool = log_probability_function, self.pool
             self.sampler = self.zeus.EnsembleSampler(self.nwalkers, self.ndim,
-                                                     log_probability_function,
+                                                     function,
                                                      tune=self.tune,
                                                      tolerance=self.tolerance,
                                                      maxsteps=self.maxsteps,
                                                      patience=self.patience,
                                                      maxiter=self.maxiter,
                                                      verbose=self.verbose,
-                                                     pool=self.pool)
+                                                     vectorize=self.batch,
+                                                     pool=pool)
 
     def resume(self):
         resume_info = self.read_resume_info()
@@ -153,6 +153,27 @@ void test_copy()
 }
 
 
+void test_hash()
+{
+  DataBlock b;
+  b.put_val("A", "x", 2.5);
+  b.put_val("A", "s", string("dog"));
+  b.put_val("A", "v", vector<double>{1,2,3});
+  vector<string> sections{"A", "a", "A"};
+  vector<string> names{"x", "s", "V"};
+  std::uint64_t h1 = 0, h2 = 0;
+  assert(b.hash_values(sections, names, 0, h1)==DBS_SUCCESS);
+  DataBlock c(b);
+  assert(c.hash_values(sections, names, 0, h2)==DBS_SUCCESS);
+  assert(h1 == h2);
+  assert(c.replace_val("A", "v", vector<double>{1,2,4})==DBS_SUCCESS);
+  assert(c.hash_values(sections, names, 0, h2)==DBS_SUCCESS);
+  assert(h1 != h2);
+  assert(b.hash_values(sections, names, 1, h2)==DBS_SUCCESS);
+  assert(h1 != h2);
+  names[2] = "w";
+  assert(b.hash_values(sections, names, 0, h2)==DBS_NAME_NOT_FOUND);
+}
 
 void test_types()
 {
@@ -213,6 +234,7 @@ int main()
   test_types();
   test_delete();
   test_copy();
+  test_hash();
 
   test_multidim(1.5, vector<size_t>{3,4,5});
 }
@@ -178,6 +178,245 @@ def test_wrong_array_type():
             with pytest.raises(errors.BlockWrongValueType):
                 get(section, key)
 
+def test_hash_values():
+    b = DataBlock()
+    b['a', 'x'] = 1.5
+    b['a', 'v'] = np.arange(4.0)
+    b['a', 's'] = "hello"
+    b['b', 'g'] = np.ones((2, 3))
+    b['b', 'other'] = 7
+    keys = [('a', 'x'), ('a', 'v'), ('a', 's'), ('B', 'G')]
+    h = b.hash_values(keys)
+
+    # Same contents in a different block give the same hash,
+    # and keys that are not listed do not matter
+    c = b.clone()
+    c['b', 'other'] = 8
+    assert c.hash_values(keys) == h
+    assert c.hash_values(DataBlock.encode_keys(keys)) == h
+
+    # Any change to a listed value changes it
+    c['a', 'v'] = np.array([0.0, 1.0, 2.0, 3.5])
+    assert c.hash_values(keys) != h
+    c = b.clone()
+    c['a', 's'] = "hellp"
+    assert c.hash_values(keys) != h
+    c = b.clone()
+    c['b', 'g'] = np.ones((3, 2))
+    assert c.hash_values(keys) != h
+
+    # So does the seed
+    assert b.hash_values(keys, seed=1) != h
+
+    with pytest.raises(errors.BlockNameNotFound):
+        b.hash_values([('a', 'x'), ('a', 'missing')])
+
+def test_npz_round_trip():
+    b = DataBlock()
+    b['a', 'i'] = 3
+    b['a', 'b'] = True
+    b['a', 'x'] = 1.5
+    b['a', 'z'] = 1.0 + 2.0j
+    b['a', 's'] = "hello"
+    b['a', 'vi'] = np.arange(3)
+    b['a', 'vd'] = np.arange(3.0)
+    b['a', 'vs'] = ["x", "yy"]
+    b['b', 'g'] = np.ones((2, 3))
+    b.put_double_array_nd('b', 'nd1', np.ones(4))
+    b.put_metadata('a', 'x', 'unit', 'Mpc')
+
+    # Saving does not add to the log
+    b.set_log_level(b.LOG_FULL)
+    log_count = b.get_log_count()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "block.npz")
+        b.save_to_npz(filename)
+        assert b.get_log_count() == log_count
+        assert b.get_log_level() == b.LOG_FULL
+
+        c = DataBlock()
+        c.update_from_npz(filename)
+        d = DataBlock()
+        d['a', 'x'] = 9.0
+        d.update_from_npz(filename, replace=False)
+        assert d['a', 'x'] == 9.0
+
+    keys = b.keys()
+    assert sorted(c.keys()) == sorted(keys)
+    assert c.hash_values(keys) == b.hash_values(keys)
+    assert isinstance(c['a', 'i'], int)
+    assert list(c['a', 'vs']) == ["x", "yy"]
+    assert c.get_metadata('a', 'x', 'unit') == 'Mpc'
+
+def test_array_views():
+    b = DataBlock()
+    b['a', 'v'] = np.arange(5.0)
+    b['a', 'g'] = np.arange(12.0).reshape(3, 4)
+    b['a', 'i'] = np.arange(3)
+
+    v = b.view_double_array('a', 'v')
+    g = b.view_double_array('a', 'g')
+    assert np.all(v == np.arange(5.0))
+    assert g.shape == (3, 4)
+    assert np.all(b.view_int_array('a', 'i') == np.arange(3))
+
+    # Views share memory with the block and cannot be written to
+    assert not g.flags.writeable
+    assert np.shares_memory(g, b.view_double_array('a', 'g'))
+    with pytest.raises(ValueError):
+        g[0, 0] = 1.0
+
+    # They can be put straight back into a block
+    b['a', 'g2'] = g
+    assert np.all(b['a', 'g2'] == g)
+
+    # Replacing or deleting the value, or deleting the block, leaves
+    # the view with the old values
+    b.put_double_array_1d('s', 'x', np.arange(2e5))
+    x = b.view_double_array('s', 'x')
+    b.replace_double_array_1d('s', 'x', np.ones(400000))
+    assert np.all(x == np.arange(2e5))
+    assert b.view_double_array('s', 'x').sum() == 400000
+    x = b.view_double_array('s', 'x')
+    b.replace_double_array_1d('s', 'x', np.zeros(3))
+    assert x.sum() == 400000
+    b._delete_section('s')
+    assert x.sum() == 400000
+    del b
+    assert g.sum() == 66.0
+
+    c = DataBlock()
+    c['a', 's'] = "hello"
+    with pytest.raises(errors.BlockWrongValueType):
+        c.view_double_array('a', 's')
+    with pytest.raises(errors.BlockNameNotFound):
+        c.view_double_array('a', 'missing')
+
+def test_get_put_many():
+    b = DataBlock()
+    keys = [('a', 'x'), ('a', 'y'), ('b', 'z')]
+    b.put_many(keys, [1.0, np.float64(2.0), 3.0])
+    assert b.get_many(keys) == [1.0, 2.0, 3.0]
+
+    # existing values are replaced, and pre-encoded keys work too
+    encoded = DataBlock.encode_keys(keys)
+    b.put_many(encoded, [4.0, 5.0, 6.0])
+    assert b.get_many(encoded) == [4.0, 5.0, 6.0]
+    assert b['b', 'z'] == 6.0
+
+    # other types fall back to the generic methods
+    b.put_many([('a', 'i'), ('a', 's')], [3, "dog"])
+    assert b.get_many([('a', 'x'), ('a', 'i'), ('a', 's')]) == [4.0, 3, "dog"]
+    assert isinstance(b['a', 'i'], int)
+
+    with pytest.raises(errors.BlockNameNotFound):
+        b.get_many([('a', 'x'), ('a', 'missing')])
+    with pytest.raises(errors.BlockWrongValueType):
+        b.put_many([('a', 'x'), ('a', 'i')], [1.0, 2.0])
+    assert b['a', 'x'] == 1.0
+    with pytest.raises(ValueError):
+        b.put_many(keys, [1.0])
+
+
+def test_log_bytes():
+    b = DataBlock()
+    b['a', 'x'] = np.zeros(10)
+    b['a', 'y'] = 1
+    n = b.get_log_count()
+    b['A', 'X']
+    b['a', 'z'] = "hello"
+    b['a', 'y'] = 2
+    assert b.get_log_bytes() == (80, 80 + 4 + 5 + 4)
+    assert b.get_log_bytes(n) == (80, 5 + 4)
+
+
+def test_log_level():
+    b = DataBlock()
+    assert b.get_log_level() == DataBlock.LOG_FULL
+
+    b.set_log_level(DataBlock.LOG_OFF)
+    b['a', 'x'] = 1.0
+    b['a', 'x']
+    b.log_access("MODULE-START", "m", "")
+    assert b.get_log_count() == 0
+
+    # Only the first of each kind of access is kept, and module markers
+    b.set_log_level(DataBlock.LOG_FIRST_USE)
+    b.log_access("MODULE-START", "m1", "")
+    b['a', 'x']
+    b['a', 'x'] = 2.0
+    b['a', 'x'] = 3.0
+    b.log_access("MODULE-START", "m2", "")
+    b['a', 'x']
+    b['a', 'y'] = 1
+    log = [b.get_log_entry(i)[:3] for i in range(b.get_log_count())]
+    assert log == [
+        ("MODULE-START", "m1", ""),
+        ("READ-OK", "a", "x"),
+        ("REPLACE-OK", "a", "x"),
+        ("MODULE-START", "m2", ""),
+        ("WRITE-OK", "a", "y"),
+    ]
+
+    b.set_log_level(DataBlock.LOG_FULL)
+    b['a', 'x']
+    b['a', 'x']
+    assert b.get_log_count() == len(log) + 2
+    assert b.get_log_entry(len(log) + 1) == ("READ-OK", "a", "x", "double")
+    # Clones keep the log and the level
+    c = b.clone()
+    assert c.get_log_count() == b.get_log_count()
+    assert c.get_log_level() == DataBlock.LOG_FULL
+
+    with pytest.raises(ValueError):
+        b.set_log_level(3)
+
+
+def test_clone_copy_on_write():
+    b = DataBlock()
+    b['a', 'x'] = 1.0
+    b['a', 'v'] = np.arange(5.0)
+    b['b', 'm'] = np.ones((3, 4))
+    c = b.clone()
+
+    # Changes to either block are not seen by the other
+    c['a', 'x'] = 2.0
+    c['a', 'v'] = np.arange(5.0) + 1
+    c['a', 'new'] = 3
+    b['b', 'm'] = np.zeros((3, 4))
+    c._delete_section('b')
+    b['c', 'y'] = "hello"
+
+    assert b['a', 'x'] == 1.0
+    assert c['a', 'x'] == 2.0
+    assert np.all(b['a', 'v'] == np.arange(5.0))
+    assert np.all(c['a', 'v'] == np.arange(5.0) + 1)
+    assert not b.has_value('a', 'new')
+    assert np.all(b['b', 'm'] == 0)
+    assert not c.has_section('b')
+    assert not c.has_section('c')
+
+    # Clones of clones
+    d = c.clone()
+    d['a', 'x'] = 4.0
+    assert c['a', 'x'] == 2.0
+    assert b['a', 'x'] == 1.0
+
+
+def test_reset():
+    b = DataBlock()
+    b.set_log_level(DataBlock.LOG_FIRST_USE)
+    b['a', 'x'] = 1.0
+    b['a', 'x']
+    b.reset()
+    assert list(b.keys()) == []
+    assert b.get_log_count() == 0
+    assert b.get_log_level() == DataBlock.LOG_FIRST_USE
+    # The first-use record is cleared too
+    b['a', 'x'] = 2.0
+    assert b.get_log_count() == 1
+    assert b['a', 'x'] == 2.0
+
 
 if __name__ == '__main__':
     # test_string_array()
@@ -75,7 +75,44 @@ def test_single_gaussian():
     assert np.isclose(block["likelihoods", "xxx_like"], -50.0 - np.log(0.1))
 
 
-if __name__ == '__main__':
-    test_gaussian()
+def test_gaussian_batch():
+    class MyLikelihood(GaussianLikelihood):
+        x_section = "aaa"
+        x_name = "a"
+        y_section = "bbb"
+        y_name = "b"
+        like_name = "lll"
 
+        def build_data(self):
+            x_obs = np.array([1.0, 2.0, 3.0])
+            y_obs = x_obs * 2
+            return x_obs, y_obs
 
+        def build_covariance(self):
+            return np.array([[0.1, 0.02, 0.0], [0.02, 0.1, 0.0], [0.0, 0.0, 0.2]])
+
+    mod = MyLikelihood.as_module("my")
+    mod.setup({"my":{"include_norm":True}})
+    assert mod.execute_batch_function is not None
+
+    blocks = []
+    singles = []
+    for scale in [1.0, 1.5, 2.5]:
+        for b in [blocks, singles]:
+            block = DataBlock()
+            block["aaa", "a"] = np.arange(5.)
+            block["bbb", "b"] = np.arange(5.) * scale
+            b.append(block)
+
+    status = mod.execute_batch(blocks)
+    assert status == [0, 0, 0]
+
+    for block, single in zip(blocks, singles):
+        assert mod.execute(single) == 0
+        assert np.isclose(block["data_vector", "lll_chi2"], single["data_vector", "lll_chi2"])
+        assert np.isclose(block["likelihoods", "lll_like"], single["likelihoods", "lll_like"])
+        assert np.allclose(block["data_vector", "lll_theory"], single["data_vector", "lll_theory"])
+
+
+if __name__ == '__main__':
+    test_gaussian()
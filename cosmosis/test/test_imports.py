@@ -0,0 +1,62 @@
+import subprocess
+import sys
+import os
+import pytest
+from cosmosis.samplers.sampler import Sampler, builtin_samplers
+
+# Modules that are slow to import and that should only be loaded
+# once something actually needs them
+SLOW_MODULES = [
+    "cosmosis.main",
+    "cosmosis.gaussian_likelihood",
+    "cosmosis.samplers.metropolis.metropolis_sampler",
+    "cosmosis.plotting.kde",
+    "scipy.interpolate",
+    "scipy.stats",
+    "matplotlib",
+]
+
+def import_times(statement):
+    """
+    Run a python statement in a new process with -X importtime, and
+    return a dictionary of the cumulative time in seconds taken to
+    import each module it loaded.
+    """
+    root = os.path.split(os.path.split(os.path.split(os.path.abspath(__file__))[0])[0])[0]
+    env = os.environ.copy()
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                       env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) * 1e-6
+    return times
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime and lazy imports need python 3.7")
+@pytest.mark.parametrize("statement", ["import cosmosis", "import cosmosis.postprocess"])
+def test_import_time(statement):
+    times = import_times(statement)
+    module = statement.split()[-1]
+    print("{}: {:.3f} seconds".format(statement, times[module]))
+    for name in SLOW_MODULES:
+        assert name not in times, "{} imports {}".format(statement, name)
+
+
+def test_sampler_registry():
+    for name in builtin_samplers:
+        assert name in Sampler.registry
+        sampler_class = Sampler.registry[name]
+        assert sampler_class.name == name
+        assert Sampler.get_sampler(name.upper()) is sampler_class
+
+    assert "not_a_sampler" not in Sampler.registry
+    with pytest.raises(KeyError):
+        Sampler.registry["not_a_sampler"]
+
+    import cosmosis.samplers
+    assert cosmosis.samplers.GridSampler is Sampler.registry["grid"]
@@ -9,3 +9,12 @@ def execute(block, config):
     like = -(p3**2 + p4**2)/2.
     block['likelihoods', 'test3_like'] = like
     return 0
+
+def execute_batch(blocks, config):
+    config['batch_sizes'] = config.get('batch_sizes', []) + [len(blocks)]
+    p3 = np.array([block['parameters', 'p3'] for block in blocks])
+    p4 = np.array([block['parameters', 'p4'] for block in blocks])
+    like = -(p3**2 + p4**2)/2.
+    for block, l in zip(blocks, like):
+        block['likelihoods', 'test3_like'] = l
+    return [0 for block in blocks]
@@ -0,0 +1,11 @@
+import numpy as np
+
+def setup(options):
+    return {}
+
+def execute(block, config):
+    p4 = block['parameters', 'p4']
+    p5 = block['parameters', 'p5']
+    like = -(p5**2)/2. + 0.1 * p4
+    block['likelihoods', 'test5_like'] = like
+    return 0
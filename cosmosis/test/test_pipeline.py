@@ -6,8 +6,12 @@ from cosmosis.output.in_memory_output import InMemoryOutput
 from cosmosis.main import run_cosmosis, parser
 import numpy as np
 import os
+import sys
+import shutil
+import subprocess
 import tempfile
 import pstats
+import json
 import pytest
 
 root = os.path.split(os.path.abspath(__file__))[0]
@@ -246,7 +250,490 @@ def test_prior_override():
         assert p1.min() > -1.0
 
 
+def test_fast_slow_levels():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n"
+                "p5=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test3 test5",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "fast_slow"): "T",
+            ("pipeline", "first_fast_module"): "test5",
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+            ("test5", "file"): "test_module5.py",
+        }
+        ini = Inifile(None, override=params)
+        pipeline = LikelihoodPipeline(ini)
+        pipeline.setup_fast_subspaces()
+        cache = pipeline.slow_subspace_cache
+
+        # test3 introduces p4 and test5 introduces p5
+        assert [level.module_index for level in cache.levels] == [1, 2]
+
+        reference = LikelihoodPipeline(Inifile(None, override={
+            k: v for k, v in params.items() if k != ("pipeline", "fast_slow")}))
+
+        points = [
+            [0.1, 0.2, 0.3, 0.4],
+            [0.1, 0.2, 0.3, 0.5],  # only p5 changed -> restart at test5
+            [0.1, 0.2, 0.6, 0.5],  # p4 changed -> restart at test3
+            [0.7, 0.2, 0.6, 0.5],  # p1 changed -> full run
+        ]
+        for p in points:
+            like, _ = pipeline.likelihood(np.array(p))
+            expected, _ = reference.likelihood(np.array(p))
+            assert np.isclose(like, expected)
+
+        level1, level2 = cache.levels
+        assert level2.hits == 1
+        assert level1.hits == 1
+        assert level2.misses == 3
+        assert level1.misses == 2
+
+
+def test_disk_cache():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "cache_dir"): f"{dirname}/cache",
+            ("pipeline", "cache_modules"): "test1",
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        p = np.array([0.1, 0.2, 0.3])
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        like1, _ = pipeline.likelihood(p)
+        cache = pipeline.block_cache
+        assert (cache.hits, cache.misses, cache.writes) == (0, 1, 1)
+
+        # A second pipeline, as in a separate run, starts from the saved block
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        results = pipeline.run_results(p)
+        cache = pipeline.block_cache
+        assert (cache.hits, cache.misses, cache.writes) == (1, 0, 0)
+        assert np.isclose(results.like, like1)
+        assert np.isclose(results.block['data_vector', 'test_theory'], [0.1, 0.2]).all()
+
+        # test1 does not read p4, so changing it still uses the saved block
+        like2 = pipeline.likelihood(np.array([0.1, 0.2, 0.4]))[0]
+        assert (cache.hits, cache.misses, cache.writes) == (2, 0, 0)
+        assert not np.isclose(like2, like1)
+
+        # Different inputs or different module options mean a miss
+        pipeline.likelihood(np.array([0.1, 0.25, 0.3]))
+        assert (cache.hits, cache.misses, cache.writes) == (2, 1, 1)
+        params["test1", "extra_option"] = "1"
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        pipeline.likelihood(p)
+        assert pipeline.block_cache.misses == 1
+
+        # Eviction removes the oldest files
+        cache = pipeline.block_cache
+        cache.size_limit = 1
+        cache.evict()
+        assert cache.evictions == 3
+        assert not [f for f in os.listdir(f"{dirname}/cache") if f.endswith(".npz")]
+
+
+def test_disk_cache_fast_slow():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "fast_slow"): "T",
+            ("pipeline", "first_fast_module"): "test3",
+            ("pipeline", "modules"): "test1 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "cache_dir"): f"{dirname}/cache",
+            ("pipeline", "cache_modules"): "test1",
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        p = np.array([0.1, 0.2, 0.3])
+        for i in range(2):
+            # The second time round the analysis must still run every
+            # module rather than starting from the saved block
+            pipeline = LikelihoodPipeline(Inifile(None, override=params))
+            pipeline.setup_fast_subspaces()
+            assert pipeline.slow_params == [("parameters", "p1"), ("parameters", "p2")]
+            assert pipeline.fast_params == [("parameters", "p4")]
+            like, _ = pipeline.likelihood(p)
+            assert np.isclose(like, -(0.1**2 + 0.2**2 + 0.3**2 + 0.3**2)/2)
+
+
+def test_setup_threads_and_shared_setup():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test2 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "setup_threads"): "3",
+            ("test1", "file"): "test_module.py",
+            ("test2", "file"): "test_module2.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        p = np.array([0.1, 0.2, 0.3, 0.4])
+
+        # Modules can still add parameters when set up in threads
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        assert [str(q) for q in pipeline.varied_params][-1] == "new_parameters--p3"
+        like, _ = pipeline.likelihood(p)
+        params["pipeline", "setup_threads"] = "1"
+        serial_pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        assert np.isclose(serial_pipeline.likelihood(p)[0], like)
+
+        # Shared setups are saved and then loaded in later runs
+        params["pipeline", "shared_setup"] = "test3"
+        params["pipeline", "setup_cache_dir"] = f"{dirname}/setup"
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        cache = pipeline.setup_cache
+        assert (cache.hits, cache.misses, cache.writes) == (0, 1, 1)
+
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        cache = pipeline.setup_cache
+        assert (cache.hits, cache.misses, cache.writes) == (1, 0, 0)
+        assert pipeline.modules[2].data == {}
+        assert np.isclose(pipeline.likelihood(p)[0], like)
+
+        # Different options mean the setup is run again
+        params["test3", "extra_option"] = "1"
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        assert pipeline.setup_cache.misses == 1
+        assert len(os.listdir(f"{dirname}/setup")) == 2
+
+        # Parameters registered by a shared module are saved with it
+        params["pipeline", "shared_setup"] = "test2 test3"
+        LikelihoodPipeline(Inifile(None, override=params))
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        assert pipeline.setup_cache.hits == 2
+        assert [str(q) for q in pipeline.varied_params][-1] == "new_parameters--p3"
+        assert np.isclose(pipeline.likelihood(p)[0], like)
+
+        params["pipeline", "shared_setup"] = "test4"
+        with pytest.raises(ValueError):
+            LikelihoodPipeline(Inifile(None, override=params))
+
+
+def run_mpi_script(script, nproc=2):
+    # Run a python script under MPI, if we can
+    pytest.importorskip("mpi4py")
+    if shutil.which("mpirun") is None:
+        pytest.skip("mpirun is not available")
+    env = os.environ.copy()
+    env["OMPI_ALLOW_RUN_AS_ROOT"] = "1"
+    env["OMPI_ALLOW_RUN_AS_ROOT_CONFIRM"] = "1"
+    env["OMPI_MCA_rmaps_base_oversubscribe"] = "1"
+    return subprocess.run(["mpirun", "-n", str(nproc), sys.executable, "-c", script],
+                          env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=300)
+
+
+def test_shared_setup_mpi():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test2 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "shared_setup"): "test2",
+            ("test1", "file"): "test_module.py",
+            ("test2", "file"): "test_module2.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        # The processes' output can be mixed up, so each saves its own results
+        script = (
+            "import json\n"
+            "from mpi4py import MPI\n"
+            "from cosmosis.runtime import Inifile, LikelihoodPipeline\n"
+            "pipeline = LikelihoodPipeline(Inifile(None, override={!r}))\n"
+            "with open('{}/varied.%d.json' % MPI.COMM_WORLD.Get_rank(), 'w') as f:\n"
+            "    json.dump([str(p) for p in pipeline.varied_params], f)\n"
+        )
+
+        # Every process gets the parameters registered by the shared module
+        p = run_mpi_script(script.format(params, dirname))
+        assert p.returncode == 0, p.stderr
+        for rank in range(2):
+            with open(f"{dirname}/varied.{rank}.json") as f:
+                assert json.load(f) == ["parameters--p1", "parameters--p2",
+                                        "parameters--p4", "new_parameters--p3"]
+
+        # A failed shared setup stops every process instead of leaving them waiting
+        params["test2", "file"] = f"{dirname}/bad_module.py"
+        with open(f"{dirname}/bad_module.py", "w") as f:
+            f.write("def setup(options):\n    raise ValueError('bad setup')\n"
+                    "def execute(block, config):\n    return 0\n")
+        p = run_mpi_script(script.format(params, dirname))
+        assert p.returncode != 0
+        assert "bad setup" in p.stderr
+        assert "setup failed on MPI process(es) 0" in p.stderr
+
+
+def test_run_results_batch():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
 
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "extra_output"): "parameters/p3",
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        points = [
+            [0.1, 0.2, 0.3],
+            [4.0, 0.2, 0.3],  # outside the prior, so never run
+            [-1.0, 0.5, 2.0],
+        ]
+        results = pipeline.run_results_batch(np.array(points))
+
+        # test3 has an execute_batch function, so was run once on both
+        # valid points; test1 does not, so was run on each one separately
+        test3 = pipeline.modules[1]
+        assert test3.data['batch_sizes'] == [2]
+
+        assert results[1].post == -np.inf
+        assert results[1].block is None
+        for p, r in zip(points, results):
+            expected = pipeline.run_results(p)
+            assert np.isclose(r.post, expected.post)
+            assert np.isclose(r.prior, expected.prior)
+            assert np.allclose(r.extra, expected.extra, equal_nan=True)
+        assert np.isclose(results[2].block["priors", "parameters--p1"], results[2].prior / 3)
+
+
+def test_profile_file():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        profile_file = f"{dirname}/profile.json"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n"
+                "p4=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1 test3",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "profile_file"): profile_file,
+            ("pipeline", "profile_interval"): "2",
+            ("test1", "file"): "test_module.py",
+            ("test3", "file"): "test_module3.py",
+        }
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        for p in [[0.1, 0.2, 0.3], [0.2, 0.2, 0.3], [0.3, 0.2, 0.3]]:
+            pipeline.likelihood(np.array(p))
+
+        # Written after the second sample
+        with open(profile_file) as f:
+            profile = json.load(f)
+        assert profile["samples"] == 2
+
+        pipeline.cleanup()
+        with open(profile_file) as f:
+            profile = json.load(f)
+        assert profile["samples"] == 3
+        test1 = profile["modules"]["test1"]
+        assert test1["runs"] == 3
+        assert test1["failures"] == 0
+        # test1 reads two doubles and writes two doubles, a 2-element
+        # vector, and a 2x2 matrix, on each run
+        assert test1["bytes_read"] == 3 * 16
+        assert test1["bytes_written"] == 3 * (16 + 16 + 32)
+        assert sum(test1["wall_time"]["counts"]) == 3
+        assert test1["wall_time"]["percentiles"]["50"] <= test1["wall_time"]["max"]
+
+
+def test_results_cache():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1",
+            ("pipeline", "values"): values_file,
+            ("pipeline", "extra_output"): "parameters/p3",
+            ("test1", "file"): "test_module.py",
+        }
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        pipeline.enable_results_cache(size_limit=2)
+        cache = pipeline.results_cache
+
+        # Repeated points, as in an MCMC chain
+        points = [[0.1, 0.2], [0.1, 0.2], [0.1, 0.2], [0.5, 0.2], [0.1, 0.2]]
+        for p in points:
+            r = pipeline.run_results(p)
+            assert np.isclose(r.post, -(p[0]**2 + p[1]**2) / 2 + pipeline.prior(p))
+            assert np.isclose(r.extra[0], p[0] + p[1])
+        assert (cache.hits, cache.misses) == (3, 2)
+        # blocks are not kept unless asked for
+        assert r.block is None
+
+        # Changing the results we get does not change the cached ones
+        r.vector[0] = 99.0
+        r.extra[0] = 99.0
+        r = pipeline.run_results(points[0])
+        assert cache.hits == 4
+        assert r.vector[0] == 0.1
+        assert np.isclose(r.extra[0], 0.3)
+
+        # Changing the prior limits of the parameters means a re-run
+        pipeline.set_varied("parameters", "p2", -1.0, 1.0)
+        r = pipeline.run_results([0.1, 0.2])
+        assert cache.misses == 3
+        assert np.isclose(r.prior, pipeline.prior([0.1, 0.2]))
+
+        # The oldest entries are dropped
+        pipeline.run_results([0.7, 0.2])
+        pipeline.run_results([0.8, 0.2])
+        pipeline.run_results([0.1, 0.2])
+        assert cache.misses == 6
+
+
+def test_block_log_level():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1",
+            ("pipeline", "values"): values_file,
+            ("test1", "file"): "test_module.py",
+        }
+
+        # Nothing is logged by default when sampling
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        block = pipeline.run_parameters([0.1, 0.2])
+        assert block.get_log_level() == DataBlock.LOG_OFF
+        assert block.get_log_count() == 0
+
+        params["pipeline", "block_log"] = "first_use"
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        block = pipeline.run_parameters([0.1, 0.2])
+        log = [block.get_log_entry(i)[:3] for i in range(block.get_log_count())]
+        assert ("MODULE-START", "test1", "") in log
+        assert log.count(("READ-OK", "parameters", "p1")) == 1
+
+        params["pipeline", "block_log"] = "sometimes"
+        with pytest.raises(ValueError):
+            LikelihoodPipeline(Inifile(None, override=params))
+
+
+def test_block_pool():
+    with tempfile.TemporaryDirectory() as dirname:
+        values_file = f"{dirname}/values.ini"
+        with open(values_file, "w") as values:
+            values.write(
+                "[parameters]\n"
+                "p1=-3.0  0.0  3.0\n"
+                "p2=-3.0  0.0  3.0\n")
+
+        params = {
+            ('runtime', 'root'): root,
+            ("pipeline", "debug"): "F",
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1",
+            ("pipeline", "values"): values_file,
+            ("test1", "file"): "test_module.py",
+        }
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        pool = pipeline.block_pool
+
+        for p in [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]]:
+            r = pipeline.run_results(p)
+            assert np.isclose(r.like, -(p[0]**2 + p[1]**2) / 2)
+        # Each block is re-used once the results holding it are dropped
+        assert pool.made == 2
+        assert pool.reused == 1
+
+        # A block that is still in use is left alone
+        kept = pipeline.run_results([0.7, 0.8]).block
+        for i in range(5):
+            pipeline.run_results([0.1, 0.1])
+        assert kept["parameters", "p1"] == 0.7
+        assert kept["likelihoods", "test_like"] == -(0.7**2 + 0.8**2) / 2
+
+        params["pipeline", "reuse_blocks"] = "F"
+        pipeline = LikelihoodPipeline(Inifile(None, override=params))
+        assert pipeline.block_pool is None
+        assert np.isclose(pipeline.run_results([0.1, 0.2]).like, -0.025)
 
 
 if __name__ == '__main__':
@@ -3,8 +3,10 @@ from cosmosis.samplers.sampler import Sampler
 import cosmosis.samplers.minuit.minuit_sampler
 from cosmosis.runtime.pipeline import LikelihoodPipeline
 from cosmosis.output.in_memory_output import InMemoryOutput
+from cosmosis.runtime import process_pool
 from cosmosis.postprocessing import postprocessor_for_sampler
 import tempfile
+import time
 import os
 import sys
 import pytest
@@ -12,7 +14,7 @@ import numpy as np
 
 minuit_compiled = os.path.exists(cosmosis.samplers.minuit.minuit_sampler.libname)
 
-def run(name, check_prior, check_extra=True, can_postprocess=True, do_truth=False, no_extra=False, pp_extra=True, pp_2d=True, **options):
+def run(name, check_prior, check_extra=True, can_postprocess=True, do_truth=False, no_extra=False, pp_extra=True, pp_2d=True, pool=None, pp_procs=1, **options):
 
     sampler_class = Sampler.registry[name]
 
@@ -46,7 +48,10 @@ def run(name, check_prior, check_extra=True, can_postprocess=True, do_truth=Fals
     pipeline = LikelihoodPipeline(ini)
 
     output = InMemoryOutput()
-    sampler = sampler_class(ini, pipeline, output)
+    if pool is None:
+        sampler = sampler_class(ini, pipeline, output)
+    else:
+        sampler = sampler_class(ini, pipeline, output, pool)
     sampler.config()
 
 
@@ -71,7 +76,7 @@ def run(name, check_prior, check_extra=True, can_postprocess=True, do_truth=Fals
         print(pp_class)
         with tempfile.TemporaryDirectory() as dirname:
             truth_file = values.name if do_truth else None
-            pp = pp_class(output, "Chain", 0, outdir=dirname, prefix=name, truth=truth_file)
+            pp = pp_class(output, "Chain", 0, outdir=dirname, prefix=name, truth=truth_file, procs=pp_procs)
             pp_files = pp.run()
             pp.finalize()
             for p in pp_files:
@@ -102,6 +107,172 @@ def test_dynesty():
 
 def test_emcee():
     run('emcee', True, walkers=8, samples=100)
+    run('emcee', True, walkers=8, samples=100, batch=True)
+
+def test_parallel_plots():
+    output = run('emcee', True, walkers=8, samples=100, pp_procs=2)
+    # The densities from the worker processes should match the serial ones
+    with tempfile.TemporaryDirectory() as dirname:
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname, procs=2)
+        plots = pp.steps[0]
+        plots.compute_densities()
+        assert ('parameters--p1',) in plots.densities
+        assert ('parameters--p2', 'parameters--p1') in plots.densities
+        for names, density in plots.densities.items():
+            expected = plots.density_1d(*names) if len(names) == 1 else plots.density_2d(*names)
+            for d, e in zip(density, expected):
+                assert np.allclose(d, e)
+
+def test_density_cache():
+    output = run('emcee', True, walkers=8, samples=100)
+    with tempfile.TemporaryDirectory() as dirname:
+        # Nothing is cached unless asked for
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname)
+        plots = pp.steps[0]
+        plots.compute_densities()
+        assert plots.density_cache is None
+        assert not os.listdir(dirname)
+
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname, density_cache=True)
+        plots = pp.steps[0]
+        plots.run()
+        assert os.path.exists(plots.density_cache.filename)
+
+        # A second run on the same chain should not need to recompute anything
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname, density_cache=True)
+        plots = pp.steps[0]
+        plots.compute_densities()
+        assert plots.density_cache.misses == 0
+        assert ('parameters--p2', 'parameters--p1') in plots.densities
+        for names, density in plots.densities.items():
+            expected = plots.density_1d(*names) if len(names) == 1 else plots.density_2d(*names)
+            for d, e in zip(density, expected):
+                assert np.allclose(d, e)
+
+        # but different smoothing, or a different chain, should
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname, factor_kde=1.0,
+                                                density_cache=True)
+        plots = pp.steps[0]
+        plots.compute_densities()
+        assert plots.density_cache.hits == 0
+
+        pp = postprocessor_for_sampler('emcee')(output, "Chain", 0, outdir=dirname, burn=10,
+                                                density_cache=True)
+        plots = pp.steps[0]
+        plots.compute_densities()
+        assert plots.density_cache.hits == 0
+
+def make_importance_input(filename, nrow=50):
+    # An input chain with repeated points, like an MCMC
+    p = np.random.uniform(-3, 3, size=(nrow, 2))
+    p = np.repeat(p, np.random.randint(1, 4, size=nrow), axis=0)
+    prior = np.repeat(-3.58351893845611, len(p))
+    post = np.random.normal(size=len(p))
+    np.savetxt(filename, np.column_stack([p, prior, post]),
+               header="parameters--p1 parameters--p2 prior post")
+    return p
+
+def test_importance():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "input.txt")
+        p = make_importance_input(filename)
+        output = run('importance', True, input=filename, nstep=7, chunk_rows=10)
+        assert np.allclose(output['parameters--p1'], p[:, 0])
+        expected = -(p**2).sum(1) / 2 - 3.58351893845611
+        assert np.allclose(output['post'], expected)
+        assert np.allclose(output['log_weight'], output['post'] - output['old_post'])
+
+def run_interrupted(name, dirname, nexecute, partial_row=False, **options):
+    # Run a sampler with text output but stop after a few steps, as
+    # though the job was killed, and then resume it and finish.
+    # If partial_row is set the job is killed part way through a row.
+    from cosmosis.output.text_output import TextColumnOutput
+    values = os.path.join(dirname, "values.ini")
+    with open(values, "w") as f:
+        f.write("[parameters]\np1=-3.0  0.0  3.0\np2=-3.0  0.0  3.0\n")
+    override = {
+        ('runtime', 'root'): os.path.split(os.path.abspath(__file__))[0],
+        ("pipeline", "quiet"): "T",
+        ("pipeline", "modules"): "test1",
+        ("pipeline", "values"): values,
+        ("test1", "file"): "test_module.py",
+    }
+    for k,v in options.items():
+        override[(name,k)] = str(v)
+    ini = Inifile(None, override=override)
+    pipeline = LikelihoodPipeline(ini)
+    output_file = os.path.join(dirname, "output.txt")
+
+    output = TextColumnOutput(output_file)
+    sampler = Sampler.registry[name](ini, pipeline, output)
+    sampler.config()
+    for i in range(nexecute):
+        sampler.execute()
+    output.close()
+    if partial_row:
+        with open(output_file, "a") as f:
+            f.write("0.5\t0.2")
+
+    output = TextColumnOutput(output_file, resume=True)
+    sampler = Sampler.registry[name](ini, pipeline, output)
+    sampler.config()
+    sampler.resume()
+    while not sampler.is_converged():
+        sampler.execute()
+    output.close()
+    return np.loadtxt(output_file)
+
+def test_importance_resume():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "input.txt")
+        p = make_importance_input(filename)
+        data = run_interrupted('importance', dirname, 3, partial_row=True, input=filename, nstep=7)
+        assert len(data) == len(p)
+        assert np.allclose(data[:, :2], p)
+        assert np.allclose(data[:, -1], -(p**2).sum(1) / 2 - 3.58351893845611)
+
+def test_metropolis_resume():
+    with tempfile.TemporaryDirectory() as dirname:
+        data = run_interrupted('metropolis', dirname, 3, samples=500, nsteps=50,
+                               tuning_frequency=50, tuning_grace=50, tuning_end=100)
+        # Only the samples after tuning is over are saved
+        assert len(data) == 400
+        assert np.all(np.isfinite(data[:, -1]))
+
+def test_list():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "input.txt")
+        p = make_importance_input(filename)
+        output = run('list', True, can_postprocess=False, filename=filename, nstep=7, chunk_rows=10, burn=3, thin=2,
+                     cache_results=True)
+        assert np.allclose(output['parameters--p1'], p[3::2, 0])
+        assert np.allclose(output['parameters--p2'], p[3::2, 1])
+        assert np.allclose(output['post'], -(p[3::2]**2).sum(1) / 2 - 3.58351893845611)
+
+def test_list_resume():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "input.txt")
+        p = make_importance_input(filename)
+        data = run_interrupted('list', dirname, 2, partial_row=True, filename=filename, nstep=5, thin=3)
+        assert len(data) == len(p[::3])
+        assert np.allclose(data[:, :2], p[::3])
+        assert np.allclose(data[:, -1], -(p[::3]**2).sum(1) / 2 - 3.58351893845611)
+
+        # Output that can't be read back gives a clear error
+        ini = Inifile(None, override={
+            ('runtime', 'root'): os.path.split(os.path.abspath(__file__))[0],
+            ("pipeline", "quiet"): "T",
+            ("pipeline", "modules"): "test1",
+            ("pipeline", "values"): os.path.join(dirname, "values.ini"),
+            ("test1", "file"): "test_module.py",
+            ("list", "filename"): filename,
+        })
+        output = InMemoryOutput()
+        output.resumed = True
+        sampler = Sampler.registry['list'](ini, LikelihoodPipeline(ini), output)
+        sampler.config()
+        with pytest.raises(ValueError, match="cannot resume"):
+            sampler.resume()
 
 def test_truth():
     run('emcee', True, walkers=8, samples=100, do_truth=True)
@@ -112,6 +283,26 @@ def test_fisher():
 def test_grid():
     run('grid', True, pp_extra=False, nsample_dimension=10)
 
+def test_adaptive_grid():
+    output = run('grid', True, pp_extra=False, nsample_dimension=5,
+                 adaptive=True, refine_levels=2, refine_threshold=3.0)
+    level = np.array(output['grid_level'])
+    assert level.max() == 2
+    # Fewer points than the full grid at the finest level
+    assert len(level) < (5 * 9)**2
+
+    # The marginal posterior should match the unit Gaussian in the test module
+    from cosmosis.postprocessing.utils import AdaptiveGrid
+    p1 = np.array(output['parameters--p1'])
+    p2 = np.array(output['parameters--p2'])
+    grid = AdaptiveGrid([p1, p2], np.array(output['post']), level)
+    (x,), like = grid.marginal([0])
+    like /= like.sum()
+    assert np.isclose((x * like).sum(), 0.0, atol=1e-6)
+    assert np.isclose((x**2 * like).sum(), 1.0, atol=0.05)
+    # No mass is lost or double-counted when marginalising
+    assert np.isclose(grid.marginal([0, 1])[1].sum(), grid.weights().sum())
+
 def test_gridmax():
     run('gridmax', True, can_postprocess=False, max_iterations=1000)
 
@@ -124,6 +315,39 @@ def test_maxlike():
 def test_metropolis():
     run('metropolis', True, samples=20)
     run('metropolis', True, samples=20, covmat_sample_start=True)
+    run('metropolis', True, samples=300, nsteps=50, tuning_frequency=50, tuning_grace=100, tuning_end=200)
+
+def gaussian_posterior(p):
+    from cosmosis.runtime.pipeline import PipelineResults
+    r = PipelineResults(p, 0)
+    r.prior = 0.0
+    r.set_like(-0.5 * (p[0]**2 + (p[1] / 2)**2))
+    return r
+
+def test_metropolis_tuning():
+    import pickle
+    from cosmosis.samplers.metropolis.metropolis import MCMC
+
+    mcmc = MCMC(np.zeros(2), gaussian_posterior, np.diag([0.1, 0.1]), quiet=True,
+                tuning_frequency=100, tuning_grace=100, tuning_end=1000)
+    chain = [s.vector for s in mcmc.sample(500)]
+    size = len(pickle.dumps(mcmc))
+    chain += [s.vector for s in mcmc.sample(500)]
+
+    # The running statistics match the full chain, and the
+    # saved sampler does not grow with it
+    mcmc.update_covariance_estimate()
+    assert np.allclose(mcmc.mean_estimate, np.mean(chain, axis=0))
+    assert np.allclose(mcmc.covariance_estimate, np.cov(np.transpose(chain)))
+    assert len(pickle.dumps(mcmc)) == size
+
+    # Samplers saved by older versions kept the chain itself
+    state = mcmc.__dict__.copy()
+    del state["chain_statistics"]
+    state["chain"] = chain
+    old = MCMC.__new__(MCMC)
+    old.__setstate__(state)
+    assert np.allclose(old.chain_statistics.covariance(), mcmc.covariance_estimate)
 
 @pytest.mark.skipif(not minuit_compiled,reason="requires Minuit2")
 def test_minuit():
@@ -138,12 +362,14 @@ def test_pmaxlike():
 def test_pmc():
     old_settings = np.seterr(invalid='ignore', divide='ignore')
     run('pmc', True, iterations=10)
+    run('pmc', True, iterations=10, batch=True)
     np.seterr(**old_settings)  
 
 def test_zeus():
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50)
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, verbose=True)
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, tune=False)
+    run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, batch=True)
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, tolerance=0.1)
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, patience=5000)
     run('zeus', True, maxiter=100_000, walkers=10, samples=100, nsteps=50, moves="differential:2.0  global")
@@ -158,6 +384,7 @@ def test_snake():
 
 def test_nautilus():
     run('nautilus', True)
+    run('nautilus', True, batch=True)
     run('nautilus', True, n_live=500, enlarge_per_dim=1.05,
         split_threshold=95., n_networks=3, n_batch=50, verbose=True, f_live=0.02, n_shell=100)
 
@@ -165,6 +392,36 @@ def test_nautilus():
 def test_star():
         run('star', False, pp_extra=False, pp_2d=False)
 
+def worker_pid(i):
+    return os.getpid()
+
+def slow_square(x):
+    time.sleep(x)
+    return x**2
+
+def test_smp_pool():
+    with process_pool.Pool(2) as pool:
+        # The same worker processes are used for every map
+        pids = set(pool.map(worker_pid, range(20), chunksize=1))
+        pids.update(pool.map(worker_pid, range(20), chunksize=1))
+        assert len(pids) <= 2
+        assert os.getpid() not in pids
+        assert pool.bcast(3) == 3
+        assert pool.gather(3) == [3]
+
+        # Results from submit come back in the order they finish
+        futures = [pool.submit(slow_square, x) for x in [0.3, 0.0, 0.1]]
+        completed = list(pool.as_completed(futures))
+        assert set(completed) == set(futures)
+        assert completed[-1] is futures[0]
+        for f in futures:
+            assert f.result() == f.task**2
+
+        # Workers are restarted for a new function, so that they
+        # see the sampler's set-up
+        run('star', False, pp_extra=False, pp_2d=False, pool=pool)
+        run('apriori', True, can_postprocess=False, nsample=20, pool=pool)
+
 def test_test():
     run('test', False, can_postprocess=False)
 
@@ -0,0 +1,108 @@
+from cosmosis.postprocessing import streaming
+from cosmosis.output.text_output import TextColumnOutput
+from cosmosis.output.binary_output import BinaryOutput
+import tempfile
+import os
+import numpy as np
+
+
+def write_chains(output_class, filename, chains, sampler, colnames):
+    for rank, chain in enumerate(chains):
+        out = output_class(filename, rank=rank, nchain=len(chains), lock=False)
+        out.metadata("sampler", sampler)
+        out.metadata("n_varied", 2)
+        for name in colnames:
+            out.add_column(name, float)
+        out.parameters_batch(chain)
+        out.close()
+
+
+def test_accumulators_merge():
+    rng = np.random.default_rng(1)
+    colnames = ["a", "b", "post"]
+    x = rng.normal(size=(1000, 3)) * [1.0, 10.0, 0.01]
+    w = rng.uniform(size=1000)
+    # One chunk with a much wider range, to exercise the re-binning
+    chunks = np.array_split(np.arange(1000), 3)
+    x[chunks[2]] *= 100
+
+    whole = streaming.ChainSummary(colnames, nbin=1000)
+    whole.add(x, w)
+    parts = []
+    for index in chunks:
+        part = streaming.ChainSummary(colnames, nbin=1000)
+        part.add(x[index], w[index])
+        part.add(x[:0])
+        parts.append(part)
+    merged = parts[0]
+    merged.merge(parts[1])
+    merged.merge(parts[2])
+
+    assert np.allclose(merged.moments.mean, np.average(x, axis=0, weights=w))
+    assert np.allclose(merged.moments.covariance(), np.cov(x.T, aweights=w))
+    assert np.allclose(merged.moments.covariance(), whole.moments.covariance())
+    for i in range(3):
+        q = merged.quantiles[i]
+        assert len(q.counts) <= 1000
+        assert abs(q.percentile(50.) - whole.quantiles[i].percentile(50.)) <= 2 * q.width
+        assert abs(q.percentile(50.) - np.median(x[:, i])) < 0.05 * x[:, i].std()
+    assert (merged.best.row == x[x[:, 2].argmax()]).all()
+
+
+def test_stream_chains():
+    rng = np.random.default_rng(2)
+    colnames = ["p1", "p2", "post"]
+    chains = [rng.normal(size=(1234, 3)) + [i * 0.1, 0, 0] for i in range(3)]
+    with tempfile.TemporaryDirectory() as dirname:
+        for output_class in [TextColumnOutput, BinaryOutput]:
+            base = os.path.join(dirname, "chain")
+            write_chains(output_class, base, chains, "metropolis", colnames)
+            filenames = sorted(f for f in os.listdir(dirname) if f.endswith(output_class.FILE_EXTENSION))
+            assert len(filenames) == 3
+            filenames = [os.path.join(dirname, f) for f in filenames]
+            if output_class is TextColumnOutput:
+                # A cut-off line at the end should be skipped
+                with open(filenames[-1], "a") as f:
+                    f.write("0.1\t0.")
+
+            summary = streaming.summarise_chains(filenames, "metropolis", burn=0.1,
+                                                 chunk_rows=100, procs=2)
+            reduced = [chain[123:] for chain in chains]
+            x = np.concatenate(reduced)
+            assert summary.moments.count == len(x)
+            assert np.allclose(summary.moments.mean, x.mean(axis=0))
+            assert np.allclose(summary.moments.covariance(), np.cov(x.T))
+            assert np.allclose(summary.gelman_rubin(),
+                               [np.sqrt((np.mean([c[:, i].var() for c in reduced])
+                                         + (4./3) * np.var([c[:, i].mean() for c in reduced], ddof=1))
+                                        / np.mean([c[:, i].var() for c in reduced])) - 1
+                                for i in range(3)])
+
+            outdir = os.path.join(dirname, "out")
+            os.mkdir(outdir)
+            files = streaming.StreamingStatistics(summary, "chain", outdir).run()
+            assert os.path.join(outdir, "gelman.txt") in files
+            means = np.loadtxt(os.path.join(outdir, "means.txt"), usecols=[1, 2])
+            assert np.allclose(means[:, 0], x.mean(axis=0))
+            proposal = np.loadtxt(os.path.join(outdir, "proposal.txt"))
+            assert proposal.shape == (2, 2)
+            for f in os.listdir(dirname):
+                if os.path.isfile(os.path.join(dirname, f)):
+                    os.remove(os.path.join(dirname, f))
+            for f in os.listdir(outdir):
+                os.remove(os.path.join(outdir, f))
+            os.rmdir(outdir)
+
+def test_chain_files_for_input():
+    with tempfile.TemporaryDirectory() as dirname:
+        base = os.path.join(dirname, "chain")
+        for rank in range(11):
+            out = TextColumnOutput(base, rank=rank, nchain=11)
+            out.add_column("x", float)
+            out.add_column("post", float)
+            out.metadata("sampler", "emcee")
+            out.parameters([float(rank), 0.0])
+            out.close()
+        sampler, filenames = streaming.chain_files_for_input(base + ".txt")
+        assert sampler == "emcee"
+        assert filenames == [base + "_{}.txt".format(i + 1) for i in range(11)]
@@ -1,9 +1,12 @@
 from cosmosis.output.text_output import TextColumnOutput
 from cosmosis.output.cosmomc_output import CosmoMCOutput
+from cosmosis.output.binary_output import BinaryOutput
+from cosmosis.output.utils import chain_files
 import tempfile
 import string
 import numpy as np
 import os
+import pytest
 try:
     import astropy.table
 except:
@@ -55,6 +58,119 @@ def test_text():
         assert meta[0]['NP']==nparam
         assert final[0]['FINISH'] is True
 
+def test_text_multiple_chains():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename=os.path.join(dirname, 'cosmosis_temp_output_test')
+        nparam = 4
+        ns = 10
+        for rank in range(2):
+            ini = {'filename':filename, 'format':'text', 'rank':rank, 'parallel':2}
+            out = TextColumnOutput.from_options(ini)
+            out.comment("Chain {}".format(rank))
+            populate_table(out, nparam, ns)
+
+        # Resume the first chain, so that it has final metadata part way through
+        out = TextColumnOutput.from_options(dict(ini, rank=0), resume=True)
+        for i in range(nparam):
+            out.add_column(string.ascii_uppercase[i], float)
+        out.parameters(np.arange(nparam) + 0.5)
+        out.final("FINISH", False)
+        out.close()
+
+        # and cut off the last line of the second as if it had been killed
+        with open(filename + "_2.txt", "a") as f:
+            f.write("1.0\t2.")
+
+        names, data, meta, comments, final = TextColumnOutput.load_from_options({"filename":filename})
+        assert names == [string.ascii_uppercase[i] for i in range(nparam)]
+        assert data[0].shape == (ns + 1, nparam)
+        assert (data[0][-1] == np.arange(nparam) + 0.5).all()
+        assert data[1].shape == (ns, nparam)
+        assert (data[1][:, 0] == np.arange(ns)).all()
+        assert meta[1]['NS'] == ns
+        assert comments[1] == [" Chain 1"]
+        assert final[0]['FINISH'] is False
+        assert final[1]['FINISH'] is True
+
+        # Any other wrong-length line is an error
+        with open(filename + "_2.txt", "a") as f:
+            f.write("\n1.0\t2.0\t3.0\t4.0\n")
+        with pytest.raises(ValueError):
+            TextColumnOutput.load_from_options({"filename":filename})
+
+def test_binary():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename=os.path.join(dirname, 'cosmosis_temp_output_test.npy')
+        ini = {'filename':filename, 'format':'binary', 'chunk_size':'7'}
+        out = BinaryOutput.from_options(ini)
+        nparam = 8
+        ns = 20
+        out.comment("A comment")
+        populate_table(out, nparam, ns)
+
+        # The data file is a normal npy file
+        t = np.load(filename)
+        assert t.shape == (ns, nparam)
+        assert (t[:, 0] == np.arange(ns)).all()
+
+        names, data, meta, comments, final = BinaryOutput.load_from_options({"filename":filename})
+        assert names == [string.ascii_uppercase[i] for i in range(nparam)]
+        assert isinstance(data[0], np.memmap)
+        assert (data[0] == t).all()
+        assert meta[0]['NP']==nparam
+        assert comments[0] == ["A comment"]
+        assert final[0]['FINISH'] is True
+
+        # Simulate a run that was killed part way through writing a row
+        with open(filename, "ab") as f:
+            f.write(b"\0" * 12)
+        out = BinaryOutput.from_options(ini, resume=True)
+        assert out.resumed
+        for i in range(nparam):
+            out.add_column(string.ascii_uppercase[i], float)
+        out.parameters(np.arange(nparam) + 0.5)
+        out.close()
+        names, data, meta, comments, final = BinaryOutput.load_from_options({"filename":filename})
+        assert data[0].shape == (ns + 1, nparam)
+        assert (data[0][-1] == np.arange(nparam) + 0.5).all()
+        assert meta[0]['TIME'] == '1:30pm'
+
+def test_parameters_batch():
+    nparam = 4
+    ns = 20
+    samples = np.arange(ns * nparam).reshape((ns, nparam)) + 0.25
+    with tempfile.TemporaryDirectory() as dirname:
+        for output_class in [TextColumnOutput, BinaryOutput]:
+            filename=os.path.join(dirname, 'cosmosis_temp_output_test' + output_class.FILE_EXTENSION)
+            out = output_class.from_options({'filename':filename})
+            out.flush_interval = 1e-9
+            for i in range(nparam + 1):
+                out.add_column(string.ascii_uppercase[i], float)
+            # A single row first, to check the order is kept
+            out.parameters(samples[0], -1.0)
+            out.parameters_batch(samples[1:, :2], samples[1:, 2:], -np.ones(ns - 1))
+            # The batch should have been flushed already
+            names, data, _, _, _ = output_class.load_from_options({"filename":filename})
+            assert data[0].shape == (ns, nparam + 1)
+            assert (data[0][:, :nparam] == samples).all()
+            assert (data[0][:, nparam] == -1).all()
+            out.close()
+
+            with pytest.raises(ValueError):
+                output_class.from_options({'filename':filename}).parameters_batch(samples)
+
+def test_parameters_batch_types():
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'cosmosis_temp_output_test.txt')
+        out = TextColumnOutput.from_options({'filename':filename})
+        out.add_column("x", float)
+        out.add_column("level", int)
+        out.add_column("post", float)
+        out.parameters_batch(np.array([0.5, 1.5]), np.array([2.0, 3.0]), np.array([-1, -2]))
+        out.close()
+        rows = [line.split() for line in open(filename) if not line.startswith('#')]
+        assert rows == [['0.5', '2', '-1.0'], ['1.5', '3', '-2.0']]
+
 def test_cosmomc_output():
     with tempfile.TemporaryDirectory() as dirname:
         filename=os.path.join(dirname, 'cosmosis_temp_cosmomc_output_test.txt')
@@ -87,3 +203,27 @@ def test_cosmomc_output():
         assert data.shape == (ns, nparam + 2)
         assert (data[:-1, 0] == 1).all()
         assert data[-1, 0] == 2
+
+def test_chain_files_order():
+    with tempfile.TemporaryDirectory() as dirname:
+        base = os.path.join(dirname, "chain")
+        for rank in range(12):
+            out = TextColumnOutput(base, rank=rank, nchain=12)
+            out.add_column("x", float)
+            out.add_column("post", float)
+            out.parameters([float(rank), 0.0])
+            out.close()
+        expected = [base + "_{}.txt".format(i + 1) for i in range(12)]
+        assert chain_files(base, ".txt") == expected
+
+        names, data, _, _, _ = TextColumnOutput.load_from_options({"filename": base})
+        assert [d[0, 0] for d in data] == list(range(12))
+
+        for rank in range(12):
+            out = BinaryOutput(base, rank=rank, nchain=12)
+            out.add_column("x", float)
+            out.add_column("post", float)
+            out.parameters([float(rank), 0.0])
+            out.close()
+        names, data, _, _, _ = BinaryOutput.load_from_options({"filename": base})
+        assert [d[0, 0] for d in data] == list(range(12))
@@ -0,0 +1,44 @@
+"""
+Time the per-value overhead of reading and writing scalars in a DataBlock
+from Python, comparing one call per value with the batched get_many and
+put_many methods, with the block's access log at a chosen level.
+
+Usage: python -m cosmosis.tools.benchmark_block_access [nparam] [repeats] [off|first_use|full]
+"""
+import sys
+import timeit
+from cosmosis.datablock import DataBlock
+
+
+LOG_LEVELS = {"off": DataBlock.LOG_OFF, "first_use": DataBlock.LOG_FIRST_USE, "full": DataBlock.LOG_FULL}
+
+
+def benchmark(nparam=30, repeats=2000, log_level="full"):
+    block = DataBlock()
+    block.set_log_level(LOG_LEVELS[log_level])
+    keys = [("nuisance_parameters", "p{}".format(i)) for i in range(nparam)]
+    values = [0.1 * i for i in range(nparam)]
+    for key, value in zip(keys, values):
+        block[key] = value
+    encoded = DataBlock.encode_keys(keys)
+
+    tests = [
+        ("block[section, name]", lambda: [block[key] for key in keys]),
+        ("get_double", lambda: [block.get_double(s, n) for (s, n) in keys]),
+        ("get_many", lambda: block.get_many(keys)),
+        ("get_many, encoded keys", lambda: block.get_many(encoded)),
+        ("block[section, name] = x", lambda: [block.__setitem__(key, value) for key, value in zip(keys, values)]),
+        ("replace_double", lambda: [block.replace_double(s, n, value) for (s, n), value in zip(keys, values)]),
+        ("put_many", lambda: block.put_many(keys, values)),
+        ("put_many, encoded keys", lambda: block.put_many(encoded, values)),
+    ]
+
+    print("Time per value, reading/writing {} scalars {} times, {} logging:".format(nparam, repeats, log_level))
+    for name, f in tests:
+        t = min(timeit.repeat(f, number=repeats, repeat=3))
+        print("    {:<28} {:8.3f} us".format(name, 1e6 * t / repeats / nparam))
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:3]] + sys.argv[3:4]
+    benchmark(*args)
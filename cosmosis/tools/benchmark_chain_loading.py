@@ -0,0 +1,72 @@
+"""
+Time loading text chain files, comparing the bulk loader used by
+TextColumnOutput with the simple line-by-line parser it replaced.
+
+The chain is split over several files, as with parallel samplers, which
+the bulk loader reads in separate threads.  Use a large number of rows
+to see how the two behave on multi-GB chains.
+
+Usage: python -m cosmosis.tools.benchmark_chain_loading [nrow] [ncol] [nfile]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from cosmosis.output.text_output import TextColumnOutput
+
+
+def load_line_by_line(filenames):
+    # The original loader, which parses each line in python
+    data = []
+    for filename in filenames:
+        chain = []
+        for line in open(filename):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            chain.append([float(word) for word in line.split()])
+        data.append(np.array(chain))
+    return data
+
+
+def write_chain(filename, nrow, ncol):
+    with open(filename, "w") as f:
+        f.write("#" + "\t".join("p{}".format(i) for i in range(ncol)) + "\n")
+        f.write("#sampler=emcee\n")
+        # Write in pieces so that huge chains don't need huge memory here
+        for start in range(0, nrow, 100000):
+            n = min(100000, nrow - start)
+            np.savetxt(f, np.random.normal(size=(n, ncol)), delimiter="\t")
+        f.write("#n_eval=1\n")
+
+
+def benchmark(nrow=1000000, ncol=20, nfile=4):
+    with tempfile.TemporaryDirectory() as dirname:
+        base = os.path.join(dirname, "chain")
+        filenames = ["{}_{}.txt".format(base, i + 1) for i in range(nfile)]
+        for filename in filenames:
+            write_chain(filename, nrow // nfile, ncol)
+        size = sum(os.path.getsize(filename) for filename in filenames)
+        print("Loading {} rows x {} columns in {} files ({:.2f} GB):".format(
+            nrow, ncol, nfile, size / 1e9))
+
+        t0 = time.perf_counter()
+        data = TextColumnOutput.load_from_options({"filename": base})[1]
+        t_bulk = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        expected = load_line_by_line(filenames)
+        t_line = time.perf_counter() - t0
+
+        for d, e in zip(data, expected):
+            assert np.array_equal(d, e)
+
+        for name, t in [("line by line", t_line), ("bulk", t_bulk)]:
+            print("    {:<14} {:8.2f} s  {:8.1f} MB/s".format(name, t, size / t / 1e6))
+        print("    speed-up       {:8.1f}x".format(t_line / t_bulk))
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:4]]
+    benchmark(*args)